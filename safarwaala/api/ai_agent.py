@@ -1,7 +1,19 @@
 import frappe
+import hashlib
 import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import httpx
 import openai # OpenRouter uses the standard OpenAI library
-from frappe.utils import getdate, nowdate, add_days
+from frappe.utils import cint, getdate, nowdate, add_days, add_to_date, now_datetime
+from safarwaala.api.conversation import append_messages, build_history, get_conversation, new_session_id, record_turn
+from safarwaala.api.intent import detect_intent
+from safarwaala.api.map_cache import get_stats, incr_stat, normalize_query, reset_stats
+from safarwaala.api.ola_client import get_latency_histogram, record_latency, reset_latency_histogram
+from safarwaala.api.pricing import get_quotes
+from safarwaala.api.rate_card import filter_car_modals, get_rate_card_version, search_car_modals
+from safarwaala.utils import run_in_site_context
 
 # --- 1. Helper Functions ---
 def get_customer_details(customer_id):
@@ -17,52 +29,32 @@ def get_customer_details(customer_id):
 
 def find_best_match_car(user_query, passengers=1):
     """
-    Tries to find a suitable Car Modal based on user's text query.
+    Best Car Modal for a car name or category typed by the user (typos like "inova" or
+    "desire" are fine), seating at least `passengers`. Cheapest wins between equal matches.
     """
     try:
         pax = int(passengers) if passengers else 1
-        q = user_query.lower().strip() if user_query else ""
-
-        # A. Category Search (Generic)
-        if q in ["sedan", "small car", "cab", "taxi"]:
-            return frappe.db.get_value("Car Modals", 
-                {"category": "Sedan", "seating_capacity": [">=", pax]}, "name", order_by="per_km_rate asc")
-        
-        if q in ["suv", "muv", "big car", "large car", "ertiga", "innova"]:
-            # Prefer Innova for SUV generally if available
-            return frappe.db.get_value("Car Modals", 
-                {"category": ["in", ["SUV", "MUV"]], "seating_capacity": [">=", pax]}, "name", order_by="per_km_rate asc")
-
-        # B. Fuzzy/Like Search on Name
-        car = frappe.db.get_value("Car Modals", 
-            {"name": ["like", f"%{user_query}%"], "seating_capacity": [">=", pax]}, 
-            "name"
-        )
-        if car: return car
-        
-        return None
+        cars = search_car_modals(user_query, min_seats=pax)
+        return cars[0].name if cars else None
     except:
         return None
 
 # --- 2. Tool Logic (Actual Python Functions) ---
 
+# get_available_cars lists cars scoring within this much of the best match for its category
+CAR_MATCH_WITHIN = 0.15
+
 def get_available_cars(passengers=1, category=None):
     """Fetches available car models based on passengers and optional category."""
     try:
         pax = int(passengers) if passengers else 1
-        filters = {"seating_capacity": [">=", pax]}
-        
-        if category:
-            if category.lower() in ["sedan", "suv", "hatchback", "luxury"]:
-                 filters["category"] = category.capitalize()
-            elif category.lower() in ["innova", "ertiga"]:
-                 filters["modal_name"] = ["like", f"%{category}%"]
-
-        cars = frappe.get_all("Car Modals", 
-            fields=["name", "modal_name", "category", "seating_capacity", "per_km_rate", "fuel_type", "transmission"],
-            filters=filters,
-            order_by="per_km_rate asc"
-        )
+        # A category or car name; near-best matches only, so "innova" lists Innovas rather than every SUV
+        cards = search_car_modals(category, min_seats=pax, within=CAR_MATCH_WITHIN) if category else None
+        if not cards:
+            cards = filter_car_modals(min_seats=pax)
+
+        fields = ["name", "modal_name", "category", "seating_capacity", "per_km_rate", "fuel_type", "transmission"]
+        cars = [{f: card.get(f) for f in fields} for card in cards]
         
         return json.dumps({
             "success": True, 
@@ -73,58 +65,65 @@ def get_available_cars(passengers=1, category=None):
         return json.dumps({"success": False, "error": str(e)})
 
 def estimate_trip_cost(days, passengers=1, from_city=None, to_city=None):
-    """Calculates approximate Round Trip cost for Sedan and SUV."""
+    """Calculates approximate Round Trip cost for Sedan and SUV from the pricing engine."""
     try:
         days = int(days) if days else 1
-        min_km_day = 300 
-        total_min_km = min_km_day * days
-        
-        # 1. Sedan Estimates
-        sedan_rate = 11 # Fallback
-        sedan = frappe.db.get_value("Car Modals", {"category": "Sedan"}, ["per_km_rate", "min_km_day"], as_dict=True)
+        pickup = now_datetime()
+        quotes = get_quotes(
+            "Outstation",
+            pickup_datetime=pickup,
+            return_datetime=add_to_date(pickup, days=days),
+        )["quotes"]
+
+        def cheapest(categories=None, name_contains=None):
+            for quote in quotes:
+                if categories and (quote["category"] or "").lower() in categories:
+                    return quote
+                if name_contains and name_contains in (quote["modal_name"] or quote["car_modal"]).lower():
+                    return quote
+            return None
+
+        # Quotes are cheapest first
+        sedan = cheapest(categories={"sedan"})
+        suv = cheapest(categories={"suv", "muv"}) or cheapest(name_contains="innova")
+        if not sedan and not suv:
+            return json.dumps({"success": False, "error": "No car rates are configured yet."})
+
+        total_min_km = (sedan or suv)["min_km"]
+        trip_type_lbl = "Round Trip"
+
+        def estimate(quote, description):
+            if not quote:
+                return None
+            return {
+                "car_modal": quote["car_modal"],
+                "rate": quote["per_km_rate"],
+                "min_km": quote["min_km"],
+                "night_charges": quote["night_charges"],
+                "estimated_total": quote["fare"],
+                "description": description,
+            }
+
+        lines = [
+            f"**🏷️ Estimated {trip_type_lbl} Cost for {days} Days**\n"
+            f"_(Min {total_min_km:g} km chargeable)_\n"
+        ]
         if sedan:
-            sedan_rate = sedan.per_km_rate
-            if sedan.min_km_day: min_km_day = sedan.min_km_day
-            total_min_km = min_km_day * days
-            
-        sedan_cost = total_min_km * sedan_rate
-        
-        # 2. SUV Estimates
-        suv_rate = 16 # Fallback
-        suv = frappe.db.get_value("Car Modals", {"category": ["in", ["SUV", "MUV"]]}, ["per_km_rate"], as_dict=True)
-        if not suv:
-             suv = frappe.db.get_value("Car Modals", {"naming_series": ["like", "%Innova%"]}, ["per_km_rate"], as_dict=True)
+            lines.append(f"🚗 **Sedan**: ~₹{sedan['fare']:,.0f} *(max 4 Pax)*")
         if suv:
-            suv_rate = suv.per_km_rate
-            
-        suv_cost = total_min_km * suv_rate
-        
-        trip_type_lbl = "Round Trip"
-        
+            lines.append(f"🚙 **SUV**: ~₹{suv['fare']:,.0f} *(max 7 Pax)*")
+        lines.append("\nℹ️ *Includes driver night allowance; excludes tolls & parking. Final price on actuals.*")
+
         response = {
             "success": True,
             "details": {
                 "days": days,
                 "type": trip_type_lbl,
                 "min_km_considered": total_min_km,
-                "sedan": {
-                    "rate": sedan_rate,
-                    "estimated_total": sedan_cost,
-                    "description": "Ideal for 1-4 Pax"
-                },
-                "suv": {
-                    "rate": suv_rate,
-                    "estimated_total": suv_cost,
-                    "description": "Ideal for 5-7 Pax"
-                }
+                "sedan": estimate(sedan, "Ideal for 1-4 Pax"),
+                "suv": estimate(suv, "Ideal for 5-7 Pax"),
             },
-            "message": (
-                f"**🏷️ Estimated {trip_type_lbl} Cost for {days} Days**\n"
-                f"_(Min {total_min_km} km chargeable)_\n\n"
-                f"🚗 **Sedan**: ~₹{sedan_cost:,} *(max 4 Pax)*\n"
-                f"🚙 **SUV**: ~₹{suv_cost:,} *(max 7 Pax)*\n\n"
-                f"ℹ️ *Excludes tolls, parking & driver allowance. Final price on actuals.*"
-            )
+            "message": "\n".join(lines),
         }
         
         return json.dumps(response)
@@ -315,142 +314,460 @@ TOOLS_SCHEMA = [
     }
 ]
 
-# --- 4. Main API Endpoint ---
+# --- 4. LLM Client ---
 
-@frappe.whitelist(allow_guest=True)
-def chat_agent(message, history=None, customer_id=None):
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+# MODEL_NAME = "google/gemini-2.0-flash-001"
+# MODEL_NAME = "arcee-ai/trinity-large-preview:free"
+# MODEL_NAME = "openrouter/pony-alpha"
+MODEL_NAME = "stepfun/step-3.5-flash:free"
+
+LLM_TIMEOUT_SEC = 60
+LLM_MAX_RETRIES = 1
+LLM_MAX_CONNECTIONS = 32
+LLM_MAX_KEEPALIVE = 8
+
+# Realtime event carrying streamed tokens; clients subscribe to the stream_id task room
+STREAM_EVENT = "safarbot_stream"
+# Tokens are batched into one realtime message at most this often
+STREAM_FLUSH_SEC = 0.05
+
+# Tools that only read; several of them in one turn run concurrently.
+# Write tools (create_booking, create_lead) always run one at a time, in the model's order.
+READ_ONLY_TOOLS = {"estimate_trip_cost", "get_available_cars"}
+TOOL_MAX_WORKERS = 4
+
+# Latency histograms (same store as the OLA Maps upstream histograms)
+LLM_TTFT = "llm_ttft"
+LLM_TOTAL = "llm_total"
+FAST_PATH_TOTAL = "safarbot_fast_path"
+CACHED_TOTAL = "safarbot_response_cache"
+
+FAST_PATH_STATS = ["safarbot_fast_path_hit", "safarbot_fast_path_miss"]
+
+# Answers to opening questions, keyed by normalized message + context (see response_cache_key)
+RESPONSE_CACHE_PREFIX = "safarwaala:safarbot:response:"
+RESPONSE_CACHE_TTL_SEC = 6 * 3600
+RESPONSE_CACHE_STATS = ["safarbot_response_cache_hit", "safarbot_response_cache_miss"]
+WRITE_TOOLS = {"create_booking", "create_lead"}
+
+# Per-process clients keyed by (base_url, api_key); each holds a keep-alive connection pool
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_openai_client():
+    """OpenAI client for OpenRouter, reused across requests so TLS connections are kept alive."""
+    api_key = frappe.conf.get("OPENROUTER_API_KEY") or "sk-or-v1-key"
+    base_url = frappe.conf.get("openrouter_base_url") or OPENROUTER_BASE_URL
+    key = (base_url, api_key)
+
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = openai.OpenAI(
+                    base_url=base_url,
+                    api_key=api_key,
+                    timeout=LLM_TIMEOUT_SEC,
+                    max_retries=LLM_MAX_RETRIES,
+                    http_client=httpx.Client(
+                        timeout=LLM_TIMEOUT_SEC,
+                        limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_KEEPALIVE),
+                    ),
+                )
+                _clients[key] = client
+    return client
+
+
+class TokenStream:
+    """Publishes streamed tokens on STREAM_EVENT, batched, and tracks time to first token."""
+
+    def __init__(self, stream_id=None, started=None):
+        self.stream_id = stream_id
+        self.started = started or time.monotonic()
+        self.first_token_at = None
+        self.buffer = []
+        self.flushed_at = 0
+
+    def __call__(self, text):
+        if self.first_token_at is None:
+            self.first_token_at = time.monotonic()
+        if not self.stream_id:
+            return
+        self.buffer.append(text)
+        if time.monotonic() - self.flushed_at >= STREAM_FLUSH_SEC:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.publish({"delta": "".join(self.buffer)})
+            self.buffer = []
+        self.flushed_at = time.monotonic()
+
+    def publish(self, message):
+        if self.stream_id:
+            frappe.publish_realtime(STREAM_EVENT, dict(message, stream_id=self.stream_id), task_id=self.stream_id)
+
+    def finish(self, response):
+        self.flush()
+        self.publish(dict(response, done=True))
+
+    @property
+    def ttft_ms(self):
+        if self.first_token_at is None:
+            return None
+        return round((self.first_token_at - self.started) * 1000, 1)
+
+
+def complete(client, messages, tools=None, on_token=None):
+    """
+    One chat completion. Returns (content, tool_calls) with tool_calls as assistant-message payloads.
+    With on_token the completion is streamed and on_token(text) is called as content arrives.
+    """
+    kwargs = {
+        "model": MODEL_NAME,
+        "messages": messages,
+        "extra_headers": {"HTTP-Referer": frappe.utils.get_url(), "X-Title": "Safarwaala"},
+    }
+    if tools:
+        kwargs.update(tools=tools, tool_choice="auto")
+
+    if not on_token:
+        message = client.chat.completions.create(**kwargs).choices[0].message
+        tool_calls = [
+            {"id": t.id, "type": "function", "function": {"name": t.function.name, "arguments": t.function.arguments}}
+            for t in message.tool_calls or []
+        ]
+        return message.content, tool_calls
+
+    content, calls = [], {}
+    for chunk in client.chat.completions.create(stream=True, **kwargs):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            content.append(delta.content)
+            on_token(delta.content)
+        # Tool calls arrive in fragments, keyed by their index
+        for part in delta.tool_calls or []:
+            call = calls.setdefault(part.index, {"id": None, "type": "function", "function": {"name": "", "arguments": ""}})
+            if part.id:
+                call["id"] = part.id
+            if part.function and part.function.name:
+                call["function"]["name"] += part.function.name
+            if part.function and part.function.arguments:
+                call["function"]["arguments"] += part.function.arguments
+    return "".join(content) or None, [calls[index] for index in sorted(calls)]
+
+
+def run_tool(fn_name, fn_args, customer_id=None):
+    """Run one tool call from the model; returns the JSON string handed back to it."""
+    if fn_name == "create_booking":
+        if not customer_id:
+            return json.dumps({"error": "Login required."})
+        fn_args['customer_id'] = customer_id
+        return create_booking(**fn_args)
+    if fn_name == "create_lead":
+        return create_lead(**fn_args)
+    if fn_name == "estimate_trip_cost":
+        return estimate_trip_cost(**fn_args)
+    if fn_name == "get_available_cars":
+        return get_available_cars(**fn_args)
+    return json.dumps({"error": f"Unknown tool: {fn_name}"})
+
+
+def _timed_tool(fn_name, fn_args, customer_id=None):
+    started = time.monotonic()
     try:
-        # A. Setup Client
-        api_key = frappe.conf.get("OPENROUTER_API_KEY") or "sk-or-v1-key"
-        client = openai.OpenAI(base_url="https://openrouter.ai/api/v1", api_key=api_key)
-        # MODEL_NAME = "google/gemini-2.0-flash-001" 
-        # MODEL_NAME = "arcee-ai/trinity-large-preview:free" 
-        # MODEL_NAME = "openrouter/pony-alpha" 
-        MODEL_NAME = "stepfun/step-3.5-flash:free" 
-
-        # B. Get Customer Context
-        customer_ctx = ""
-        user_name = "traveler"
-        if customer_id:
-            cust_details = get_customer_details(customer_id)
-            if cust_details:
-                user_name = cust_details.get('name') or "traveler"
-                customer_ctx = f"Logged-in Customer: {user_name} (Mobile: {cust_details.get('mobile')}). ID: {customer_id}."
-            else:
-                customer_ctx = f"Logged-in Customer ID: {customer_id}."
-        
-        # C. System Prompt (Persona & Instructions)
-        system_msg = {
-            "role": "system", 
-            "content": f"""You are **SafarBot**, an intelligent, proactive, and culturally aware travel assistant for **Safarwaala** in India. Date: {nowdate()}.
-            
-            **User Context**:
-            {customer_ctx}
-            
-            **Persona**:
-            - **Tone**: Professional yet warm (Use "Namaste", "Ji" sparingly).
-            - **Style**: Direct and Efficient. Avoid small talk if the user has a specific request.
-            
-            **CRITICAL RULE: ONE-SHOT ACTION**
-            - **IF** the user provides ALL required parameters for a tool in their message, **CALL THE TOOL IMMEDIATELY**.
-            - **DO NOT** ask for confirmation (e.g., "Shall I book this?"). JUST BOOK IT.
-            - **DO NOT** ask for details that are already provided or can be reasonably inferred (e.g., if user says "Delhi to Agra", assume "Delhi" is origin).
-            
-            **Capabilities & Logic**:
-            
-            1. **Booking (Logged-in User)**:
-               - **Goal**: Call `create_booking`.
-               - **Required**: `pickup_from`, `to_city`, `passengers` (default 1), `user_car_choice` (Sedan/SUV/Innova/etc).
-               - **Logic**: 
-                 - If `user_car_choice` is missing/ambiguous, **CALL `get_available_cars`** to show options.
-                 - If all details present -> **CALL TOOL**.
-               
-            2. **Lead/Inquiry (Guest/New User)**:
-               - **Goal**: Call `create_lead`.
-               - **Required**: `first_name`, `mobile_no`, `from_city`, `to_city`.
-               - **Logic**:
-                 - **Smart Extraction**: If user says "I am Rahul 9876543210 need cab Delhi to Jaipur", EXTRACT Name=Rahul, Mobile=9876543210... and **CALL TOOL IMMEDIATELY**.
-                 - **Incomplete**: Only ask for MISSING details.
-                 - **Trip Planning**: If user just asks for "Plan/Itinerary" without intent to book, **DO NOT** call tool. Just generate text plan.
-               
-            3. **Estimates/Car Info**:
-               - If user asks "Price?" or "Cost?", use `estimate_trip_cost`.
-               - If user asks "What cars do you have?" or "Show me options", use `get_available_cars`.
-            
-            4. **General Q&A**:
-               - Keep answers concise. 
-            """
+        result = run_tool(fn_name, fn_args, customer_id)
+    except Exception as e:
+        result = json.dumps({"success": False, "error": str(e)})
+    return result, round((time.monotonic() - started) * 1000, 1)
+
+
+def _timed_tool_in_thread(site, sites_path, user, fn_name, fn_args, customer_id=None):
+    def run():
+        frappe.set_user(user)
+        return _timed_tool(fn_name, fn_args, customer_id)
+
+    try:
+        return run_in_site_context(site, sites_path, run, connect=True)
+    except Exception as e:
+        return json.dumps({"success": False, "error": str(e)}), None
+
+
+def run_tools(tool_calls, customer_id=None):
+    """
+    Run the model's tool calls and return [(fn_name, result, elapsed_ms)] in the same order.
+    Read-only tools go to a thread pool, each thread with its own site context and DB
+    connection, while write tools run in order on the request's own connection.
+    """
+    calls = [(t["function"]["name"], json.loads(t["function"]["arguments"] or "{}")) for t in tool_calls]
+    results = [None] * len(calls)
+    parallel = [i for i, (fn_name, _args) in enumerate(calls) if fn_name in READ_ONLY_TOOLS]
+    if len(parallel) < 2:
+        parallel = []
+
+    pool = None
+    futures = {}
+    if parallel:
+        site, sites_path, user = frappe.local.site, frappe.local.sites_path, frappe.session.user
+        pool = ThreadPoolExecutor(max_workers=min(TOOL_MAX_WORKERS, len(parallel)))
+        futures = {
+            i: pool.submit(_timed_tool_in_thread, site, sites_path, user, calls[i][0], calls[i][1], customer_id)
+            for i in parallel
         }
+    try:
+        for i, (fn_name, fn_args) in enumerate(calls):
+            if i not in futures:
+                results[i] = _timed_tool(fn_name, fn_args, customer_id)
+        for i, future in futures.items():
+            results[i] = future.result()
+    finally:
+        if pool:
+            pool.shutdown(wait=True)
+
+    logger = frappe.logger("safarwaala.ai_agent")
+    for i, ((fn_name, _args), (_result, elapsed_ms)) in enumerate(zip(calls, results)):
+        logger.info(f"tool {fn_name} took {elapsed_ms} ms ({'parallel' if i in futures else 'inline'})")
+    return [(fn_name, result, elapsed_ms) for (fn_name, _args), (result, elapsed_ms) in zip(calls, results)]
+
+
+def car_options(tool_res):
+    """Cars from a get_available_cars result, for the UI's car picker."""
+    try:
+        res_dict = json.loads(tool_res)
+        if res_dict.get("success") and res_dict.get("cars"):
+            return res_dict.get("cars")
+    except: pass
+    return None
+
+
+def _record_metric(fn, *args):
+    """Metrics are best effort: a Redis error must not replace a finished answer or lose the turn."""
+    try:
+        fn(*args)
+    except Exception:
+        frappe.logger("safarwaala.ai_agent").exception(f"could not record metric {fn.__name__}{args}")
+
+
+def answer_fast_path(message):
+    """
+    Answer a high-confidence price or fleet question straight from the tool functions.
+    Returns (content, car_options, tool_timings), or None to fall through to the model.
+    """
+    detected = detect_intent(message)
+    if not detected:
+        _record_metric(incr_stat, "safarbot_fast_path_miss")
+        return None
+
+    fn_name, fn_args = detected
+    tool_res, elapsed_ms = _timed_tool(fn_name, fn_args)
+    result = json.loads(tool_res)
+    if not result.get("success"):
+        _record_metric(incr_stat, "safarbot_fast_path_miss")
+        return None
+
+    cars = None
+    content = result["message"]
+    if fn_name == "get_available_cars":
+        cars = car_options(tool_res)
+        if not cars:
+            _record_metric(incr_stat, "safarbot_fast_path_miss")
+            return None
+        lines = [f"- **{car['modal_name'] or car['name']}** ({car['category'] or 'Car'}, {car['seating_capacity']} seats)" for car in cars]
+        content = "\n".join([content, ""] + lines + ["", "Tell me your trip dates and route and I can book one for you."])
+
+    _record_metric(incr_stat, "safarbot_fast_path_hit")
+    return content, cars, [{"name": fn_name, "ms": elapsed_ms}]
+
+
+def response_cache_key(message, customer_id=None):
+    """
+    Cache key for an opening question. The context covers everything else the answer depends
+    on: who is asking (guests share answers; a customer's prompt carries their name and
+    mobile, so their answers are their own), the rate-card version and today's date.
+    A Car Modals change bumps the rate-card version, so older answers are never read again.
+    """
+    context = f"{customer_id or 'Guest'}|{get_rate_card_version()}|{nowdate()}"
+    digest = hashlib.md5(f"{normalize_query(message)}|{context}".encode()).hexdigest()
+    return RESPONSE_CACHE_PREFIX + digest
+
 
-        # D. Build Message Chain
-        if not history: history = []
-        if isinstance(history, str): history = json.loads(history)
+# --- 5. Main API Endpoint ---
+
+def build_system_message(customer_id=None):
+    # Customer Context
+    customer_ctx = ""
+    user_name = "traveler"
+    if customer_id:
+        cust_details = get_customer_details(customer_id)
+        if cust_details:
+            user_name = cust_details.get('name') or "traveler"
+            customer_ctx = f"Logged-in Customer: {user_name} (Mobile: {cust_details.get('mobile')}). ID: {customer_id}."
+        else:
+            customer_ctx = f"Logged-in Customer ID: {customer_id}."
+
+    # System Prompt (Persona & Instructions)
+    return {
+        "role": "system", 
+        "content": f"""You are **SafarBot**, an intelligent, proactive, and culturally aware travel assistant for **Safarwaala** in India. Date: {nowdate()}.
+        
+        **User Context**:
+        {customer_ctx}
         
-        # Sanitize history to ensure 'role' is valid
-        sanitized_history = []
-        for msg in history:
-            role = msg.get("role")
-            if role in ["user", "assistant", "system", "tool"]:
-                sanitized_history.append({"role": role, "content": msg.get("content")})
+        **Persona**:
+        - **Tone**: Professional yet warm (Use "Namaste", "Ji" sparingly).
+        - **Style**: Direct and Efficient. Avoid small talk if the user has a specific request.
         
-        messages = [system_msg] + sanitized_history
-        messages.append({"role": "user", "content": message})
-
-        # E. Main Loop
-        response = client.chat.completions.create(
-            model=MODEL_NAME, messages=messages, 
-            tools=TOOLS_SCHEMA, tool_choice="auto",
-            extra_headers={"HTTP-Referer": frappe.utils.get_url(), "X-Title": "Safarwaala"}
-        )
-
-        response_message = response.choices[0].message
-        tool_calls = response_message.tool_calls
+        **CRITICAL RULE: ONE-SHOT ACTION**
+        - **IF** the user provides ALL required parameters for a tool in their message, **CALL THE TOOL IMMEDIATELY**.
+        - **DO NOT** ask for confirmation (e.g., "Shall I book this?"). JUST BOOK IT.
+        - **DO NOT** ask for details that are already provided or can be reasonably inferred (e.g., if user says "Delhi to Agra", assume "Delhi" is origin).
+        
+        **Capabilities & Logic**:
+        
+        1. **Booking (Logged-in User)**:
+           - **Goal**: Call `create_booking`.
+           - **Required**: `pickup_from`, `to_city`, `passengers` (default 1), `user_car_choice` (Sedan/SUV/Innova/etc).
+           - **Logic**: 
+             - If `user_car_choice` is missing/ambiguous, **CALL `get_available_cars`** to show options.
+             - If all details present -> **CALL TOOL**.
+           
+        2. **Lead/Inquiry (Guest/New User)**:
+           - **Goal**: Call `create_lead`.
+           - **Required**: `first_name`, `mobile_no`, `from_city`, `to_city`.
+           - **Logic**:
+             - **Smart Extraction**: If user says "I am Rahul 9876543210 need cab Delhi to Jaipur", EXTRACT Name=Rahul, Mobile=9876543210... and **CALL TOOL IMMEDIATELY**.
+             - **Incomplete**: Only ask for MISSING details.
+             - **Trip Planning**: If user just asks for "Plan/Itinerary" without intent to book, **DO NOT** call tool. Just generate text plan.
+           
+        3. **Estimates/Car Info**:
+           - If user asks "Price?" or "Cost?", use `estimate_trip_cost`.
+           - If user asks "What cars do you have?" or "Show me options", use `get_available_cars`.
+        
+        4. **General Q&A**:
+           - Keep answers concise. 
+        """
+    }
+
+
+@frappe.whitelist(allow_guest=True)
+def chat_agent(message, history=None, customer_id=None, stream=0, stream_id=None, session_id=None):
+    """
+    SafarBot chat turn.
+
+    The conversation is kept server-side under session_id (returned with every response;
+    a new one is started when it is missing). Only the rolling summary and the recent turns
+    that fit the token budget are sent to the model. `history` is only read to seed a new session.
+
+    With stream=1 and a stream_id, answer tokens are also pushed as they arrive on the
+    `safarbot_stream` realtime event in the stream_id task room ({stream_id, delta}), followed
+    by the full response with done=True. The JSON response is returned either way.
+    """
+    started = time.monotonic()
+    tokens = TokenStream(stream_id if cint(stream) else None, started)
+    session_id = session_id or new_session_id()
+    try:
+        # A. Load the conversation
+        conversation = get_conversation(session_id)
+        if not conversation["messages"] and history:
+            if isinstance(history, str): history = json.loads(history)
+            append_messages(conversation, history)
+
         trip_plan_data = None 
         car_options_data = None
+        tool_timings = []
+
+        # B. Opening questions can skip the model: the fast path answers simple price / fleet
+        # questions and repeated ones come from the cache. Later turns depend on the conversation.
+        opening = not conversation["messages"]
+        fast = answer_fast_path(message) if opening else None
+        cache_key = response_cache_key(message, customer_id) if opening and not fast else None
+        cached = frappe.cache().get_value(cache_key) if cache_key else None
+        if cache_key:
+            _record_metric(incr_stat, "safarbot_response_cache_hit" if cached else "safarbot_response_cache_miss")
 
-        if tool_calls:
-            # Serialize
-            tool_calls_payload = [{"id": t.id, "type": "function", "function": {"name": t.function.name, "arguments": t.function.arguments}} for t in tool_calls]
-            messages.append({"role": "assistant", "tool_calls": tool_calls_payload, "content": response_message.content})
-
-            for tool_call in tool_calls:
-                fn_name = tool_call.function.name
-                fn_args = json.loads(tool_call.function.arguments)
-                tool_res = ""
-
-                if fn_name == "create_booking":
-                    if not customer_id: tool_res = json.dumps({"error": "Login required."})
-                    else:
-                        fn_args['customer_id'] = customer_id
-                        tool_res = create_booking(**fn_args)
-                elif fn_name == "create_lead":
-                    tool_res = create_lead(**fn_args)
-                elif fn_name == "estimate_trip_cost":
-                    tool_res = estimate_trip_cost(**fn_args)
-                elif fn_name == "get_available_cars":
-                    tool_res_json = get_available_cars(**fn_args)
-                    tool_res = tool_res_json
-                    # Capture car data to send to UI
-                    try:
-                        res_dict = json.loads(tool_res_json)
-                        if res_dict.get("success") and res_dict.get("cars"):
-                            car_options_data = res_dict.get("cars")
-                    except: pass
-
-                messages.append({"tool_call_id": tool_call.id, "role": "tool", "name": fn_name, "content": tool_res})
-
-            final_response = client.chat.completions.create(model=MODEL_NAME, messages=messages)
-            final_content = final_response.choices[0].message.content
+        if fast:
+            final_content, car_options_data, tool_timings = fast
+            tokens(final_content)
+        elif cached:
+            final_content, car_options_data = cached["content"], cached["carOptions"]
+            tokens(final_content)
         else:
-            final_content = response_message.content
+            client = get_openai_client()
+            messages = [build_system_message(customer_id)] + build_history(conversation)
+            messages.append({"role": "user", "content": message})
 
-        return {
+            # C. Main Loop
+            content, tool_calls = complete(client, messages, tools=TOOLS_SCHEMA, on_token=tokens)
+
+            if tool_calls:
+                messages.append({"role": "assistant", "tool_calls": tool_calls, "content": content})
+                # Anything streamed so far was preamble to the tool calls
+                tokens.publish({"reset": True})
+
+                for tool_call, (fn_name, tool_res, elapsed_ms) in zip(tool_calls, run_tools(tool_calls, customer_id)):
+                    tool_timings.append({"name": fn_name, "ms": elapsed_ms})
+                    if fn_name == "get_available_cars":
+                        car_options_data = car_options(tool_res) or car_options_data
+
+                    messages.append({"tool_call_id": tool_call["id"], "role": "tool", "name": fn_name, "content": tool_res})
+
+                final_content, _ = complete(client, messages, on_token=tokens)
+            else:
+                final_content = content
+
+            if cache_key and final_content and not WRITE_TOOLS.intersection(t["name"] for t in tool_timings):
+                frappe.cache().set_value(
+                    cache_key, {"content": final_content, "carOptions": car_options_data}, expires_in_sec=RESPONSE_CACHE_TTL_SEC
+                )
+
+        if tokens.first_token_at is None:
+            tokens.first_token_at = time.monotonic()
+        total_ms = round((time.monotonic() - started) * 1000, 1)
+        if fast:
+            _record_metric(record_latency, FAST_PATH_TOTAL, total_ms)
+        elif cached:
+            _record_metric(record_latency, CACHED_TOTAL, total_ms)
+        else:
+            _record_metric(record_latency, LLM_TTFT, tokens.ttft_ms)
+            _record_metric(record_latency, LLM_TOTAL, total_ms)
+
+        response = {
             "role": "assistant",
             "content": final_content,
             "tripPlan": trip_plan_data,
-            "carOptions": car_options_data
+            "carOptions": car_options_data,
+            "metrics": {"ttft_ms": tokens.ttft_ms, "total_ms": total_ms, "streamed": bool(tokens.stream_id), "tools": tool_timings, "fast_path": bool(fast), "cached": bool(cached)},
+            "session_id": session_id,
         }
+        record_turn(session_id, conversation, [{"role": "user", "content": message}, {"role": "assistant", "content": final_content}])
+        tokens.finish(response)
+        return response
 
     except Exception as e:
         frappe.log_error(f"AI Error: {str(e)}")
-        return {"role": "assistant", "content": f"System Error: {str(e)}"}
\ No newline at end of file
+        response = {"role": "assistant", "content": f"System Error: {str(e)}", "session_id": session_id}
+        tokens.finish(response)
+        return response
+
+
+@frappe.whitelist()
+def get_chat_agent_stats(reset: bool = False):
+    """chat_agent latency (time to first token, turn time), fast-path and response-cache hit ratios (System Manager only)."""
+    frappe.only_for("System Manager")
+    stats = {name: get_latency_histogram(name) for name in (LLM_TTFT, LLM_TOTAL, FAST_PATH_TOTAL, CACHED_TOTAL)}
+    stats.update(get_stats(FAST_PATH_STATS))
+    total = stats["safarbot_fast_path_hit"] + stats["safarbot_fast_path_miss"]
+    stats["safarbot_fast_path_hit_ratio"] = round(stats["safarbot_fast_path_hit"] / total, 4) if total else 0
+    stats.update(get_stats(RESPONSE_CACHE_STATS))
+    total = stats["safarbot_response_cache_hit"] + stats["safarbot_response_cache_miss"]
+    stats["safarbot_response_cache_hit_ratio"] = round(stats["safarbot_response_cache_hit"] / total, 4) if total else 0
+    if cint(reset):
+        reset_stats(FAST_PATH_STATS + RESPONSE_CACHE_STATS)
+        for name in (LLM_TTFT, LLM_TOTAL, FAST_PATH_TOTAL, CACHED_TOTAL):
+            reset_latency_histogram(name)
+    return stats
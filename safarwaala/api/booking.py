@@ -1,4 +1,11 @@
+import base64
+import json
+
 import frappe
+from frappe.utils import cint, get_datetime, now_datetime
+from safarwaala.api.dashboard_stats import get_cached_dashboard_stats, mark_stats_stale
+from safarwaala.api.permission import get_linked_principal
+from safarwaala.safarwaala.doctype.bookings_master.bookings_master import coalesce_booking_recompute
 
 def create_booking_master(doc, method):
     """
@@ -57,45 +64,218 @@ def create_booking(booking_type, booking_data):
         frappe.log_error(f"Create Booking Error: {str(e)}")
         return {"success": False, "message": str(e)}
 
+MY_BOOKINGS_FIELDS = [
+    "name", "booking_status", "booking_type", "pickup_datetime",
+    "pickup_location", "drop_location", "from_city", "to_city",
+    "grand_total", "customer_name", "car_model_name",
+    "trip_type", "creation", "modified"
+]
+MY_BOOKINGS_DEFAULT_PAGE_LENGTH = 20
+MY_BOOKINGS_MAX_PAGE_LENGTH = 500
+# Bookings Master column -> linked principal attribute that scopes get_my_bookings
+MY_BOOKINGS_LINKS = (("assigned_to", "vendor"), ("driver", "driver"), ("customer", "customer"))
+
+# Sync tokens older than this (or older than the removal markers in Redis) need a full resync
+SYNC_TOKEN_TTL_SEC = 7 * 24 * 3600
+REMOVED_BOOKINGS_PREFIX = "safarwaala:bookings:removed:"
+REMOVED_TRACKING_SINCE_KEY = "safarwaala:bookings:removed_tracking_since"
+
+def _encode_booking_cursor(row):
+    raw = f"{row.creation}|{row.name}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_booking_cursor(cursor):
+    try:
+        creation, name = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return get_datetime(creation), name
+    except Exception:
+        frappe.throw("Invalid cursor", frappe.ValidationError)
+
+def _get_projection(fields):
+    if not fields:
+        return list(MY_BOOKINGS_FIELDS)
+    if isinstance(fields, str):
+        fields = json.loads(fields) if fields.strip().startswith("[") else fields.split(",")
+
+    valid_columns = set(frappe.get_meta("Bookings Master").get_valid_columns())
+    projection = [f.strip() for f in fields if f and f.strip() in valid_columns]
+    # creation and name are the keyset; they are always returned
+    for key in ("creation", "name"):
+        if key not in projection:
+            projection.append(key)
+    return projection
+
+def _query_my_bookings(principal, fields, limit=None, cursor=None, since=None):
+    """
+    One indexed branch per linked role (assigned_to / driver / customer), combined
+    with UNION ALL and ordered on (creation, name) so each branch can walk its
+    (<column>, creation) index instead of OR-ing across three columns.
+    """
+    branches = []
+    for column, attribute in MY_BOOKINGS_LINKS:
+        if principal.get(attribute):
+            branches.append((column, principal.get(attribute)))
+
+    if not branches:
+        return []
+
+    values = {}
+    conditions = []
+    if cursor:
+        values["cursor_creation"], values["cursor_name"] = _decode_booking_cursor(cursor)
+        conditions.append("(creation < %(cursor_creation)s OR (creation = %(cursor_creation)s AND name < %(cursor_name)s))")
+    if since:
+        values["since"] = get_datetime(since)
+        conditions.append("modified >= %(since)s")
+
+    select_list = ", ".join(
+        "DATE_FORMAT(pickup_datetime, '%%Y-%%m-%%d %%H:%%i:%%s') as pickup_datetime" if f == "pickup_datetime" else f"`{f}`"
+        for f in fields
+    )
+    limit_clause = f"LIMIT {cint(limit)}" if limit else ""
+
+    queries = []
+    for idx, (column, value) in enumerate(branches):
+        values[f"link_{idx}"] = value
+        # Exclude rows already matched by an earlier branch so UNION ALL never duplicates
+        exclusions = [f"IFNULL(`{prev}`, '') != %(link_{p})s" for p, (prev, _) in enumerate(branches[:idx])]
+        where_clause = " AND ".join([f"`{column}` = %(link_{idx})s"] + exclusions + conditions)
+        queries.append(f"""
+            (SELECT {select_list}
+            FROM `tabBookings Master`
+            WHERE {where_clause}
+            ORDER BY creation DESC, name DESC
+            {limit_clause})
+        """)
+
+    return frappe.db.sql(f"""
+        {" UNION ALL ".join(queries)}
+        ORDER BY creation DESC, name DESC
+        {limit_clause}
+    """, values, as_dict=True)
+
 @frappe.whitelist()
 def get_my_bookings():
     """
     Fetch OutStation, Local, and Routine Bookings for the logged-in user's linked customer/driver/vendor.
+    Returns the full list; new clients should use `get_my_bookings_page`.
     """
     user = frappe.session.user
     if user == "Guest":
         return []
 
-    driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-    customer = frappe.db.get_value("Customer", {"linked_user": user}, "name")
-    vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-
-    filters = []
-    if driver:
-        filters.append(f"driver = '{driver}'")
-    if customer:
-        filters.append(f"customer = '{customer}'")
-    if vendor:
-        filters.append(f"assigned_to = '{vendor}'")
-    
-    if not filters:
+    principal = get_linked_principal(user)
+    return _query_my_bookings(principal, [f for f in MY_BOOKINGS_FIELDS if f != "modified"])
+
+def _sync_score(value):
+    return get_datetime(value).timestamp()
+
+def _removed_key(column, value):
+    cache = frappe.cache()
+    return cache.make_key(f"{REMOVED_BOOKINGS_PREFIX}{column}:{value}")
+
+def _removed_tracking_since():
+    """
+    When removal markers started being kept. If Redis loses them this key goes too and
+    restarts, so tokens issued before it get a full resync instead of a partial answer.
+    """
+    cache = frappe.cache()
+    key = cache.make_key(REMOVED_TRACKING_SINCE_KEY)
+    cache.set(key, _sync_score(now_datetime()), nx=True)
+    return float(cache.get(key))
+
+def record_removed_booking(doc, method=None):
+    """
+    doc_events hook (on_update, on_trash): remember a booking under each vendor, driver or
+    customer it was reassigned away from or deleted for, so their next incremental sync
+    reports it in `removed`. Written after commit, so a rolled back change is never reported.
+    """
+    if method == "on_trash":
+        links = [(column, doc.get(column)) for column, _attribute in MY_BOOKINGS_LINKS]
+    else:
+        before = doc.get_doc_before_save()
+        if not before:
+            return
+        links = [(column, before.get(column)) for column, _attribute in MY_BOOKINGS_LINKS if before.get(column) != doc.get(column)]
+
+    links = [(column, value) for column, value in links if value]
+    if not links:
+        return
+
+    def write_markers():
+        _removed_tracking_since()
+        score = _sync_score(now_datetime())
+        pipe = frappe.cache().pipeline()
+        for column, value in links:
+            key = _removed_key(column, value)
+            pipe.zadd(key, {doc.name: score})
+            pipe.zremrangebyscore(key, "-inf", score - SYNC_TOKEN_TTL_SEC)
+            pipe.expire(key, SYNC_TOKEN_TTL_SEC)
+        pipe.execute()
+
+    frappe.db.after_commit.add(write_markers)
+
+def _removed_bookings(principal, since):
+    """Bookings removed from the principal's scope (reassigned or deleted) since the sync token."""
+    cache = frappe.cache()
+    names = set()
+    for column, attribute in MY_BOOKINGS_LINKS:
+        if principal.get(attribute):
+            names.update(
+                frappe.safe_decode(name)
+                for name in cache.zrangebyscore(_removed_key(column, principal.get(attribute)), _sync_score(since), "+inf")
+            )
+    if not names:
         return []
 
-    where_clause = " OR ".join(filters)
+    # A booking moved between two of the principal's links (or moved back) is still theirs
+    scopes, values = [], {"names": list(names)}
+    for column, attribute in MY_BOOKINGS_LINKS:
+        if principal.get(attribute):
+            scopes.append(f"`{column}` = %({attribute})s")
+            values[attribute] = principal.get(attribute)
+    visible = frappe.db.sql_list(f"""
+        SELECT name FROM `tabBookings Master`
+        WHERE name IN %(names)s AND ({" OR ".join(scopes)})
+    """, values)
+    return sorted(names - set(visible))
+
+@frappe.whitelist()
+def get_my_bookings_page(page_length=None, cursor=None, since=None, fields=None):
+    """
+    Cursor-paginated bookings for the logged-in user, newest first.
+    page_length: rows per page (default 20, max 500).
+    cursor: `next_cursor` from the previous page.
+    since: `sync_token` from the last sync; only bookings modified since then are returned,
+        and `removed` lists the bookings the user no longer sees (reassigned or deleted).
+        When `resync` is true the token has expired (after 7 days) and the client must drop
+        its local copy and sync again without `since`.
+    fields: optional list (or comma separated string) of Bookings Master columns to return.
+    """
+    user = frappe.session.user
+    sync_token = str(now_datetime())
+    empty = {"data": [], "next_cursor": None, "sync_token": sync_token, "removed": [], "resync": False}
+    if user == "Guest":
+        return empty
+
+    if since:
+        since = get_datetime(since)
+        expired = _sync_score(since) < _sync_score(now_datetime()) - SYNC_TOKEN_TTL_SEC
+        if expired or _sync_score(since) < _removed_tracking_since():
+            return dict(empty, resync=True)
+
+    page_length = min(cint(page_length) or MY_BOOKINGS_DEFAULT_PAGE_LENGTH, MY_BOOKINGS_MAX_PAGE_LENGTH)
+    principal = get_linked_principal(user)
 
-    bookings = frappe.db.sql(f"""
-        SELECT 
-            name, booking_status, booking_type,
-            DATE_FORMAT(pickup_datetime, '%%Y-%%m-%%d %%H:%%i:%%s') as pickup_datetime,
-            pickup_location, drop_location, from_city, to_city,
-            grand_total, customer_name, car_model_name,
-            trip_type, creation
-        FROM `tabBookings Master`
-        WHERE {where_clause}
-        ORDER BY creation DESC
-    """, as_dict=True)
+    # Fetch one extra row to know whether another page exists
+    rows = _query_my_bookings(principal, _get_projection(fields), limit=page_length + 1, cursor=cursor, since=since)
+    next_cursor = None
+    if len(rows) > page_length:
+        rows = rows[:page_length]
+        next_cursor = _encode_booking_cursor(rows[-1])
 
-    return bookings
+    removed = _removed_bookings(principal, since) if since and not cursor else []
+    return {"data": rows, "next_cursor": next_cursor, "sync_token": sync_token, "removed": removed, "resync": False}
 
 @frappe.whitelist(allow_guest=True)
 def get_booking_details(doctype, name):
@@ -223,6 +403,10 @@ def manage_duty_slip(booking_id, action="create", **kwargs):
             frappe.db.set_value("Bookings Master", booking_id, "return_datetime", doc.return_datetime)
 
         doc.save(ignore_permissions=True)
+
+        if action in ("start_trip", "end_trip"):
+            # booking_status was changed with db.set_value, which skips doc_events
+            mark_stats_stale("driver", doc.driver)
         
         if action == "submit":
             if doc.docstatus == 0:
@@ -254,7 +438,8 @@ def sync_booking_details(booking_id):
             doc.return_datetime = ds_doc.return_datetime
             
         # Save calls validate() which calls calculate_charges/expenses/taxes/totals
-        doc.save(ignore_permissions=True)
+        with coalesce_booking_recompute():
+            doc.save(ignore_permissions=True)
         
         return {"success": True, "message": "Booking Details Synced and Calculated.", "data": doc.name}
 
@@ -286,13 +471,13 @@ def finalize_booking(booking_id):
             return {"success": False, "message": "Booking is already submitted."}
             
         doc.flags.ignore_permissions = True
-        doc.submit()
-        
-        # Auto-approve and submit all linked expenses
-        expenses = frappe.get_all("Vehicle Expense Log", filters={"booking_ref": booking_id}, pluck="name")
-        for exp_name in expenses:
-            exp_doc = frappe.get_doc("Vehicle Expense Log", exp_name)
-            if exp_doc.docstatus == 0:
+        with coalesce_booking_recompute():
+            doc.submit()
+
+            # Auto-approve and submit all linked expenses
+            expenses = frappe.get_all("Vehicle Expense Log", filters={"booking_ref": booking_id, "docstatus": 0}, pluck="name")
+            for exp_name in expenses:
+                exp_doc = frappe.get_doc("Vehicle Expense Log", exp_name)
                 exp_doc.status = "Approved"
                 exp_doc.flags.ignore_permissions = True
                 exp_doc.save()
@@ -306,6 +491,127 @@ def finalize_booking(booking_id):
         frappe.log_error(f"Finalize Booking Error: {str(e)}")
         return {"success": False, "message": str(e)}
 
+FINALIZE_CHUNK_SIZE = 100
+
+@frappe.whitelist()
+def finalize_bookings(booking_ids=None, filters=None, chunk_size=None):
+    """
+    Finalize many Bookings Master entries in a background job.
+    booking_ids: JSON string or list of booking names.
+    filters: JSON string or dict of Bookings Master filters (used when booking_ids is empty).
+    Progress and per-booking results are published on the `finalize_bookings_progress` realtime event.
+    """
+    if isinstance(booking_ids, str):
+        booking_ids = json.loads(booking_ids)
+    if isinstance(filters, str):
+        filters = json.loads(filters)
+
+    if not booking_ids and not filters:
+        return {"success": False, "message": "Pass booking_ids or filters"}
+
+    # Only draft bookings the caller can see are finalized
+    query_filters = dict(filters or {})
+    query_filters["docstatus"] = 0
+    if booking_ids:
+        query_filters["name"] = ["in", booking_ids]
+    names = frappe.get_list("Bookings Master", filters=query_filters, pluck="name", order_by="creation asc", limit_page_length=0)
+
+    if not names:
+        return {"success": False, "message": "No draft bookings matched"}
+
+    job_id = frappe.generate_hash(length=10)
+    frappe.enqueue(
+        "safarwaala.api.booking.finalize_bookings_job",
+        queue="long",
+        timeout=4 * 3600,
+        job_id=f"finalize_bookings::{job_id}",
+        booking_ids=names,
+        chunk_size=cint(chunk_size) or FINALIZE_CHUNK_SIZE,
+        progress_id=job_id,
+    )
+
+    return {"success": True, "message": f"Finalizing {len(names)} bookings in the background.", "data": {"job_id": job_id, "total": len(names)}}
+
+def finalize_bookings_job(booking_ids, chunk_size=FINALIZE_CHUNK_SIZE, progress_id=None):
+    """
+    Background job for `finalize_bookings`. Each chunk is one transaction: bookings are
+    submitted one by one (a failure rolls back only that booking), then the chunk's
+    invoices and payouts are bulk inserted and committed together.
+    """
+    from safarwaala.api.dashboard_stats import mark_docs_stale
+    from safarwaala.utils import bulk_insert_docs
+
+    frappe.flags.mute_messages = True
+    total = len(booking_ids)
+    results = []
+
+    for start in range(0, total, chunk_size):
+        chunk = booking_ids[start:start + chunk_size]
+        chunk_results = []
+        financials = []
+        invoiced = []
+
+        for booking_id in chunk:
+            frappe.db.savepoint("finalize_booking")
+            try:
+                doc = frappe.get_doc("Bookings Master", booking_id)
+                if doc.docstatus != 0:
+                    chunk_results.append({"booking": booking_id, "success": False, "message": "Booking is already submitted."})
+                    continue
+
+                doc.flags.ignore_permissions = True
+                doc.flags.defer_financials = True
+                doc.submit()
+
+                invoice = doc.get_customer_invoice()
+                if invoice:
+                    financials.append(invoice)
+                    invoiced.append((doc, invoice))
+                payout = doc.get_driver_payout()
+                if payout:
+                    financials.append(payout)
+
+                chunk_results.append({"booking": booking_id, "success": True})
+            except Exception as e:
+                frappe.db.rollback(save_point="finalize_booking")
+                chunk_results.append({"booking": booking_id, "success": False, "message": str(e)})
+
+        try:
+            bulk_insert_docs(financials)
+            for doc, invoice in invoiced:
+                frappe.db.set_value("Bookings Master", doc.name, {
+                    "booking_status": "Invoiced",
+                    "linked_invoice": invoice.name
+                }, update_modified=False)
+            frappe.db.commit()
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(f"Finalize Bookings Chunk Error: {str(e)}")
+            chunk_results = [{"booking": b, "success": False, "message": str(e)} for b in chunk]
+        else:
+            # Bulk inserts and set_value skip doc_events, so dashboard stats are refreshed here
+            mark_docs_stale(financials + [doc for doc, _invoice in invoiced])
+
+        results.extend(chunk_results)
+        frappe.publish_realtime("finalize_bookings_progress", {
+            "job_id": progress_id,
+            "processed": len(results),
+            "total": total,
+            "results": chunk_results,
+        }, user=frappe.session.user)
+
+    failed = [r for r in results if not r["success"]]
+    frappe.publish_realtime("finalize_bookings_progress", {
+        "job_id": progress_id,
+        "processed": total,
+        "total": total,
+        "done": True,
+        "succeeded": total - len(failed),
+        "failed": failed,
+    }, user=frappe.session.user)
+
+    return results
+
 @frappe.whitelist()
 def submit_document(doctype, name):
     """
@@ -405,97 +711,39 @@ def log_expense(expense_type, amount, car=None, paid_by="Driver", driver=None, b
         frappe.log_error(f"Failed to log expense: {str(e)}", "Vehicle Expense Log Error")
         return {"success": False, "message": str(e)}
 
+@frappe.whitelist()
+def log_expenses(expenses, booking_ref=None):
+    """
+    Log several vehicle expenses in one call.
+    expenses: JSON string or list of dicts with the same keys as `log_expense`.
+    The booking totals are recomputed once for the whole batch.
+    """
+    if isinstance(expenses, str):
+        expenses = json.loads(expenses)
+
+    results = []
+    with coalesce_booking_recompute():
+        for expense in expenses:
+            expense = dict(expense)
+            if booking_ref and not expense.get("booking_ref"):
+                expense["booking_ref"] = booking_ref
+            results.append(log_expense(**expense))
+
+    return {
+        "success": all(r.get("success") for r in results),
+        "message": f"{sum(1 for r in results if r.get('success'))} of {len(results)} expenses logged",
+        "data": results
+    }
+
 @frappe.whitelist()
 def get_dashboard_stats():
+    """
+    Vendor / driver dashboard figures. Served from per-vendor and per-driver
+    snapshots in Redis (see api/dashboard_stats.py); `computed_at` is the age of the oldest one.
+    """
     try:
-        user = frappe.session.user
-        roles = frappe.get_roles(user)
-        
-        stats = {
-            "active_drivers": 0,
-            "total_vehicles": 0,
-            "pending_payments": 0,
-            "total_earnings": 0,
-            "upcoming_trips": 0,
-            "driver_earnings": 0,
-            "duty_status": "Unknown"
-        }
-        
-        if "Vendor" in roles or "System Manager" in roles:
-            # Vendor Stats
-            
-            # Identify Vendor
-            vendor_name = None
-            if "System Manager" not in roles:
-                vendor_name = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-            
-            # Filter Conditions
-            driver_filters = {"disabled": 0}
-            car_filters = {"disabled": 0}
-            payment_filters = {"docstatus": 0}
-            
-            if vendor_name:
-                driver_filters["owner_vendor"] = vendor_name
-                car_filters["belongs_to_vendor"] = vendor_name
-                payment_filters["vendor"] = vendor_name
-                # Note: Customer Invoice filtering is complex as it links to Customer, not directly to Vendor.
-                # However, OutStation Bookings are assigned to Vendor.
-                # So we can sum invoices linked to bookings assigned to this vendor.
-            
-            stats["active_drivers"] = frappe.db.count("Drivers", filters=driver_filters)
-            stats["total_vehicles"] = frappe.db.count("Cars", filters=car_filters)
-            
-            # Pending Payments (Driver Payments) - Using Payouts table
-            # Filter: Status 'Pending', and Driver belongs to this Vendor
-            if vendor_name:
-                 pending_sql = frappe.db.sql("""
-                    SELECT SUM(p.amount) 
-                    FROM `tabPayouts` p
-                    JOIN `tabDrivers` d ON p.payout_to = d.name
-                    WHERE p.status = 'Pending' AND d.owner_vendor = %s
-                """, (vendor_name,))
-            else:
-                 pending_sql = frappe.db.sql("""
-                    SELECT SUM(amount) FROM `tabPayouts` WHERE status = 'Pending'
-                """)
-            stats["pending_payments"] = pending_sql[0][0] if pending_sql and pending_sql[0][0] else 0
-
-            # Total Earnings (Customer Invoices Paid)
-            # If Vendor, join with OutStation Bookings
-            if vendor_name:
-                earnings_sql = frappe.db.sql("""
-                    SELECT SUM(ci.grand_total) 
-                    FROM `tabCustomer Invoice` ci
-                    JOIN `tabOutStation Bookings` ob ON ci.name = ob.invoice
-                    WHERE ci.status = 'Paid' AND ob.assigned_to = %s
-                """, (vendor_name,))
-            else:
-                earnings_sql = frappe.db.sql("""
-                    SELECT SUM(grand_total) FROM `tabCustomer Invoice` WHERE status = 'Paid'
-                """)
-            stats["total_earnings"] = earnings_sql[0][0] if earnings_sql and earnings_sql[0][0] else 0
-
-        if "Driver" in roles:
-            # Driver Stats
-            driver_doc_name = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-            if driver_doc_name:
-                stats["upcoming_trips"] = frappe.db.count("Bookings Master", filters={"driver": driver_doc_name, "booking_status": "Confirmed"})
-                
-                # Driver Earnings - Using Payouts
-                driver_earnings_sql = frappe.db.sql("""
-                    SELECT SUM(amount) FROM `tabPayouts` WHERE payout_to = %s AND status = 'Paid'
-                """, (driver_doc_name,))
-                stats["driver_earnings"] = driver_earnings_sql[0][0] if driver_earnings_sql and driver_earnings_sql[0][0] else 0
-                
-                # Duty Status - Derive from disabled field
-                is_disabled = frappe.db.get_value("Drivers", driver_doc_name, "disabled")
-                stats["duty_status"] = "Inactive" if is_disabled else "Active"
-            else:
-                stats["upcoming_trips"] = 0
-                stats["driver_earnings"] = 0
-                stats["duty_status"] = "Not Found"
-
-        return {"success": True, "data": stats}
+        result = get_cached_dashboard_stats()
+        return {"success": True, "data": result["stats"], "computed_at": result["computed_at"]}
 
     except Exception as e:
         frappe.log_error(f"Dashboard Stats Error: {str(e)}")
@@ -0,0 +1,134 @@
+import frappe
+
+CONVERSATION_PREFIX = "safarwaala:safarbot:conversation:"
+CONVERSATION_TTL_SEC = 24 * 3600
+
+# Prompt budget for past turns (summary + recent messages), in estimated tokens
+HISTORY_TOKEN_BUDGET = 2000
+# Fold older turns into the summary once the stored turns pass this many tokens
+SUMMARIZE_AFTER_TOKENS = 3000
+# Most recent messages that are never folded into the summary
+KEEP_RECENT_MESSAGES = 6
+SUMMARY_MAX_TOKENS = 300
+
+MESSAGE_ROLES = ("user", "assistant")
+
+
+def estimate_tokens(text):
+    """Rough token count (about 4 characters per token); good enough for budgeting."""
+    return len(text or "") // 4 + 4
+
+
+def _key(session_id):
+    return CONVERSATION_PREFIX + session_id
+
+
+def new_session_id():
+    return frappe.generate_hash(length=20)
+
+
+def get_conversation(session_id):
+    """Stored conversation for session_id, or an empty one. Sessions are bound to the user that started them."""
+    conversation = frappe.cache().get_value(_key(session_id)) if session_id else None
+    if not conversation or conversation.get("user") != frappe.session.user:
+        conversation = {"user": frappe.session.user, "summary": "", "messages": [], "next_seq": 1}
+    return conversation
+
+
+def save_conversation(session_id, conversation):
+    frappe.cache().set_value(_key(session_id), conversation, expires_in_sec=CONVERSATION_TTL_SEC)
+
+
+def append_messages(conversation, messages):
+    for msg in messages:
+        if msg.get("role") in MESSAGE_ROLES and msg.get("content"):
+            conversation["messages"].append({"seq": conversation["next_seq"], "role": msg["role"], "content": msg["content"]})
+            conversation["next_seq"] += 1
+    return conversation
+
+
+def stored_tokens(conversation):
+    return sum(estimate_tokens(msg["content"]) for msg in conversation["messages"])
+
+
+def build_history(conversation, budget=HISTORY_TOKEN_BUDGET):
+    """
+    Past turns to send to the model: the rolling summary plus as many of the most
+    recent messages as fit in `budget`. The latest message is always kept.
+    """
+    history = []
+    if conversation.get("summary"):
+        summary = f"Summary of the earlier conversation:\n{conversation['summary']}"
+        history.append({"role": "system", "content": summary})
+        budget -= estimate_tokens(summary)
+
+    recent = []
+    for msg in reversed(conversation["messages"]):
+        cost = estimate_tokens(msg["content"])
+        if recent and cost > budget:
+            break
+        recent.append({"role": msg["role"], "content": msg["content"]})
+        budget -= cost
+    return history + recent[::-1]
+
+
+def record_turn(session_id, conversation, messages):
+    """Store a finished turn and fold older turns into the summary in the background when it grows."""
+    append_messages(conversation, messages)
+    save_conversation(session_id, conversation)
+    if stored_tokens(conversation) > SUMMARIZE_AFTER_TOKENS and len(conversation["messages"]) > KEEP_RECENT_MESSAGES:
+        frappe.enqueue(
+            "safarwaala.api.conversation.summarize_conversation",
+            queue="short",
+            job_id=f"safarbot_summary::{frappe.local.site}::{session_id}",
+            deduplicate=True,
+            session_id=session_id,
+        )
+
+
+def summarize_conversation(session_id):
+    """Background job: replace all but the most recent messages with an updated rolling summary."""
+    from safarwaala.api.ai_agent import MODEL_NAME, get_openai_client
+
+    conversation = frappe.cache().get_value(_key(session_id))
+    if not conversation or len(conversation["messages"]) <= KEEP_RECENT_MESSAGES:
+        return
+
+    older = conversation["messages"][:-KEEP_RECENT_MESSAGES]
+    upto = older[-1]["seq"]
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in older)
+    if conversation.get("summary"):
+        transcript = f"Earlier summary:\n{conversation['summary']}\n\nLater messages:\n{transcript}"
+
+    response = get_openai_client().chat.completions.create(
+        model=MODEL_NAME,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        messages=[
+            {"role": "system", "content": (
+                "Summarize this travel-booking chat for the assistant that continues it. Keep names, mobile "
+                "numbers, cities, dates, passenger counts, car choices, quoted prices and any booking or lead "
+                "IDs. Plain text, at most 120 words."
+            )},
+            {"role": "user", "content": transcript},
+        ],
+    )
+    summary = (response.choices[0].message.content or "").strip()
+    if not summary:
+        return
+
+    # Re-read: turns recorded while the summary was being written must be kept
+    conversation = frappe.cache().get_value(_key(session_id))
+    if not conversation:
+        return
+    conversation["summary"] = summary
+    conversation["messages"] = [msg for msg in conversation["messages"] if msg["seq"] > upto]
+    save_conversation(session_id, conversation)
+
+
+@frappe.whitelist(allow_guest=True)
+def clear_conversation(session_id):
+    """Forget a SafarBot conversation (only the user that started it can)."""
+    conversation = frappe.cache().get_value(_key(session_id))
+    if conversation and conversation.get("user") == frappe.session.user:
+        frappe.cache().delete_value(_key(session_id))
+    return {"success": True}
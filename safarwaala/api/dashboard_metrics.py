@@ -1,5 +1,6 @@
 import frappe
-from safarwaala.safarwaala.report.driver_ledger.driver_ledger import get_data as get_ledger_data
+from safarwaala.api.permission import get_linked_principal
+from safarwaala.safarwaala.doctype.driver_balance.driver_balance import get_driver_balances
 
 @frappe.whitelist()
 def get_driver_pending_balance(filters=None):
@@ -7,25 +8,24 @@ def get_driver_pending_balance(filters=None):
     if user == "Administrator":
         return 0
     
-    total_balance = 0
-    
+    principal = get_linked_principal(user)
+
     # Check if Vendor
-    if "Vendor" in frappe.get_roles(user):
-        vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-        if vendor:
-            # Get all drivers for this vendor
-            drivers = frappe.get_all("Drivers", filters={"owner_vendor": vendor}, pluck="name")
-            for driver in drivers:
-                data = get_ledger_data(frappe._dict({"driver": driver}))
-                if data:
-                    total_balance += (data[-1].get("balance") or 0)
-        return total_balance
+    if "Vendor" in principal.roles:
+        if principal.vendor:
+            return sum(get_driver_balances(vendor=principal.vendor).values())
+        return 0
 
     # Check if Driver
-    driver_name = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-    if driver_name:
-        data = get_ledger_data(frappe._dict({"driver": driver_name}))
-        if data:
-            return data[-1].get("balance") or 0
+    if principal.driver:
+        return get_driver_balances(drivers=[principal.driver]).get(principal.driver, 0)
             
     return 0
+
+@frappe.whitelist()
+def get_vendor_driver_balances():
+    """{driver: balance} for every driver of the logged-in vendor."""
+    principal = get_linked_principal()
+    if "Vendor" not in principal.roles or not principal.vendor:
+        return {}
+    return get_driver_balances(vendor=principal.vendor)
@@ -0,0 +1,212 @@
+import frappe
+from frappe.utils import flt, now_datetime
+from safarwaala.api.permission import get_linked_principal
+
+STATS_CACHE_PREFIX = "safarwaala:dashboard_stats:"
+# Snapshots are served as-is for STATS_FRESH_SEC, then served stale while a
+# background job recomputes them. Redis drops them entirely after STATS_MAX_AGE_SEC.
+STATS_FRESH_SEC = 60
+STATS_MAX_AGE_SEC = 24 * 3600
+
+ALL_VENDORS = "__all__"
+
+
+def compute_vendor_stats(vendor=None):
+    """Vendor dashboard figures; vendor=None aggregates across all vendors (System Manager)."""
+    driver_filters = {"disabled": 0}
+    car_filters = {"disabled": 0}
+    if vendor:
+        driver_filters["owner_vendor"] = vendor
+        car_filters["belongs_to_vendor"] = vendor
+
+    stats = {
+        "active_drivers": frappe.db.count("Drivers", filters=driver_filters),
+        "total_vehicles": frappe.db.count("Cars", filters=car_filters),
+    }
+
+    # Pending Payments (Driver Payments) - Using Payouts table
+    # Filter: Status 'Pending', and Driver belongs to this Vendor
+    if vendor:
+        pending_sql = frappe.db.sql("""
+            SELECT SUM(p.amount)
+            FROM `tabPayouts` p
+            JOIN `tabDrivers` d ON p.payout_to = d.name
+            WHERE p.status = 'Pending' AND d.owner_vendor = %s
+        """, (vendor,))
+    else:
+        pending_sql = frappe.db.sql("""
+            SELECT SUM(amount) FROM `tabPayouts` WHERE status = 'Pending'
+        """)
+    stats["pending_payments"] = flt(pending_sql[0][0]) if pending_sql else 0
+
+    # Total Earnings (Customer Invoices Paid); invoices carry the booking's vendor
+    if vendor:
+        earnings_sql = frappe.db.sql("""
+            SELECT SUM(grand_total) FROM `tabCustomer Invoice` WHERE status = 'Paid' AND vendor = %s
+        """, (vendor,))
+    else:
+        earnings_sql = frappe.db.sql("""
+            SELECT SUM(grand_total) FROM `tabCustomer Invoice` WHERE status = 'Paid'
+        """)
+    stats["total_earnings"] = flt(earnings_sql[0][0]) if earnings_sql else 0
+
+    return stats
+
+
+def compute_driver_stats(driver):
+    stats = {
+        "upcoming_trips": frappe.db.count("Bookings Master", filters={"driver": driver, "booking_status": "Confirmed"}),
+    }
+
+    # Driver Earnings - Using Payouts
+    driver_earnings_sql = frappe.db.sql("""
+        SELECT SUM(amount) FROM `tabPayouts` WHERE payout_to = %s AND status = 'Paid'
+    """, (driver,))
+    stats["driver_earnings"] = flt(driver_earnings_sql[0][0]) if driver_earnings_sql else 0
+
+    # Duty Status - Derive from disabled field
+    is_disabled = frappe.db.get_value("Drivers", driver, "disabled")
+    stats["duty_status"] = "Inactive" if is_disabled else "Active"
+    return stats
+
+
+STATS_COMPUTERS = {
+    "vendor": lambda scope: compute_vendor_stats(None if scope == ALL_VENDORS else scope),
+    "driver": compute_driver_stats,
+}
+
+
+def _cache_key(scope_type, scope):
+    return f"{STATS_CACHE_PREFIX}{scope_type}:{scope}"
+
+
+def refresh_stats_snapshot(scope_type, scope):
+    """Recompute one snapshot and store it in Redis. Also runs as a background job."""
+    now = now_datetime()
+    snapshot = {
+        "stats": STATS_COMPUTERS[scope_type](scope),
+        "computed_at": str(now),
+        "fresh_until": now.timestamp() + STATS_FRESH_SEC,
+    }
+    frappe.cache().set_value(_cache_key(scope_type, scope), snapshot, expires_in_sec=STATS_MAX_AGE_SEC)
+    return snapshot
+
+
+def enqueue_stats_refresh(scope_type, scope):
+    if not scope:
+        return
+    frappe.enqueue(
+        "safarwaala.api.dashboard_stats.refresh_stats_snapshot",
+        queue="short",
+        job_id=f"dashboard_stats::{frappe.local.site}::{scope_type}::{scope}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        scope_type=scope_type,
+        scope=scope,
+    )
+
+
+def get_stats_snapshot(scope_type, scope):
+    """Cached snapshot; stale ones are returned immediately and refreshed in the background."""
+    snapshot = frappe.cache().get_value(_cache_key(scope_type, scope))
+    if not snapshot:
+        return refresh_stats_snapshot(scope_type, scope)
+
+    if snapshot.get("fresh_until", 0) < now_datetime().timestamp():
+        enqueue_stats_refresh(scope_type, scope)
+    return snapshot
+
+
+def mark_stats_stale(scope_type, scope):
+    """Expire a snapshot's freshness so the next read (or the queued job) recomputes it."""
+    if not scope:
+        return
+    snapshot = frappe.cache().get_value(_cache_key(scope_type, scope))
+    if snapshot:
+        snapshot["fresh_until"] = 0
+        frappe.cache().set_value(_cache_key(scope_type, scope), snapshot, expires_in_sec=STATS_MAX_AGE_SEC)
+    enqueue_stats_refresh(scope_type, scope)
+
+
+def _driver_vendor(driver):
+    return frappe.db.get_value("Drivers", driver, "owner_vendor") if driver else None
+
+
+def on_stats_source_change(doc, method=None):
+    """doc_events hook: refresh the snapshots a changed document contributes to."""
+    before = doc.get_doc_before_save() if hasattr(doc, "get_doc_before_save") else None
+    mark_docs_stale([doc, before])
+
+
+def mark_docs_stale(docs):
+    """
+    Refresh the snapshots of every vendor and driver the given documents contribute to, once each.
+    For writes that bypass doc_events (bulk inserts, db.set_value); call after they commit.
+    """
+    vendors, drivers = set(), set()
+
+    def collect(d):
+        if not d:
+            return
+        if d.doctype == "Drivers":
+            drivers.add(d.name)
+            vendors.add(d.get("owner_vendor"))
+        elif d.doctype == "Cars":
+            vendors.add(d.get("belongs_to_vendor"))
+        elif d.doctype == "Payouts":
+            if d.get("payout_to_type") == "Drivers":
+                drivers.add(d.get("payout_to"))
+                vendors.add(_driver_vendor(d.get("payout_to")))
+        elif d.doctype == "Customer Invoice":
+            vendors.add(d.get("vendor"))
+        elif d.doctype == "Bookings Master":
+            drivers.add(d.get("driver"))
+
+    for d in docs:
+        collect(d)
+
+    vendors.discard(None)
+    drivers.discard(None)
+    if vendors:
+        vendors.add(ALL_VENDORS)
+
+    for vendor in vendors:
+        mark_stats_stale("vendor", vendor)
+    for driver in drivers:
+        mark_stats_stale("driver", driver)
+
+
+def get_cached_dashboard_stats():
+    """Dashboard figures for the session user, read from the cached snapshots."""
+    principal = get_linked_principal()
+    roles = principal.roles
+
+    stats = {
+        "active_drivers": 0,
+        "total_vehicles": 0,
+        "pending_payments": 0,
+        "total_earnings": 0,
+        "upcoming_trips": 0,
+        "driver_earnings": 0,
+        "duty_status": "Unknown"
+    }
+    computed_at = []
+
+    if "Vendor" in roles or "System Manager" in roles:
+        vendor = ALL_VENDORS if "System Manager" in roles else principal.vendor
+        if vendor:
+            snapshot = get_stats_snapshot("vendor", vendor)
+            stats.update(snapshot["stats"])
+            computed_at.append(snapshot["computed_at"])
+
+    if "Driver" in roles:
+        if principal.driver:
+            snapshot = get_stats_snapshot("driver", principal.driver)
+            stats.update(snapshot["stats"])
+            computed_at.append(snapshot["computed_at"])
+        else:
+            stats["upcoming_trips"] = 0
+            stats["driver_earnings"] = 0
+            stats["duty_status"] = "Not Found"
+
+    return {"stats": stats, "computed_at": min(computed_at) if computed_at else None}
@@ -0,0 +1,84 @@
+import re
+
+# Keyword weights per fast-path intent; a message is matched on whole words
+INTENT_KEYWORDS = {
+    "estimate_trip_cost": {
+        "price": 3, "prices": 3, "cost": 3, "fare": 3, "fares": 3, "charges": 2, "charge": 2, "rate": 2,
+        "rates": 2, "estimate": 3, "quote": 3, "kitna": 3, "kitne": 3, "budget": 2, "much": 1, "how": 1,
+    },
+    "get_available_cars": {
+        "cars": 3, "car": 2, "fleet": 3, "vehicles": 3, "vehicle": 2, "options": 2, "available": 2,
+        "models": 2, "gaadi": 3, "gadi": 3, "which": 1, "what": 1, "show": 1, "list": 2, "have": 1,
+    },
+}
+
+# Anything that asks for an action, personal details or free-form planning goes to the model
+BLOCK_WORDS = {
+    "book", "booking", "confirm", "reserve", "call", "contact", "callback", "name", "mobile", "phone",
+    "plan", "itinerary", "cancel", "change", "driver", "invoice", "refund", "complaint", "not", "no",
+}
+
+CATEGORY_WORDS = {
+    "sedan": "Sedan", "suv": "SUV", "muv": "SUV", "hatchback": "Hatchback", "luxury": "Luxury",
+    "innova": "Innova", "ertiga": "Ertiga",
+}
+
+MIN_SCORE = 3
+# Longest message the fast path will try; longer ones are rarely simple FAQs
+MAX_WORDS = 16
+
+WORD_RE = re.compile(r"[a-z]+|\d+")
+DAYS_RE = re.compile(r"(\d{1,2})\s*(?:-\s*)?(?:days?|din|nights?)\b")
+PAX_RE = re.compile(r"(\d{1,2})\s*(?:pax|passengers?|people|persons?|log|members|adults|seater)\b")
+ROUTE_RE = re.compile(r"\bfrom\s+([a-z][a-z ]{1,30}?)\s+to\s+([a-z][a-z ]{1,30}?)(?=\s+(?:for|in|with)\b|[?.!,]|$)")
+MOBILE_RE = re.compile(r"\d{10}")
+
+
+def extract_slots(text):
+    """days, passengers, category and from/to cities found in a lowercased message."""
+    slots = {}
+    if match := DAYS_RE.search(text):
+        slots["days"] = int(match.group(1))
+        if match.group(0).rstrip().endswith(("night", "nights")):
+            slots["days"] += 1
+    if match := PAX_RE.search(text):
+        slots["passengers"] = int(match.group(1))
+    for word in WORD_RE.findall(text):
+        if word in CATEGORY_WORDS:
+            slots["category"] = CATEGORY_WORDS[word]
+            break
+    if match := ROUTE_RE.search(text):
+        slots["from_city"], slots["to_city"] = (city.strip().title() for city in match.groups())
+    return slots
+
+
+def detect_intent(message):
+    """
+    Local intent and slot extraction for the SafarBot fast path.
+    Returns (tool_name, tool_args) for a high-confidence price or fleet question, else None.
+    """
+    text = (message or "").lower().strip()
+    words = WORD_RE.findall(text)
+    if not words or len(words) > MAX_WORDS or MOBILE_RE.search(text) or BLOCK_WORDS.intersection(words):
+        return None
+
+    scores = {
+        intent: sum(weights.get(word, 0) for word in words)
+        for intent, weights in INTENT_KEYWORDS.items()
+    }
+    slots = extract_slots(text)
+    if "days" in slots:
+        scores["estimate_trip_cost"] += 2
+
+    intent, score = max(scores.items(), key=lambda item: item[1])
+    runner_up = max(value for key, value in scores.items() if key != intent)
+    if score < MIN_SCORE or score - runner_up < 2:
+        return None
+
+    if intent == "estimate_trip_cost":
+        # The estimate is per number of days; without it the model has to ask
+        if "days" not in slots or not 1 <= slots["days"] <= 30:
+            return None
+        return intent, {k: slots[k] for k in ("days", "passengers", "from_city", "to_city") if k in slots}
+
+    return intent, {k: slots[k] for k in ("passengers", "category") if k in slots}
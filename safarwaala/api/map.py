@@ -1,5 +1,58 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import frappe
-import requests
+from frappe.utils import add_to_date, cint, get_datetime, now_datetime
+from safarwaala.api.map_cache import (
+    STALE_IF_ERROR_SEC,
+    LRUCache,
+    enqueue_refresh,
+    geohash_of,
+    get_stats,
+    incr_stat,
+    is_fresh,
+    needs_refresh,
+    normalize_query,
+    reset_stats,
+    single_flight,
+)
+from safarwaala.api.ola_client import (
+    OlaMapsUnavailable,
+    get_breaker,
+    get_latency_histogram,
+    ola_request,
+    reset_latency_histogram,
+)
+from safarwaala.utils import run_in_site_context
+
+AUTOCOMPLETE_CACHE_PREFIX = "safarwaala:ola:autocomplete:"
+AUTOCOMPLETE_TTL_SEC = 6 * 3600
+AUTOCOMPLETE_LRU_TTL_SEC = 300
+# Precision 5 cells are ~4.9 km, close enough for a search bias point
+AUTOCOMPLETE_GEOHASH_PRECISION = 5
+AUTOCOMPLETE_MIN_PREFIX = 3
+# OLA returns at most this many predictions per autocomplete call
+AUTOCOMPLETE_PAGE_SIZE = 5
+
+DEFAULT_LANDMARKS_KEY = "safarwaala:ola:default_landmarks"
+DEFAULT_LANDMARKS_TTL_SEC = 86400
+DEFAULT_LOCATION = "26.9124,75.7873"  # Jaipur
+
+DIRECTIONS_CACHE_PREFIX = "safarwaala:ola:directions:"
+ROUTE_TTL_SEC = 7 * 86400
+# Precision 7 cells are ~150 m across
+ROUTE_GEOHASH_PRECISION = 7
+MATRIX_MAX_ELEMENTS = 25
+MATRIX_MAX_WORKERS = 8
+
+MAP_CACHE_STATS = [
+    "autocomplete_lru_hit", "autocomplete_redis_hit", "autocomplete_prefix_hit", "autocomplete_miss",
+    "route_redis_hit", "route_db_hit", "route_miss", "route_uncached",
+    "single_flight_coalesced", "single_flight_timeout", "refresh_ahead", "served_stale",
+]
+UPSTREAMS = ["nearbysearch", "autocomplete", "directions"]
+
+_autocomplete_lru = LRUCache(maxsize=2048)
 
 
 def _get_ola_api_key() -> str:
@@ -33,6 +86,147 @@ def _map_prediction(pred: dict) -> dict:
     }
 
 
+def _lru_key(cache_key: str) -> str:
+    return f"{frappe.local.site}|{cache_key}"
+
+
+def _autocomplete_cache_key(query: str, location: str = None, radius=None) -> str:
+    """Normalized text + bias point rounded to a geohash cell + radius."""
+    cell = geohash_of(location, AUTOCOMPLETE_GEOHASH_PRECISION) if location else "-"
+    return f"{AUTOCOMPLETE_CACHE_PREFIX}{cell}:{cint(radius)}:{query}"
+
+
+def _get_cached_predictions(cache_key: str):
+    """(entry, "lru" | "redis") from process memory first, then Redis; (None, None) on a miss."""
+    entry = _autocomplete_lru.get(_lru_key(cache_key))
+    if entry:
+        return entry, "lru"
+
+    entry = frappe.cache().get_value(cache_key)
+    if entry:
+        _autocomplete_lru.set(_lru_key(cache_key), entry, AUTOCOMPLETE_LRU_TTL_SEC)
+        return entry, "redis"
+    return None, None
+
+
+def _set_cached_predictions(cache_key: str, entry: dict):
+    frappe.cache().set_value(cache_key, entry, expires_in_sec=AUTOCOMPLETE_TTL_SEC + STALE_IF_ERROR_SEC)
+    _autocomplete_lru.set(_lru_key(cache_key), entry, AUTOCOMPLETE_LRU_TTL_SEC)
+
+
+def _matches_query(prediction: dict, tokens: list) -> bool:
+    words = normalize_query(f"{prediction.get('main_text')} {prediction.get('description')}").split()
+    return all(any(word.startswith(token) for word in words) for token in tokens)
+
+
+def _predictions_from_prefix(query: str, location: str = None, radius=None):
+    """
+    Answer "jaipu" from a cached, complete result set for "jaip" (or any shorter prefix)
+    by keeping the predictions that still match every typed word.
+    """
+    tokens = query.split()
+    for length in range(len(query) - 1, AUTOCOMPLETE_MIN_PREFIX - 1, -1):
+        prefix = query[:length]
+        if prefix.endswith(" "):
+            continue
+        entry, _source = _get_cached_predictions(_autocomplete_cache_key(prefix, location, radius))
+        if not is_fresh(entry, AUTOCOMPLETE_TTL_SEC) or not entry.get("complete"):
+            continue
+        predictions = [p for p in entry["predictions"] if _matches_query(p, tokens)]
+        if predictions:
+            return predictions
+    return None
+
+
+def _fresh(entry: dict, ttl: int):
+    return entry if is_fresh(entry, ttl) else None
+
+
+def _fetch_or_stale(fetch, stale: dict = None):
+    """Serve the expired entry instead of an error while OLA is down or its circuit is open."""
+    try:
+        return fetch()
+    except OlaMapsUnavailable:
+        if not stale:
+            raise
+        # Drop the error message queued by frappe.throw so the client doesn't see it
+        frappe.clear_last_message()
+        incr_stat("served_stale")
+        return stale
+
+
+def _read_default_landmarks():
+    entry = frappe.cache().get_value(DEFAULT_LANDMARKS_KEY)
+    if isinstance(entry, list):
+        # Written before entries carried fetched_at; treat it as expired but keep it as a fallback
+        entry = {"predictions": entry, "fetched_at": 0}
+    return entry
+
+
+def _fetch_default_landmarks(location: str = None) -> dict:
+    api_key = _get_ola_api_key()
+
+    params = {
+        "layers": "coarse",
+        # "types": "restaurant",
+        "location": location or DEFAULT_LOCATION,
+        "api_key": api_key,
+    }
+
+    data = ola_request(
+        "nearbysearch",
+        "GET",
+        "/places/v1/nearbysearch",
+        params=params,
+        headers={"X-Request-Id": frappe.generate_hash(length=10)},
+        timeout=5,
+    )
+
+    if data.get("status") != "ok":
+        frappe.throw(
+            data.get("error_message") or "OLA Maps returned a non-ok status.",
+            frappe.ValidationError,
+        )
+
+    entry = {
+        "predictions": [_map_prediction(p) for p in data.get("predictions", [])],
+        "fetched_at": time.time(),
+    }
+    frappe.cache().set_value(DEFAULT_LANDMARKS_KEY, entry, expires_in_sec=DEFAULT_LANDMARKS_TTL_SEC + STALE_IF_ERROR_SEC)
+    return entry
+
+
+def _fetch_autocomplete(input: str, location: str = None, radius=None) -> dict:
+    api_key = _get_ola_api_key()
+
+    params = {
+        "input":   input.strip(),
+        "api_key": api_key,
+    }
+    if location:
+        params["location"] = location
+    if radius:
+        params["radius"] = radius
+
+    data = ola_request("autocomplete", "GET", "/places/v1/autocomplete", params=params, timeout=5)
+
+    if data.get("status") != "ok":
+        frappe.throw(
+            data.get("error_message") or "OLA Maps returned a non-ok status.",
+            frappe.ValidationError,
+        )
+
+    raw_predictions = data.get("predictions", [])
+    entry = {
+        "predictions": [_map_prediction(p) for p in raw_predictions],
+        # A short page is everything OLA has for this text, so longer inputs can be filtered from it
+        "complete": len(raw_predictions) < AUTOCOMPLETE_PAGE_SIZE,
+        "fetched_at": time.time(),
+    }
+    _set_cached_predictions(_autocomplete_cache_key(normalize_query(input), location, radius), entry)
+    return entry
+
+
 @frappe.whitelist(allow_guest=True)
 def autocomplete(input: str = "", location: str = None, radius: int = None):
     """
@@ -62,96 +256,113 @@ def autocomplete(input: str = "", location: str = None, radius: int = None):
         }
     """
     if not input or not input.strip():
-        cache_key = "safarwaala:ola:default_landmarks"
-        cached_data = frappe.cache().get_value(cache_key)
-        if cached_data:
-            return {"status": "success", "data": cached_data}
-        
-        api_key = _get_ola_api_key()
-        default_location = location or "26.9124,75.7873" # Default to Jaipur
-        
-        params = {
-            "layers": "coarse",
-            # "types": "restaurant",
-            "location": default_location,
-            "api_key": api_key,
-        }
-        
-        try:
-            response = requests.get(
-                "https://api.olamaps.io/places/v1/nearbysearch",
-                params=params,
-                headers={"X-Request-Id": frappe.generate_hash(length=10)},
-                timeout=5,
-            )
-            response.raise_for_status()
-            data = response.json()
-        except requests.Timeout:
-            frappe.throw("OLA Maps API request timed out.", frappe.ValidationError)
-        except requests.RequestException as exc:
-            frappe.throw(f"OLA Maps API request failed: {exc}", frappe.ValidationError)
-            
-        if data.get("status") != "ok":
-            frappe.throw(
-                data.get("error_message") or "OLA Maps returned a non-ok status.",
-                frappe.ValidationError,
-            )
-            
-        predictions = [_map_prediction(p) for p in data.get("predictions", [])]
-        frappe.cache().set_value(cache_key, predictions, expires_in_sec=86400) # Cache for 24h
-        
+        entry = _read_default_landmarks()
+        if is_fresh(entry, DEFAULT_LANDMARKS_TTL_SEC):
+            if needs_refresh(entry, DEFAULT_LANDMARKS_TTL_SEC):
+                enqueue_refresh("safarwaala.api.map.refresh_default_landmarks", DEFAULT_LANDMARKS_KEY, location=location)
+            return {"status": "success", "data": entry["predictions"]}
+
+        # Every worker sees the expired landmarks at once; only one of them calls OLA
+        entry = _fetch_or_stale(lambda: single_flight(
+            DEFAULT_LANDMARKS_KEY,
+            lambda: _fetch_default_landmarks(location),
+            lambda: _fresh(_read_default_landmarks(), DEFAULT_LANDMARKS_TTL_SEC),
+        ), entry)
+        return {"status": "success", "data": entry["predictions"]}
+
+    query = normalize_query(input)
+    cache_key = _autocomplete_cache_key(query, location, radius)
+    entry, source = _get_cached_predictions(cache_key)
+    if is_fresh(entry, AUTOCOMPLETE_TTL_SEC):
+        incr_stat(f"autocomplete_{source}_hit")
+        if needs_refresh(entry, AUTOCOMPLETE_TTL_SEC):
+            enqueue_refresh("safarwaala.api.map.refresh_autocomplete", cache_key, input=input, location=location, radius=radius)
+        return {"status": "success", "data": entry["predictions"]}
+
+    predictions = _predictions_from_prefix(query, location, radius)
+    if predictions:
+        incr_stat("autocomplete_prefix_hit")
+        _autocomplete_lru.set(_lru_key(cache_key), {"predictions": predictions, "complete": True, "fetched_at": time.time()}, AUTOCOMPLETE_LRU_TTL_SEC)
         return {"status": "success", "data": predictions}
 
-    api_key = _get_ola_api_key()
+    incr_stat("autocomplete_miss")
+    entry = _fetch_or_stale(lambda: single_flight(
+        cache_key,
+        lambda: _fetch_autocomplete(input, location, radius),
+        lambda: _fresh(_get_cached_predictions(cache_key)[0], AUTOCOMPLETE_TTL_SEC),
+    ), entry)
 
-    params = {
-        "input":   input.strip(),
-        "api_key": api_key,
+    return {
+        "status": "success",
+        "data": entry["predictions"],
     }
-    if location:
-        params["location"] = location
-    if radius:
-        params["radius"] = radius
 
-    try:
-        response = requests.get(
-            "https://api.olamaps.io/places/v1/autocomplete",
-            params=params,
-            timeout=5,
-        )
-        response.raise_for_status()
-        data = response.json()
-    except requests.Timeout:
-        frappe.throw("OLA Maps API request timed out.", frappe.ValidationError)
-    except requests.RequestException as exc:
-        frappe.throw(f"OLA Maps API request failed: {exc}", frappe.ValidationError)
 
-    if data.get("status") != "ok":
-        frappe.throw(
-            data.get("error_message") or "OLA Maps returned a non-ok status.",
-            frappe.ValidationError,
-        )
+def refresh_default_landmarks(location: str = None):
+    """Background refresh-ahead for the default landmarks."""
+    entry = _read_default_landmarks()
+    if entry and not needs_refresh(entry, DEFAULT_LANDMARKS_TTL_SEC):
+        return
+    single_flight(DEFAULT_LANDMARKS_KEY, lambda: _fetch_default_landmarks(location))
 
-    data = [_map_prediction(p) for p in data.get("predictions", [])]
 
-    return {
-        "status": "success",
-        "data": data,
+def refresh_autocomplete(input: str, location: str = None, radius=None):
+    """Background refresh-ahead for a hot autocomplete entry."""
+    cache_key = _autocomplete_cache_key(normalize_query(input), location, radius)
+    entry = frappe.cache().get_value(cache_key)
+    if entry and not needs_refresh(entry, AUTOCOMPLETE_TTL_SEC):
+        # Another worker already refreshed it; our in-memory copy was just older
+        return
+    single_flight(cache_key, lambda: _fetch_autocomplete(input, location, radius))
+
+
+@frappe.whitelist()
+def get_map_cache_stats(reset: bool = False):
+    """Site-wide map cache counters, hit ratios and upstream latency (System Manager only)."""
+    frappe.only_for("System Manager")
+    stats = get_stats(MAP_CACHE_STATS)
+    hits = sum(v for k, v in stats.items() if k.startswith("autocomplete_") and k.endswith("_hit"))
+    total = hits + stats["autocomplete_miss"]
+    stats["autocomplete_hit_ratio"] = round(hits / total, 4) if total else 0
+
+    hits = stats["route_redis_hit"] + stats["route_db_hit"]
+    total = hits + stats["route_miss"]
+    stats["route_hit_ratio"] = round(hits / total, 4) if total else 0
+
+    # Latency histograms are site-wide; breaker state is for the worker serving this call
+    stats["upstreams"] = {
+        upstream: dict(get_latency_histogram(upstream), circuit=get_breaker(upstream).state)
+        for upstream in UPSTREAMS
     }
 
+    if cint(reset):
+        reset_stats(MAP_CACHE_STATS)
+        for upstream in UPSTREAMS:
+            reset_latency_histogram(upstream)
+    return stats
 
-@frappe.whitelist(allow_guest=True)
-def directions(origin: str, destination: str):
+
+def _route_key(origin: str, destination: str):
     """
-    Get routing directions between two coordinates via OLA Maps basic directions API.
-    
-    Args:
-        origin (str): Origin point "lat,lng"
-        destination (str): Destination point "lat,lng"
+    Origin and destination rounded to geohash cells, so nearby pickups share a route.
+    None when either is not a "lat,lng" point; such routes are never cached or coalesced.
     """
-    if not origin or not destination:
-        frappe.throw("Both origin and destination coordinates are required", frappe.ValidationError)
-        
+    origin_cell = geohash_of(origin, ROUTE_GEOHASH_PRECISION)
+    destination_cell = geohash_of(destination, ROUTE_GEOHASH_PRECISION)
+    if "-" in (origin_cell, destination_cell):
+        return None
+    return f"{origin_cell}:{destination_cell}"
+
+
+def _route_cache_key(route_key: str) -> str:
+    return f"{DIRECTIONS_CACHE_PREFIX}{route_key}"
+
+
+def _cache_route(route_key: str, entry: dict):
+    frappe.cache().set_value(_route_cache_key(route_key), entry, expires_in_sec=ROUTE_TTL_SEC + STALE_IF_ERROR_SEC)
+
+
+def _fetch_directions(origin: str, destination: str) -> dict:
     api_key = _get_ola_api_key()
     
     params = {
@@ -160,19 +371,15 @@ def directions(origin: str, destination: str):
         "api_key": api_key,
     }
     
-    try:
-        response = requests.post(
-            "https://api.olamaps.io/routing/v1/directions/basic",
-            params=params,
-            headers={"X-Request-Id": frappe.generate_hash(length=10)},
-            timeout=10,
-        )
-        response.raise_for_status()
-        data = response.json()
-    except requests.Timeout:
-        frappe.throw("OLA Maps Directions API request timed out.", frappe.ValidationError)
-    except requests.RequestException as exc:
-        frappe.throw(f"OLA Maps Directions API request failed: {exc}", frappe.ValidationError)
+    # directions/basic is a POST but has no side effects, so it is safe to retry
+    data = ola_request(
+        "directions",
+        "POST",
+        "/routing/v1/directions/basic",
+        params=params,
+        headers={"X-Request-Id": frappe.generate_hash(length=10)},
+        timeout=10,
+    )
         
     if data.get("status") != "SUCCESS":
         frappe.throw(
@@ -187,14 +394,250 @@ def directions(origin: str, destination: str):
     leg = routes[0].get("legs", [{}])[0]
     distance_meters = leg.get("distance", 0)
     duration_seconds = leg.get("duration", 0)
-    
-    return {
-        "status": "success",
+
+    entry = {
         "data": {
             "distance_km": round(distance_meters / 1000, 1) if distance_meters else 0,
             "duration_seconds": duration_seconds,
             "readable_distance": leg.get("readable_distance", f"{round(distance_meters / 1000, 1)} km"),
             "readable_duration": leg.get("readable_duration", ""),
+        },
+        "origin": origin,
+        "destination": destination,
+        "fetched_at": time.time(),
+    }
+    route_key = _route_key(origin, destination)
+    if route_key:
+        _cache_route(route_key, entry)
+    return entry
+
+
+def _get_stored_routes(route_keys: list) -> dict:
+    """{route_key: entry} from the Route Cache table, for keys missing from Redis."""
+    if not route_keys:
+        return {}
+
+    rows = frappe.get_all(
+        "Route Cache",
+        filters={"name": ["in", route_keys]},
+        fields=["name", "origin", "destination", "distance_km", "duration_seconds",
+                "readable_distance", "readable_duration", "fetched_at"],
+        ignore_permissions=True,
+    )
+    now, entries = now_datetime(), {}
+    for row in rows:
+        entry = {
+            "data": {
+                "distance_km": row.distance_km,
+                "duration_seconds": row.duration_seconds,
+                "readable_distance": row.readable_distance,
+                "readable_duration": row.readable_duration,
+            },
+            "origin": row.origin,
+            "destination": row.destination,
+            # Age measured against the DB clock's timezone, then re-anchored to epoch
+            "fetched_at": time.time() - (now - get_datetime(row.fetched_at)).total_seconds(),
+        }
+        _cache_route(row.name, entry)
+        entries[row.name] = entry
+    return entries
+
+
+def _enqueue_store_routes(entries: dict):
+    """Persist freshly fetched routes from a background job, since GET requests are not committed."""
+    if not entries:
+        return
+    frappe.enqueue(
+        "safarwaala.api.map.store_routes",
+        queue="short",
+        routes=[dict(e["data"], route_key=key, origin=e["origin"], destination=e["destination"])
+                for key, e in entries.items()],
+    )
+
+
+def store_routes(routes: list):
+    """Upsert fetched routes into Route Cache with one multi-row statement."""
+    now, user = now_datetime(), frappe.session.user
+    values = []
+    for route in routes:
+        values.extend([
+            route["route_key"], route["route_key"], route.get("origin"), route.get("destination"),
+            route.get("distance_km"), route.get("duration_seconds"),
+            route.get("readable_distance"), route.get("readable_duration"),
+            now, now, now, user, user,
+        ])
+
+    placeholders = ", ".join(["(" + ", ".join(["%s"] * 13) + ", 0)"] * len(routes))
+    frappe.db.sql(f"""
+        INSERT INTO `tabRoute Cache`
+            (name, route_key, origin, destination, distance_km, duration_seconds,
+            readable_distance, readable_duration, fetched_at, creation, modified,
+            owner, modified_by, docstatus)
+        VALUES {placeholders}
+        ON DUPLICATE KEY UPDATE
+            origin = VALUES(origin),
+            destination = VALUES(destination),
+            distance_km = VALUES(distance_km),
+            duration_seconds = VALUES(duration_seconds),
+            readable_distance = VALUES(readable_distance),
+            readable_duration = VALUES(readable_duration),
+            fetched_at = VALUES(fetched_at),
+            modified = VALUES(modified)
+    """, values)
+
+
+def purge_expired_routes():
+    """Daily: drop stored routes well past their TTL."""
+    cutoff = add_to_date(now_datetime(), seconds=-2 * ROUTE_TTL_SEC)
+    frappe.db.delete("Route Cache", {"fetched_at": ["<", cutoff]})
+
+
+def _lookup_routes(route_keys: list) -> dict:
+    """{route_key: entry} from Redis, then Route Cache; counts hits and misses."""
+    entries = {}
+    for key in route_keys:
+        entry = frappe.cache().get_value(_route_cache_key(key))
+        if entry:
+            entries[key] = entry
+    fresh = {k for k, e in entries.items() if is_fresh(e, ROUTE_TTL_SEC)}
+    if fresh:
+        incr_stat("route_redis_hit", len(fresh))
+
+    stored = _get_stored_routes([k for k in route_keys if k not in fresh])
+    stored_fresh = {k for k, e in stored.items() if is_fresh(e, ROUTE_TTL_SEC)}
+    if stored_fresh:
+        incr_stat("route_db_hit", len(stored_fresh))
+    entries.update(stored)
+
+    missing = len(set(route_keys) - fresh - stored_fresh)
+    if missing:
+        incr_stat("route_miss", missing)
+    return entries
+
+
+@frappe.whitelist(allow_guest=True)
+def directions(origin: str, destination: str):
+    """
+    Get routing directions between two coordinates via OLA Maps basic directions API.
+    
+    Args:
+        origin (str): Origin point "lat,lng"
+        destination (str): Destination point "lat,lng"
+    """
+    if not origin or not destination:
+        frappe.throw("Both origin and destination coordinates are required", frappe.ValidationError)
+
+    route_key = _route_key(origin, destination)
+    if not route_key:
+        incr_stat("route_uncached")
+        return {
+            "status": "success",
+            "data": _fetch_directions(origin, destination)["data"],
         }
+
+    entry = _lookup_routes([route_key]).get(route_key)
+    if is_fresh(entry, ROUTE_TTL_SEC):
+        if needs_refresh(entry, ROUTE_TTL_SEC):
+            enqueue_refresh("safarwaala.api.map.refresh_directions", route_key, origin=origin, destination=destination)
+    else:
+        stale = entry
+        entry = _fetch_or_stale(lambda: single_flight(
+            route_key,
+            lambda: _fetch_directions(origin, destination),
+            lambda: _fresh(frappe.cache().get_value(_route_cache_key(route_key)), ROUTE_TTL_SEC),
+        ), stale)
+        if entry is not stale:
+            _enqueue_store_routes({route_key: entry})
+
+    return {
+        "status": "success",
+        "data": entry["data"],
     }
 
+
+def refresh_directions(origin: str, destination: str):
+    """Background refresh-ahead for a hot route."""
+    route_key = _route_key(origin, destination)
+    if not route_key:
+        return
+    entry = frappe.cache().get_value(_route_cache_key(route_key))
+    if entry and not needs_refresh(entry, ROUTE_TTL_SEC):
+        return
+    entry = single_flight(route_key, lambda: _fetch_directions(origin, destination))
+    if entry:
+        store_routes([dict(entry["data"], route_key=route_key, origin=origin, destination=destination)])
+
+
+def _pair_key(origin: str, destination: str):
+    """distance_matrix key for a pair: its route key, or the raw pair when it has none."""
+    return _route_key(origin, destination) or (origin, destination)
+
+
+def _fetch_directions_in_thread(site: str, sites_path: str, origin: str, destination: str):
+    try:
+        return run_in_site_context(site, sites_path, _fetch_directions, origin, destination)
+    except Exception as exc:
+        return exc
+
+
+@frappe.whitelist(allow_guest=True)
+def distance_matrix(origins, destinations):
+    """
+    Distance and duration for every origin x destination pair.
+
+    Pairs are answered from the route cache; only the missing ones are fetched from
+    OLA, in parallel.
+
+    Args:
+        origins      (list | str): "lat,lng" points, as a list or JSON array.
+        destinations (list | str): "lat,lng" points, as a list or JSON array.
+
+    Returns:
+        {"status": "success", "rows": [[{"status": "ok", ...route data} | {"status": "error", "message": str}]]}
+        where rows[i][j] is origins[i] -> destinations[j].
+    """
+    origins = frappe.parse_json(origins) if isinstance(origins, str) else origins
+    destinations = frappe.parse_json(destinations) if isinstance(destinations, str) else destinations
+    if not origins or not destinations:
+        frappe.throw("Both origins and destinations are required", frappe.ValidationError)
+    if len(origins) * len(destinations) > MATRIX_MAX_ELEMENTS:
+        frappe.throw(f"At most {MATRIX_MAX_ELEMENTS} origin/destination pairs per call", frappe.ValidationError)
+
+    pairs = {}
+    for origin in origins:
+        for destination in destinations:
+            pairs.setdefault(_pair_key(origin, destination), (origin, destination))
+
+    # Pairs that are not "lat,lng" points skip the route cache and are always fetched
+    entries = _lookup_routes([key for key in pairs if isinstance(key, str)])
+    missing = [key for key in pairs if not is_fresh(entries.get(key), ROUTE_TTL_SEC)]
+
+    fetched, errors = {}, {}
+    if missing:
+        site, sites_path = frappe.local.site, frappe.local.sites_path
+        with ThreadPoolExecutor(max_workers=min(MATRIX_MAX_WORKERS, len(missing))) as pool:
+            results = pool.map(lambda key: _fetch_directions_in_thread(site, sites_path, *pairs[key]), missing)
+            for key, result in zip(missing, results):
+                if isinstance(result, Exception):
+                    errors[key] = result
+                else:
+                    fetched[key] = result
+        entries.update(fetched)
+        _enqueue_store_routes({key: entry for key, entry in fetched.items() if isinstance(key, str)})
+        uncached = sum(1 for key in fetched if not isinstance(key, str))
+        if uncached:
+            incr_stat("route_uncached", uncached)
+
+    rows = []
+    for origin in origins:
+        row = []
+        for destination in destinations:
+            key = _pair_key(origin, destination)
+            if key in entries:
+                # Falls back to a stale entry when the fetch for it failed
+                row.append(dict(entries[key]["data"], status="ok"))
+            else:
+                row.append({"status": "error", "message": str(errors.get(key) or "No route found")})
+        rows.append(row)
+
+    return {"status": "success", "rows": rows}
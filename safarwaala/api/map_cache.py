@@ -0,0 +1,174 @@
+import hashlib
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+
+import frappe
+
+STATS_KEY_PREFIX = "safarwaala:ola:stats:"
+LOCK_KEY_PREFIX = "safarwaala:ola:lock:"
+
+# Upstream calls hold the single-flight lock for at most this long
+LOCK_TTL_SEC = 15
+# How long a worker waits for another worker's in-flight call before calling upstream itself
+LOCK_WAIT_SEC = 8
+LOCK_POLL_SEC = 0.05
+# Entries read after this fraction of their TTL are refreshed in the background
+REFRESH_AHEAD_RATIO = 0.8
+# Expired entries stay in Redis this much longer, to be served while OLA is down
+STALE_IF_ERROR_SEC = 24 * 3600
+
+# Release the lock only if we still own it
+_RELEASE_LOCK_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+_GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(lat, lng, precision=6):
+    """Standard base32 geohash of a point; precision 5 is a ~4.9 km cell, 6 is ~1.2 km."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    bits, bit_count, even, cells = 0, 0, True, []
+    while len(cells) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            cells.append(_GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(cells)
+
+
+def geohash_of(point, precision=6):
+    """geohash of a "lat,lng" string, or "-" when it is missing, malformed or out of range."""
+    try:
+        lat, lng = (float(part) for part in (point or "").split(","))
+    except ValueError:
+        return "-"
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return "-"
+    return geohash(lat, lng, precision)
+
+
+def normalize_query(text):
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", (text or "").lower())).strip()
+
+
+class LRUCache:
+    """Bounded, thread-safe in-process cache with per-entry expiry."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if not entry:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+def incr_stat(name, amount=1):
+    """Site-wide counter in Redis, shared by all workers."""
+    cache = frappe.cache()
+    cache.incrby(cache.make_key(STATS_KEY_PREFIX + name), amount)
+
+
+def get_stats(names):
+    cache = frappe.cache()
+    return {name: int(cache.get(cache.make_key(STATS_KEY_PREFIX + name)) or 0) for name in names}
+
+
+def reset_stats(names):
+    cache = frappe.cache()
+    for name in names:
+        cache.delete(cache.make_key(STATS_KEY_PREFIX + name))
+
+
+def single_flight(key, fetch, read_cached=None):
+    """
+    Run fetch() for `key` in at most one worker at a time.
+
+    Other workers poll read_cached() until the leader's result shows up in the cache
+    (fetch is expected to store it) and return that instead of calling upstream too.
+    Without read_cached, returns None straight away when another worker holds the lock.
+    """
+    cache = frappe.cache()
+    lock_key = cache.make_key(LOCK_KEY_PREFIX + key)
+    token = frappe.generate_hash(length=12)
+    deadline = time.monotonic() + LOCK_WAIT_SEC
+
+    while True:
+        if cache.set(lock_key, token, nx=True, ex=LOCK_TTL_SEC):
+            try:
+                return fetch()
+            finally:
+                cache.eval(_RELEASE_LOCK_SCRIPT, 1, lock_key, token)
+
+        if read_cached is None:
+            return None
+
+        time.sleep(LOCK_POLL_SEC)
+        value = read_cached()
+        if value is not None:
+            incr_stat("single_flight_coalesced")
+            return value
+
+        if time.monotonic() > deadline:
+            # The leader is stuck or died; don't keep the request waiting any longer
+            incr_stat("single_flight_timeout")
+            return fetch()
+
+
+def is_fresh(entry, ttl):
+    return bool(entry) and time.time() - (entry.get("fetched_at") or 0) < ttl
+
+
+def needs_refresh(entry, ttl):
+    return time.time() - (entry.get("fetched_at") or 0) > ttl * REFRESH_AHEAD_RATIO
+
+
+def enqueue_refresh(method, key, **kwargs):
+    """Refresh a hot entry in the background before it expires; one job per key."""
+    incr_stat("refresh_ahead")
+    frappe.enqueue(
+        method,
+        queue="short",
+        job_id=f"ola_refresh::{frappe.local.site}::{hashlib.md5(key.encode()).hexdigest()}",
+        deduplicate=True,
+        **kwargs,
+    )
@@ -0,0 +1,225 @@
+import random
+import time
+from threading import Lock
+
+import frappe
+import requests
+from requests.adapters import HTTPAdapter
+
+from safarwaala.api.map_cache import STATS_KEY_PREFIX, incr_stat
+
+# Override with `ola_maps_base_url` in site_config.json, e.g. to point at
+# safarwaala/benchmarks/ola_standin.py for load testing
+OLA_BASE_URL = "https://api.olamaps.io"
+
+POOL_CONNECTIONS = 4
+POOL_MAXSIZE = 32
+
+# Idempotent calls are retried on connection errors, 429 and 5xx, within the call's timeout.
+# Read timeouts are not retried: that would hold the worker for several timeouts.
+MAX_RETRIES = 2
+RETRY_BACKOFF_SEC = 0.2
+# A retry is only started with at least this much of the call's timeout left
+MIN_ATTEMPT_SEC = 0.5
+
+# Consecutive failed calls that open an upstream's circuit, and how long it stays open
+FAILURE_THRESHOLD = 5
+RESET_TIMEOUT_SEC = 30
+
+# Upper bounds (ms) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS_MS = [25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class OlaMapsUnavailable(frappe.ValidationError):
+    """OLA Maps could not be reached, kept failing, or its circuit is open."""
+
+
+class CircuitBreaker:
+    """Per-process breaker: closed -> open after repeated failures -> half-open trial call."""
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT_SEC):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0
+        self._lock = Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                # Let exactly one trial call through
+                self.state = "half_open"
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+_session = None
+_session_lock = Lock()
+_breakers = {}
+
+
+def get_session():
+    """Keep-alive Session shared by every request in this worker process."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def get_base_url():
+    return (frappe.conf.get("ola_maps_base_url") or OLA_BASE_URL).rstrip("/")
+
+
+def get_breaker(upstream):
+    key = (frappe.local.site, upstream)
+    if key not in _breakers:
+        _breakers[key] = CircuitBreaker()
+    return _breakers[key]
+
+
+def _latency_key(upstream, suffix):
+    return f"latency:{upstream}:{suffix}"
+
+
+def record_latency(upstream, elapsed_ms):
+    bucket = next((str(b) for b in LATENCY_BUCKETS_MS if elapsed_ms <= b), "inf")
+    cache = frappe.cache()
+    pipe = cache.pipeline()
+    pipe.incrby(cache.make_key(STATS_KEY_PREFIX + _latency_key(upstream, bucket)), 1)
+    pipe.incrby(cache.make_key(STATS_KEY_PREFIX + _latency_key(upstream, "count")), 1)
+    pipe.incrbyfloat(cache.make_key(STATS_KEY_PREFIX + _latency_key(upstream, "sum_ms")), elapsed_ms)
+    pipe.execute()
+
+
+def get_latency_histogram(upstream):
+    """Bucket counts plus mean and bucket-estimated p50/p95/p99 for one upstream."""
+    cache = frappe.cache()
+    labels = [str(b) for b in LATENCY_BUCKETS_MS] + ["inf"]
+    values = cache.mget([cache.make_key(STATS_KEY_PREFIX + _latency_key(upstream, s)) for s in labels + ["count", "sum_ms"]])
+    counts = [int(v or 0) for v in values[:len(labels)]]
+    total, sum_ms = int(values[-2] or 0), float(values[-1] or 0)
+
+    def percentile(p):
+        if not total:
+            return None
+        running = 0
+        for label, count in zip(labels, counts):
+            running += count
+            if running >= total * p:
+                return label
+        return "inf"
+
+    return {
+        "buckets": dict(zip(labels, counts)),
+        "count": total,
+        "mean_ms": round(sum_ms / total, 1) if total else None,
+        "p50_le_ms": percentile(0.50),
+        "p95_le_ms": percentile(0.95),
+        "p99_le_ms": percentile(0.99),
+    }
+
+
+def reset_latency_histogram(upstream):
+    cache = frappe.cache()
+    for suffix in [str(b) for b in LATENCY_BUCKETS_MS] + ["inf", "count", "sum_ms"]:
+        cache.delete(cache.make_key(STATS_KEY_PREFIX + _latency_key(upstream, suffix)))
+
+
+def _record_metric(fn, *args):
+    """Metrics are best effort: a Redis error must not fail (or strand the breaker of) an OLA call."""
+    try:
+        fn(*args)
+    except Exception:
+        pass
+
+
+def ola_request(upstream, method, path, params=None, headers=None, timeout=5, idempotent=True):
+    """
+    Call OLA Maps through the pooled session and return the decoded JSON body.
+
+    upstream names the endpoint for the circuit breaker and latency histogram.
+    timeout is the deadline for the whole call, retries and backoff included.
+    Raises OlaMapsUnavailable when the call cannot be completed (or the circuit is open),
+    and frappe.ValidationError for other HTTP errors such as a bad request.
+    """
+    breaker = get_breaker(upstream)
+    if not breaker.allow():
+        _record_metric(incr_stat, f"circuit_open:{upstream}")
+        frappe.throw(f"OLA Maps {upstream} is temporarily unavailable.", OlaMapsUnavailable)
+
+    attempts = MAX_RETRIES + 1 if idempotent else 1
+    deadline = time.monotonic() + timeout
+    error = None
+    outcome_recorded = False
+    try:
+        for attempt in range(attempts):
+            if attempt:
+                # Full jitter so retrying workers don't hit OLA in lockstep
+                backoff = random.uniform(0, RETRY_BACKOFF_SEC * 2 ** attempt)
+                if time.monotonic() + backoff + MIN_ATTEMPT_SEC > deadline:
+                    break
+                _record_metric(incr_stat, f"retry:{upstream}")
+                time.sleep(backoff)
+
+            start = time.monotonic()
+            try:
+                response = get_session().request(
+                    method, get_base_url() + path, params=params, headers=headers, timeout=deadline - start
+                )
+            except requests.ConnectTimeout as exc:
+                error = f"OLA Maps API request failed: {exc}"
+                continue
+            except requests.Timeout:
+                # OLA is slow rather than unreachable; another attempt would only wait again
+                error = "OLA Maps API request timed out."
+                break
+            except requests.RequestException as exc:
+                error = f"OLA Maps API request failed: {exc}"
+                continue
+            finally:
+                _record_metric(record_latency, upstream, (time.monotonic() - start) * 1000)
+
+            if response.status_code in RETRYABLE_STATUS:
+                error = f"OLA Maps API request failed: HTTP {response.status_code}"
+                continue
+
+            breaker.record_success()
+            outcome_recorded = True
+            try:
+                response.raise_for_status()
+            except requests.RequestException as exc:
+                frappe.throw(f"OLA Maps API request failed: {exc}", frappe.ValidationError)
+            return response.json()
+
+        breaker.record_failure()
+        outcome_recorded = True
+        frappe.throw(error, OlaMapsUnavailable)
+    except Exception:
+        # Anything unexpected (e.g. a bad base URL) still counts against the breaker, so a
+        # half-open trial always ends in success or failure and never leaves it stuck
+        if not outcome_recorded:
+            breaker.record_failure()
+        raise
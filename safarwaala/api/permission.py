@@ -1,18 +1,98 @@
 import frappe
 
+PRINCIPAL_CACHE_PREFIX = "safarwaala:linked_principal:"
+PRINCIPAL_CACHE_TTL = 6 * 3600
+
+def get_linked_principal(user=None):
+    """
+    Resolve a user to their roles and linked Vendors / Drivers / Customer ids.
+    Memoized on `frappe.local` for the request and cached in Redis across requests.
+    Invalidated by `clear_linked_principal_cache` (see doc_events in hooks.py).
+    """
+    if not user:
+        user = frappe.session.user
+
+    request_cache = getattr(frappe.local, "safarwaala_principals", None)
+    if request_cache is None:
+        request_cache = frappe.local.safarwaala_principals = {}
+
+    if user in request_cache:
+        return request_cache[user]
+
+    cache_key = PRINCIPAL_CACHE_PREFIX + user
+    principal = frappe.cache().get_value(cache_key)
+    if not principal:
+        principal = _build_linked_principal(user)
+        frappe.cache().set_value(cache_key, principal, expires_in_sec=PRINCIPAL_CACHE_TTL)
+
+    principal = frappe._dict(principal)
+    request_cache[user] = principal
+    return principal
+
+def _build_linked_principal(user):
+    roles = frappe.get_roles(user)
+    principal = {
+        "user": user,
+        "roles": roles,
+        "is_admin": user == "Administrator" or "System Manager" in roles or "Administrator" in roles,
+        "vendor": None,
+        "driver": None,
+        "customer": None,
+    }
+
+    if user == "Guest":
+        return principal
+
+    # One round trip for all three links instead of a get_value per doctype
+    links = frappe.db.sql("""
+        SELECT 'vendor', name FROM `tabVendors` WHERE linked_user = %(user)s
+        UNION ALL
+        SELECT 'driver', name FROM `tabDrivers` WHERE linked_user = %(user)s
+        UNION ALL
+        SELECT 'customer', name FROM `tabCustomer` WHERE linked_user = %(user)s
+    """, {"user": user})
+
+    for link_type, name in links:
+        if not principal[link_type]:
+            principal[link_type] = name
+
+    return principal
+
+def clear_linked_principal_cache(user):
+    if not user:
+        return
+    frappe.cache().delete_value(PRINCIPAL_CACHE_PREFIX + user)
+    request_cache = getattr(frappe.local, "safarwaala_principals", None)
+    if request_cache:
+        request_cache.pop(user, None)
+
+def invalidate_linked_principal(doc, method=None):
+    """doc_events hook for Drivers, Vendors, Customer and User."""
+    if doc.doctype == "User":
+        clear_linked_principal_cache(doc.name)
+        return
+
+    clear_linked_principal_cache(doc.get("linked_user"))
+
+    # linked_user may have moved from one user to another
+    before = doc.get_doc_before_save() if hasattr(doc, "get_doc_before_save") else None
+    if before and before.get("linked_user") != doc.get("linked_user"):
+        clear_linked_principal_cache(before.get("linked_user"))
+
 def get_linked_user_condition(user):
     if not user:
         user = frappe.session.user
 
     if user == "Administrator":
         return ""
-    if "System Manager" in frappe.get_roles(user):
+    principal = get_linked_principal(user)
+    if "System Manager" in principal.roles:
         return ""
-    if "Vendor" in frappe.get_roles(user):
+    if "Vendor" in principal.roles:
         return ""
 
     # Applies to Customer, Drivers, Vendors where the field is 'linked_user'
-    return f"`linked_user` = '{user}'"
+    return f"`linked_user` = {frappe.db.escape(user)}"
 
 def has_linked_permission(doc, user):
     if not user:
@@ -29,110 +109,95 @@ def has_linked_permission(doc, user):
 def get_outstation_booking_condition(user):
     if not user:
         user = frappe.session.user
-    
-    if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+
+    principal = get_linked_principal(user)
+    if principal.is_admin:
         return ""
 
     conditions = []
 
     # Vendor Check: specific to 'assigned_to'
-    if "Vendor" in frappe.get_roles(user):
-        vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-        if vendor:
-            conditions.append(f"`assigned_to` = '{vendor}'")
-    
+    if "Vendor" in principal.roles and principal.vendor:
+        conditions.append(f"`assigned_to` = {frappe.db.escape(principal.vendor)}")
+
     # Driver Check: specific to 'driver'
-    if "Driver" in frappe.get_roles(user):
-        driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-        if driver:
-            conditions.append(f"`driver` = '{driver}'")
+    if "Driver" in principal.roles and principal.driver:
+        conditions.append(f"`driver` = {frappe.db.escape(principal.driver)}")
 
     # Customer Check: specific to 'customer'
-    if "Customer" in frappe.get_roles(user):
-        customer = frappe.db.get_value("Customer", {"linked_user": user}, "name")
-        if customer:
-            conditions.append(f"`customer` = '{customer}'")
+    if "Customer" in principal.roles and principal.customer:
+        conditions.append(f"`customer` = {frappe.db.escape(principal.customer)}")
 
     if not conditions:
         return "1=0" # Access denied if no role/link matches
-        
+
     return "(" + " OR ".join(conditions) + ")"
 
 def has_outstation_booking_permission(doc, user):
     if not user:
         user = frappe.session.user
 
-    if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+    principal = get_linked_principal(user)
+    if principal.is_admin:
         return True
 
-    allow = False
+    if "Vendor" in principal.roles and principal.vendor and doc.assigned_to == principal.vendor:
+        return True
 
-    if "Vendor" in frappe.get_roles(user):
-        vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-        if vendor and doc.assigned_to == vendor:
-            allow = True
-    
-    if not allow and "Driver" in frappe.get_roles(user):
-        driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-        if driver and doc.driver == driver:
-            allow = True
+    if "Driver" in principal.roles and principal.driver and doc.driver == principal.driver:
+        return True
 
-    if not allow and "Customer" in frappe.get_roles(user):
-        customer = frappe.db.get_value("Customer", {"linked_user": user}, "name")
-        if customer and doc.customer == customer:
-            allow = True
+    if "Customer" in principal.roles and principal.customer and doc.customer == principal.customer:
+        return True
 
-    return allow
+    return False
 
 def get_duty_slip_condition(user):
     if not user:
-         user = frappe.session.user
-    
-    if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+        user = frappe.session.user
+
+    principal = get_linked_principal(user)
+    if principal.is_admin:
         return ""
-        
+
     # Assuming Duty Slips acts similarly or mainly for Drivers
-    # If Vendor also needs to see Duty Slips of their drivers, we'd need to join. 
+    # If Vendor also needs to see Duty Slips of their drivers, we'd need to join.
     # For now, implemented for Driver as requested.
-    
-    if "Driver" in frappe.get_roles(user):
-         driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-         if driver:
-             return f"`driver` = '{driver}'"
-    
+
+    if "Driver" in principal.roles and principal.driver:
+        return f"`driver` = {frappe.db.escape(principal.driver)}"
+
     return "1=0"
 
 def has_duty_slip_permission(doc, user):
-     if not user:
+    if not user:
         user = frappe.session.user
 
-     if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+    principal = get_linked_principal(user)
+    if principal.is_admin:
         return True
-        
-     if "Driver" in frappe.get_roles(user):
-         driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-         if driver and doc.driver == driver:
-             return True
-             
-     return False
+
+    if "Driver" in principal.roles and principal.driver and doc.driver == principal.driver:
+        return True
+
+    return False
 
 def get_driver_condition(user):
     if not user:
         user = frappe.session.user
 
-    if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+    principal = get_linked_principal(user)
+    if principal.is_admin:
         return ""
 
     conditions = []
-    
+
     # Driver sees themselves
-    conditions.append(f"`linked_user` = '{user}'")
-    
+    conditions.append(f"`linked_user` = {frappe.db.escape(user)}")
+
     # Vendor sees their drivers
-    if "Vendor" in frappe.get_roles(user):
-        vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-        if vendor:
-            conditions.append(f"`owner_vendor` = '{vendor}'")
+    if "Vendor" in principal.roles and principal.vendor:
+        conditions.append(f"`owner_vendor` = {frappe.db.escape(principal.vendor)}")
 
     return "(" + " OR ".join(conditions) + ")"
 
@@ -140,7 +205,8 @@ def has_driver_permission(doc, user):
     if not user:
         user = frappe.session.user
 
-    if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+    principal = get_linked_principal(user)
+    if principal.is_admin:
         return True
 
     # Driver Access
@@ -148,10 +214,8 @@ def has_driver_permission(doc, user):
         return True
 
     # Vendor Access
-    if "Vendor" in frappe.get_roles(user):
-        vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-        if vendor and doc.get("owner_vendor") == vendor:
-            return True
+    if "Vendor" in principal.roles and principal.vendor and doc.get("owner_vendor") == principal.vendor:
+        return True
 
     return False
 
@@ -159,42 +223,36 @@ def get_driver_payment_condition(user):
     if not user:
         user = frappe.session.user
 
-    if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+    principal = get_linked_principal(user)
+    if principal.is_admin:
         return ""
 
     conditions = []
-    
-    if "Vendor" in frappe.get_roles(user):
-        vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-        if vendor:
-            conditions.append(f"`vendor` = '{vendor}'")
 
-    if "Driver" in frappe.get_roles(user):
-        driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-        if driver:
-            conditions.append(f"`driver` = '{driver}'")
+    if "Vendor" in principal.roles and principal.vendor:
+        conditions.append(f"`vendor` = {frappe.db.escape(principal.vendor)}")
+
+    if "Driver" in principal.roles and principal.driver:
+        conditions.append(f"`driver` = {frappe.db.escape(principal.driver)}")
 
     if not conditions:
         return "1=0"
-        
+
     return "(" + " OR ".join(conditions) + ")"
 
 def has_driver_payment_permission(doc, user):
     if not user:
         user = frappe.session.user
 
-    if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+    principal = get_linked_principal(user)
+    if principal.is_admin:
+        return True
+
+    if "Vendor" in principal.roles and principal.vendor and doc.vendor == principal.vendor:
         return True
 
-    if "Vendor" in frappe.get_roles(user):
-        vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-        if vendor and doc.vendor == vendor:
-            return True
-            
-    if "Driver" in frappe.get_roles(user):
-        driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-        if driver and doc.driver == driver:
-            return True
+    if "Driver" in principal.roles and principal.driver and doc.driver == principal.driver:
+        return True
 
     return False
 
@@ -202,61 +260,49 @@ def has_driver_payment_permission(doc, user):
 def get_bookings_master_condition(user):
     if not user:
         user = frappe.session.user
-    
-    if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+
+    principal = get_linked_principal(user)
+    if principal.is_admin:
         return ""
 
     conditions = []
 
     # Vendor Check: specific to 'assigned_to'
-    if "Vendor" in frappe.get_roles(user):
-        vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-        if vendor:
-            conditions.append(f"`assigned_to` = '{vendor}'")
-    
+    if "Vendor" in principal.roles and principal.vendor:
+        conditions.append(f"`assigned_to` = {frappe.db.escape(principal.vendor)}")
+
     # Driver Check: specific to 'driver'
-    if "Driver" in frappe.get_roles(user):
-        driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-        if driver:
-            conditions.append(f"`driver` = '{driver}'")
+    if "Driver" in principal.roles and principal.driver:
+        conditions.append(f"`driver` = {frappe.db.escape(principal.driver)}")
 
     # Customer Check: specific to 'customer'
-    if "Customer" in frappe.get_roles(user):
-        customer = frappe.db.get_value("Customer", {"linked_user": user}, "name")
-        if customer:
-            conditions.append(f"`customer` = '{customer}'")
+    if "Customer" in principal.roles and principal.customer:
+        conditions.append(f"`customer` = {frappe.db.escape(principal.customer)}")
 
     if not conditions:
         return "1=0"
-        
+
     return "(" + " OR ".join(conditions) + ")"
 
 def has_bookings_master_permission(doc, user=None, permission_type=None):
     if not user:
         user = frappe.session.user
 
-    if "System Manager" in frappe.get_roles(user) or "Administrator" in frappe.get_roles(user):
+    principal = get_linked_principal(user)
+    if principal.is_admin:
         return True
-    
+
     # Allow creation if standard role permissions pass
     if doc.is_new() or permission_type == "create":
         return True
 
-    allow = False
+    if "Vendor" in principal.roles and principal.vendor and doc.assigned_to == principal.vendor:
+        return True
 
-    if "Vendor" in frappe.get_roles(user):
-        vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-        if vendor and doc.assigned_to == vendor:
-            allow = True
-    
-    if not allow and "Driver" in frappe.get_roles(user):
-        driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
-        if driver and doc.driver == driver:
-            allow = True
+    if "Driver" in principal.roles and principal.driver and doc.driver == principal.driver:
+        return True
 
-    if not allow and "Customer" in frappe.get_roles(user):
-        customer = frappe.db.get_value("Customer", {"linked_user": user}, "name")
-        if customer and doc.customer == customer:
-            allow = True
+    if "Customer" in principal.roles and principal.customer and doc.customer == principal.customer:
+        return True
 
-    return allow
+    return False
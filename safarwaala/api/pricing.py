@@ -0,0 +1,207 @@
+import frappe
+from frappe.utils import ceil, flt, get_datetime, time_diff_in_hours
+
+from safarwaala.api.rate_card import get_car_modal, get_rate_card, get_rate_card_version
+
+# Booking rate field -> Car Modals rate-card field, per booking type
+RATE_FIELDS = {
+    "Local": {
+        "min_hours": "min_local_hour",
+        "min_km": "min_local_km",
+        "per_hour_rate": "local_hour_rate",
+        "per_km_rate": "local_km_rate",
+        "night_rate": "night_rate",
+    },
+    "Outstation": {
+        "min_km": None,  # derived from min_km_day x days unless set on the booking
+        "min_km_day": "min_km_day",
+        "per_km_rate": "per_km_rate",
+        "night_rate": "night_rate",
+    },
+    "Fixed": {
+        "night_rate": "night_rate",
+    },
+}
+
+# Fields each booking type writes back onto Bookings Master
+BOOKING_FIELDS = {
+    "Local": ["total_km", "base_amount", "extra_hour_charges", "extra_km_charges"],
+    "Outstation": ["min_km", "total_km", "base_amount", "night_charges", "extra_km_charges", "extra_hour_charges"],
+    "Fixed": ["total_km", "night_charges", "min_hours", "min_km", "per_hour_rate", "per_km_rate",
+              "base_amount", "extra_km_charges", "extra_hour_charges"],
+}
+
+QUOTE_CARD_FIELDS = ["name", "modal_name", "category", "seating_capacity", "luggage_capacity", "fuel_type", "transmission"]
+
+# Per-process column cache, keyed by site: {site: (version, {booking_type: columns})}
+_rate_columns = {}
+
+
+def get_trip_metrics(booking_type, pickup_datetime=None, return_datetime=None, start_km=None, end_km=None, distance_km=None):
+    """
+    Trip quantities every car is priced on: total_km, hours, days and nights.
+    distance_km (an estimate, for quotes) is used when there are no odometer readings.
+    """
+    metrics = frappe._dict(has_dates=bool(pickup_datetime and return_datetime), hours=0, days=0, nights=0)
+
+    if booking_type == "Outstation":
+        metrics.total_km = max(flt(end_km) - flt(start_km), 0)
+    elif start_km is not None and end_km is not None:
+        metrics.total_km = max(flt(end_km) - flt(start_km), 0)
+    else:
+        metrics.total_km = 0
+    if distance_km is not None and start_km is None and end_km is None:
+        metrics.total_km = max(flt(distance_km), 0)
+
+    if metrics.has_dates:
+        pickup, drop = get_datetime(pickup_datetime), get_datetime(return_datetime)
+        metrics.hours = max(time_diff_in_hours(drop, pickup), 0)
+        metrics.days = max(ceil((drop - pickup).total_seconds() / (24 * 3600)), 1)
+        metrics.nights = max(metrics.days - 1, 0)
+    return metrics
+
+
+def price_columns(booking_type, metrics, rates, night_charges=0):
+    """
+    Price n cars at once. `rates` maps each RATE_FIELDS name to a column (list) of n values;
+    returns the BOOKING_FIELDS columns plus `fare` (charges before expenses and taxes).
+    Returns None for an Outstation trip without pickup/return datetimes.
+    """
+    n = len(next(iter(rates.values())))
+    total_km = flt(metrics.total_km)
+
+    if booking_type == "Local":
+        min_hours = [flt(v) for v in rates["min_hours"]]
+        hour_rates = [flt(v) for v in rates["per_hour_rate"]]
+        min_km = [flt(v) for v in rates["min_km"]]
+        km_rates = [flt(v) for v in rates["per_km_rate"]]
+
+        base = [h * r for h, r in zip(min_hours, hour_rates)]
+        extra_hours = [max(flt(metrics.hours) - h, 0) * r for h, r in zip(min_hours, hour_rates)]
+        extra_km = [max(total_km - k, 0) * r for k, r in zip(min_km, km_rates)]
+        # Local night charges are entered by hand, not derived from night_rate
+        nights = [flt(night_charges)] * n
+        fare = [(b + c) + (h + k) for b, c, h, k in zip(base, nights, extra_hours, extra_km)]
+        return {
+            "total_km": [total_km] * n,
+            "base_amount": base,
+            "extra_hour_charges": extra_hours,
+            "extra_km_charges": extra_km,
+            "night_charges": nights,
+            "fare": fare,
+        }
+
+    if booking_type == "Outstation":
+        if not metrics.has_dates:
+            return None
+        min_km = [flt(k) if k else flt(d) * metrics.days for k, d in zip(rates["min_km"], rates["min_km_day"])]
+        base = [max(total_km, k) * flt(r) for k, r in zip(min_km, rates["per_km_rate"])]
+        nights = [metrics.nights * flt(r) for r in rates["night_rate"]]
+        return {
+            "min_km": min_km,
+            "total_km": [total_km] * n,
+            "base_amount": base,
+            "night_charges": nights,
+            "extra_km_charges": [0] * n,
+            "extra_hour_charges": [0] * n,
+            "fare": [b + c for b, c in zip(base, nights)],
+        }
+
+    if booking_type == "Fixed":
+        # grand_total is the vendor-entered price; km and nights are informational
+        result = {field: [0] * n for field in BOOKING_FIELDS["Fixed"]}
+        result["total_km"] = [total_km] * n
+        result["night_charges"] = [metrics.nights * flt(r) for r in rates["night_rate"]] if metrics.has_dates else None
+        result["fare"] = None
+        return result
+
+    frappe.throw(f"Unsupported booking type: {booking_type}", frappe.ValidationError)
+
+
+def get_rate_columns(booking_type):
+    """Rate card as columns for one booking type, cheapest first; rebuilt when the rate card changes."""
+    version = get_rate_card_version()
+    cached = _rate_columns.get(frappe.local.site)
+    if not cached or cached[0] != version:
+        cached = (version, {})
+        _rate_columns[frappe.local.site] = cached
+
+    columns = cached[1].get(booking_type)
+    if columns is None:
+        cards = list(get_rate_card().values())
+        columns = {"cards": cards}
+        for field, card_field in RATE_FIELDS[booking_type].items():
+            columns[field] = [card.get(card_field) if card_field else None for card in cards]
+        cached[1][booking_type] = columns
+    return columns
+
+
+def price_booking(doc):
+    """Charge fields for a single booking, from the rates already resolved on it."""
+    booking_type = doc.booking_type
+    if booking_type not in RATE_FIELDS:
+        return {}
+
+    metrics = get_trip_metrics(booking_type, doc.pickup_datetime, doc.return_datetime, doc.start_km, doc.end_km)
+    rates = {field: [doc.get(field)] for field in RATE_FIELDS[booking_type]}
+    if booking_type == "Outstation":
+        min_km_day = doc.get("_min_km_day")
+        if not min_km_day and doc.car_modal:
+            min_km_day = (get_car_modal(doc.car_modal) or {}).get("min_km_day")
+        rates["min_km_day"] = [min_km_day]
+
+    result = price_columns(booking_type, metrics, rates, night_charges=doc.night_charges)
+    if result is None:
+        return {}
+    return {field: result[field][0] for field in BOOKING_FIELDS[booking_type] if result[field] is not None}
+
+
+@frappe.whitelist(allow_guest=True)
+def get_quotes(booking_type="Outstation", pickup_datetime=None, return_datetime=None, distance_km=None,
+               start_km=None, end_km=None, passengers=None, night_charges=0):
+    """
+    Price every Car Modal for one trip.
+
+    Args:
+        booking_type (str): "Local" or "Outstation".
+        pickup_datetime / return_datetime (str): trip window; required for Outstation.
+        distance_km (float): estimated trip distance, used when no km readings are given.
+        start_km / end_km (float): odometer readings, if known.
+        passengers (int): only cars seating at least this many.
+        night_charges (float): manual night charges for Local trips.
+
+    Returns:
+        {"booking_type", "trip": {total_km, hours, days, nights}, "quotes": [{car fields, rates, charges, fare}]}
+        with quotes ordered by fare, cheapest first.
+    """
+    if booking_type not in ("Local", "Outstation"):
+        frappe.throw("Quotes are available for Local and Outstation trips", frappe.ValidationError)
+
+    start_km = flt(start_km) if start_km not in (None, "") else None
+    end_km = flt(end_km) if end_km not in (None, "") else None
+    distance_km = flt(distance_km) if distance_km not in (None, "") else None
+    metrics = get_trip_metrics(booking_type, pickup_datetime, return_datetime, start_km, end_km, distance_km)
+    if booking_type == "Outstation" and not metrics.has_dates:
+        frappe.throw("Pickup and return datetimes are required for Outstation quotes", frappe.ValidationError)
+
+    columns = get_rate_columns(booking_type)
+    rates = {field: columns[field] for field in RATE_FIELDS[booking_type]}
+    charges = price_columns(booking_type, metrics, rates, night_charges=night_charges)
+
+    min_seats = flt(passengers)
+    quotes = []
+    for i, card in enumerate(columns["cards"]):
+        if min_seats and flt(card.seating_capacity) < min_seats:
+            continue
+        quote = {field: card.get(field) for field in QUOTE_CARD_FIELDS}
+        quote["car_modal"] = quote.pop("name")
+        quote.update({field: rates[field][i] for field in rates})
+        quote.update({field: values[i] for field, values in charges.items()})
+        quotes.append(quote)
+
+    quotes.sort(key=lambda q: q["fare"])
+    return {
+        "booking_type": booking_type,
+        "trip": {k: metrics[k] for k in ("total_km", "hours", "days", "nights")},
+        "quotes": quotes,
+    }
@@ -0,0 +1,213 @@
+import re
+from collections import defaultdict
+
+import frappe
+
+RATE_CARD_VERSION_KEY = "safarwaala:rate_card_version"
+
+RATE_CARD_FIELDS = [
+    "name", "modal_name", "aliases", "category", "transmission", "fuel_type",
+    "seating_capacity", "luggage_capacity",
+    "per_km_rate", "min_km_day", "night_rate",
+    "min_local_hour", "local_hour_rate", "local_km_rate", "min_local_km",
+]
+
+# Words customers use for a category, indexed alongside each card's own category
+CATEGORY_ALIASES = {
+    "Sedan": ["sedan", "small car", "cab", "taxi"],
+    "SUV": ["suv", "muv", "big car", "large car", "innova", "ertiga"],
+    "Hatchback": ["hatchback", "hatch", "small car"],
+    "Luxury": ["luxury", "premium"],
+}
+
+# How much a match on each kind of term counts; a car's own name beats its category
+TERM_WEIGHTS = {"name": 1.0, "category": 0.9, "category_alias": 0.8}
+MIN_MATCH_SCORE = 0.45
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+# Words that say nothing about which car is meant
+STOP_WORDS = {"a", "an", "the", "car", "cars", "any", "one", "type", "model", "please", "want", "need", "book", "with", "for"}
+
+# Per-process caches, keyed by site: {site: (version, cards)} and {site: (version, CarIndex)}
+_rate_cards = {}
+_car_indexes = {}
+
+
+def get_rate_card_version():
+    """Current rate-card version from Redis, read at most once per request."""
+    version = getattr(frappe.local, "safarwaala_rate_card_version", None)
+    if version:
+        return version
+
+    version = frappe.cache().get_value(RATE_CARD_VERSION_KEY)
+    if not version:
+        version = bump_rate_card_version()
+    frappe.local.safarwaala_rate_card_version = version
+    return version
+
+
+def bump_rate_card_version():
+    """Invalidate every worker's in-memory rate card."""
+    version = frappe.generate_hash(length=12)
+    frappe.cache().set_value(RATE_CARD_VERSION_KEY, version)
+    frappe.local.safarwaala_rate_card_version = version
+    return version
+
+
+def bump_rate_card_version_after_commit():
+    """Called from Car Modals on change; bump once the new rates are visible to other workers."""
+    frappe.local.safarwaala_rate_card_version = None
+    _rate_cards.pop(frappe.local.site, None)
+    _car_indexes.pop(frappe.local.site, None)
+    frappe.db.after_commit.add(bump_rate_card_version)
+
+
+def get_rate_card():
+    """
+    All Car Modals as {name: frappe._dict}, ordered by per_km_rate ascending.
+    Served from process memory; reloaded only when the Redis version changes.
+    """
+    version = get_rate_card_version()
+    cached = _rate_cards.get(frappe.local.site)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    rows = frappe.get_all(
+        "Car Modals",
+        fields=RATE_CARD_FIELDS,
+        order_by="per_km_rate asc, name asc",
+        ignore_permissions=True,
+    )
+    cards = {row.name: row for row in rows}
+    _rate_cards[frappe.local.site] = (version, cards)
+    return cards
+
+
+def get_car_modal(name):
+    """Rate-card entry for a single Car Modal, or None."""
+    if not name:
+        return None
+    return get_rate_card().get(name)
+
+
+def filter_car_modals(min_seats=None, categories=None, name_contains=None):
+    """Rate-card entries matching the given filters, cheapest first."""
+    categories = {c.lower() for c in categories} if categories else None
+    needle = name_contains.lower() if name_contains else None
+
+    result = []
+    for card in get_rate_card().values():
+        if min_seats and (card.seating_capacity or 0) < min_seats:
+            continue
+        if categories and (card.category or "").lower() not in categories:
+            continue
+        if needle and needle not in card.name.lower() and needle not in (card.modal_name or "").lower():
+            continue
+        result.append(card)
+    return result
+
+
+def trigrams(word):
+    """Trigrams of a word padded so that its start and end count, e.g. innova -> $$i $in inn ... va$."""
+    padded = f"$${word}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def words_of(text):
+    return [word for word in WORD_RE.findall((text or "").lower()) if word not in STOP_WORDS]
+
+
+class CarIndex:
+    """
+    In-memory trigram index over each Car Modal's name, aliases and category.
+    Every word of a query is matched by trigram similarity (Dice), so typos such as
+    "inova" still find "Innova"; a card scores its best word match.
+    """
+
+    def __init__(self, cards):
+        self.cards = list(cards)
+        self.words = []  # word -> trigrams, by word id
+        self.word_ids = {}
+        self.postings = defaultdict(set)  # trigram -> word ids
+        self.terms = defaultdict(dict)  # word id -> {card position: weight}
+
+        for position, card in enumerate(self.cards):
+            names = [card.modal_name, card.name] + re.split(r"[,\n]", card.get("aliases") or "")
+            self._add(position, names, TERM_WEIGHTS["name"])
+            self._add(position, [card.category], TERM_WEIGHTS["category"])
+            self._add(position, CATEGORY_ALIASES.get(card.category, []), TERM_WEIGHTS["category_alias"])
+
+    def _add(self, position, texts, weight):
+        for text in texts:
+            for word in words_of(text):
+                word_id = self.word_ids.get(word)
+                if word_id is None:
+                    word_id = self.word_ids[word] = len(self.words)
+                    self.words.append(trigrams(word))
+                    for gram in self.words[word_id]:
+                        self.postings[gram].add(word_id)
+                weights = self.terms[word_id]
+                weights[position] = max(weights.get(position, 0), weight)
+
+    def _match_word(self, word):
+        """{card position: best weighted similarity} for one query word."""
+        grams = trigrams(word)
+        shared = defaultdict(int)
+        for gram in grams:
+            for word_id in self.postings.get(gram, ()):
+                shared[word_id] += 1
+
+        scores = {}
+        for word_id, count in shared.items():
+            similarity = 2 * count / (len(grams) + len(self.words[word_id]))
+            for position, weight in self.terms[word_id].items():
+                score = similarity * weight
+                if score > scores.get(position, 0):
+                    scores[position] = score
+        return scores
+
+    def search(self, query, min_seats=None, min_score=MIN_MATCH_SCORE):
+        """Cards matching `query`, best first, as [(card, score)]; cheaper cards win ties."""
+        words = words_of(query)
+        if not words:
+            return []
+
+        best, total = defaultdict(float), defaultdict(float)
+        for word in words:
+            for position, score in self._match_word(word).items():
+                best[position] = max(best[position], score)
+                total[position] += score
+
+        results = []
+        for position, score in best.items():
+            card = self.cards[position]
+            if score < min_score or (min_seats and (card.seating_capacity or 0) < min_seats):
+                continue
+            # Cards matching more of the query's words rank higher among equal best matches
+            results.append((-score, -total[position], position))
+        results.sort()
+        return [(self.cards[position], -score) for score, _total, position in results]
+
+
+def get_car_index():
+    """Trigram index over the rate card; rebuilt when the rate card changes."""
+    version = get_rate_card_version()
+    cached = _car_indexes.get(frappe.local.site)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    index = CarIndex(get_rate_card().values())
+    _car_indexes[frappe.local.site] = (version, index)
+    return index
+
+
+def search_car_modals(query, min_seats=None, within=None):
+    """
+    Rate-card entries matching a free-text car name or category, best match first.
+    within: only keep matches scoring at most this far below the best one.
+    """
+    matches = get_car_index().search(query, min_seats=min_seats)
+    if matches and within is not None:
+        top = matches[0][1]
+        matches = [(card, score) for card, score in matches if top - score <= within]
+    return [card for card, _score in matches]
@@ -0,0 +1,264 @@
+import json
+
+import frappe
+from frappe.utils import cint, flt
+
+from safarwaala.api.pricing import BOOKING_FIELDS, RATE_FIELDS, get_trip_metrics, price_columns
+from safarwaala.api.rate_card import get_rate_card
+
+REPRICE_CHUNK_SIZE = 500
+REPORT_CACHE_PREFIX = "safarwaala:reprice_report:"
+REPORT_TTL_SEC = 24 * 3600
+PREVIOUS_RATES_PREFIX = "safarwaala:previous_rates:"
+# Past values remembered per rate-card field
+PREVIOUS_RATES_KEPT = 10
+
+# Booking types whose charges come from the rate card (Fixed bookings carry a vendor price)
+REPRICED_TYPES = ["Local", "Outstation"]
+
+READ_FIELDS = [
+    "name", "booking_type", "car_modal", "pickup_datetime", "return_datetime", "start_km", "end_km",
+    "min_hours", "min_km", "per_hour_rate", "per_km_rate", "night_rate",
+    "total_km", "base_amount", "night_charges", "extra_hour_charges", "extra_km_charges",
+    "billable_expense_total", "tax_total", "grand_total",
+]
+
+
+def card_rate_fields():
+    return sorted({card_field for fields in RATE_FIELDS.values() for card_field in fields.values() if card_field})
+
+
+def remember_previous_rates(doc):
+    """
+    Called from Car Modals on_update: remember the rates a card had before this change, so
+    reprice_row can tell values copied from the card apart from values set by hand.
+    """
+    before = doc.get_doc_before_save()
+    if not before:
+        return
+    key = PREVIOUS_RATES_PREFIX + doc.name
+    history = frappe.cache().get_value(key) or {}
+    changed = False
+    for card_field in card_rate_fields():
+        old = before.get(card_field)
+        if flt(old) == flt(doc.get(card_field)):
+            continue
+        values = [v for v in history.get(card_field, []) if flt(v) != flt(old)]
+        history[card_field] = (values + [old])[-PREVIOUS_RATES_KEPT:]
+        changed = True
+    if changed:
+        frappe.cache().set_value(key, history)
+
+
+def get_previous_rates(car_modal):
+    return frappe.cache().get_value(PREVIOUS_RATES_PREFIX + car_modal) or {}
+
+
+def _from_card(stored, current, previous):
+    """Whether a stored booking value was filled from the card (is empty, current, or a past card value)."""
+    if not flt(stored):
+        return True
+    return flt(stored) == flt(current) or any(flt(stored) == flt(v) for v in previous)
+
+
+def reprice_row(row, card, previous=None):
+    """
+    New rate and charge values for one draft booking row, applying the current rate card.
+    Only rates still holding a card value (current or past) are replaced; rates set by hand
+    on the draft are kept and returned separately as {field: value}.
+    """
+    booking_type = row.booking_type
+    previous = previous or {}
+    metrics = get_trip_metrics(booking_type, row.pickup_datetime, row.return_datetime, row.start_km, row.end_km)
+
+    values, manual = {}, {}
+    for field, card_field in RATE_FIELDS[booking_type].items():
+        if not card_field or field == "min_km_day":
+            continue
+        if _from_card(row.get(field), card.get(card_field), previous.get(card_field, [])):
+            values[field] = card.get(card_field)
+        else:
+            manual[field] = row.get(field)
+
+    rates = {field: [values[field] if field in values else row.get(field)] for field in RATE_FIELDS[booking_type]}
+    if booking_type == "Outstation":
+        # min_km was derived from min_km_day; derive it again unless it was set by hand
+        derived = [flt(day_km) * metrics.days for day_km in [card.min_km_day] + previous.get("min_km_day", [])]
+        if not flt(row.min_km) or flt(row.min_km) in derived:
+            rates["min_km"] = [None]
+        else:
+            manual["min_km"] = row.min_km
+            rates["min_km"] = [row.min_km]
+        rates["min_km_day"] = [card.min_km_day]
+
+    charges = price_columns(booking_type, metrics, rates, night_charges=row.night_charges)
+    if charges is not None:
+        values.update({field: charges[field][0] for field in BOOKING_FIELDS[booking_type]})
+
+    # Same arithmetic as BookingsMaster.calculate_totals
+    term_total = flt(values.get("base_amount", row.base_amount)) + flt(values.get("night_charges", row.night_charges))
+    if booking_type == "Local":
+        term_total += flt(values.get("extra_hour_charges", row.extra_hour_charges)) + flt(values.get("extra_km_charges", row.extra_km_charges))
+    values["grand_total"] = term_total + flt(row.billable_expense_total) + flt(row.tax_total)
+    return values, manual
+
+
+def diff_row(row, values):
+    return {field: [row.get(field), value] for field, value in values.items() if flt(row.get(field)) != flt(value)}
+
+
+def write_changes(changes):
+    """Apply {booking: {field: new_value}} with one UPDATE per chunk, CASE-ing on name per field."""
+    if not changes:
+        return
+
+    names = list(changes)
+    fields = sorted({field for values in changes.values() for field in values})
+    assignments, params = [], []
+    for field in fields:
+        cases = []
+        for name in names:
+            if field in changes[name]:
+                cases.append("WHEN %s THEN %s")
+                params.extend([name, changes[name][field]])
+        assignments.append(f"`{field}` = CASE `name` {' '.join(cases)} ELSE `{field}` END")
+
+    params.append(frappe.utils.now())
+    params.extend(names)
+    frappe.db.sql(f"""
+        UPDATE `tabBookings Master`
+        SET {", ".join(assignments)}, `modified` = %s
+        WHERE `name` IN ({", ".join(["%s"] * len(names))}) AND docstatus = 0
+    """, params)
+
+
+@frappe.whitelist()
+def reprice_bookings(car_modals=None, dry_run=1, chunk_size=None):
+    """
+    Re-apply the current Car Modals rate card to draft Local/Outstation bookings in the background.
+    car_modals: JSON string or list of Car Modals names; all modals when empty.
+    dry_run: only build the diff report (default), nothing is written.
+    Rates set by hand on a draft are kept and listed under `kept_manual` in the report.
+    Progress is published on the `reprice_bookings_progress` realtime event; the full
+    report can be fetched with get_reprice_report(job_id).
+    """
+    frappe.only_for("System Manager")
+    if isinstance(car_modals, str):
+        car_modals = json.loads(car_modals) if car_modals.startswith("[") else [car_modals]
+
+    filters = {"docstatus": 0, "booking_type": ["in", REPRICED_TYPES]}
+    if car_modals:
+        filters["car_modal"] = ["in", car_modals]
+    else:
+        filters["car_modal"] = ["is", "set"]
+    total = frappe.db.count("Bookings Master", filters)
+    if not total:
+        return {"success": False, "message": "No draft bookings matched"}
+
+    job_id = frappe.generate_hash(length=10)
+    frappe.enqueue(
+        "safarwaala.api.repricing.reprice_bookings_job",
+        queue="long",
+        timeout=4 * 3600,
+        job_id=f"reprice_bookings::{job_id}",
+        car_modals=car_modals or None,
+        dry_run=cint(dry_run),
+        chunk_size=cint(chunk_size) or REPRICE_CHUNK_SIZE,
+        progress_id=job_id,
+    )
+
+    action = "Checking" if cint(dry_run) else "Repricing"
+    return {"success": True, "message": f"{action} {total} draft bookings in the background.", "data": {"job_id": job_id, "total": total}}
+
+
+def reprice_bookings_job(car_modals=None, dry_run=1, chunk_size=REPRICE_CHUNK_SIZE, progress_id=None):
+    """
+    Background job for `reprice_bookings`. Walks matching drafts in name order, one chunk per
+    transaction: rows are read with a single SELECT, priced with the pricing engine and
+    written back with a single UPDATE. Returns the diff report.
+    """
+    cards = get_rate_card()
+    conditions = ["docstatus = 0", "booking_type IN %(types)s", "name > %(after)s"]
+    values = {"types": tuple(REPRICED_TYPES), "after": "", "limit": chunk_size}
+    if car_modals:
+        conditions.append("car_modal IN %(car_modals)s")
+        values["car_modals"] = tuple(car_modals)
+    else:
+        conditions.append("IFNULL(car_modal, '') != ''")
+
+    report = {"job_id": progress_id, "dry_run": bool(dry_run), "processed": 0, "changed": 0, "grand_total_delta": 0, "bookings": []}
+    previous_rates = {}
+
+    while True:
+        rows = frappe.db.sql(f"""
+            SELECT {", ".join(f"`{f}`" for f in READ_FIELDS)}
+            FROM `tabBookings Master`
+            WHERE {" AND ".join(conditions)}
+            ORDER BY name
+            LIMIT %(limit)s
+        """, values, as_dict=True)
+        if not rows:
+            break
+        values["after"] = rows[-1].name
+
+        changes, chunk_report = {}, []
+        for row in rows:
+            card = cards.get(row.car_modal)
+            if not card:
+                chunk_report.append({"booking": row.name, "car_modal": row.car_modal, "error": "Car Modal not found"})
+                continue
+            if row.car_modal not in previous_rates:
+                previous_rates[row.car_modal] = get_previous_rates(row.car_modal)
+            values, manual = reprice_row(row, card, previous_rates[row.car_modal])
+            diff = diff_row(row, values)
+            if not diff and not manual:
+                continue
+            entry = {"booking": row.name, "car_modal": row.car_modal, "changes": diff, "grand_total_delta": 0}
+            if manual:
+                # Hand-set rates are kept; listed so they can be reviewed
+                entry["kept_manual"] = manual
+            if diff:
+                changes[row.name] = {field: new for field, (_old, new) in diff.items()}
+                if "grand_total" in diff:
+                    entry["grand_total_delta"] = flt(diff["grand_total"][1]) - flt(diff["grand_total"][0])
+                report["grand_total_delta"] += entry["grand_total_delta"]
+            chunk_report.append(entry)
+
+        if not dry_run:
+            try:
+                write_changes(changes)
+                frappe.db.commit()
+            except Exception as e:
+                frappe.db.rollback()
+                frappe.log_error(f"Reprice Bookings Chunk Error: {str(e)}")
+                chunk_report = [{"booking": name, "error": str(e)} for name in changes]
+                changes = {}
+
+        report["processed"] += len(rows)
+        report["changed"] += len(changes)
+        report["bookings"].extend(chunk_report)
+        frappe.publish_realtime("reprice_bookings_progress", {
+            "job_id": progress_id,
+            "processed": report["processed"],
+            "dry_run": bool(dry_run),
+            "results": chunk_report,
+        }, user=frappe.session.user)
+
+    frappe.cache().set_value(REPORT_CACHE_PREFIX + str(progress_id), report, expires_in_sec=REPORT_TTL_SEC)
+    frappe.publish_realtime("reprice_bookings_progress", {
+        "job_id": progress_id,
+        "processed": report["processed"],
+        "changed": report["changed"],
+        "grand_total_delta": report["grand_total_delta"],
+        "dry_run": bool(dry_run),
+        "done": True,
+    }, user=frappe.session.user)
+
+    return report
+
+
+@frappe.whitelist()
+def get_reprice_report(job_id):
+    """Diff report of a finished reprice_bookings job (kept for a day)."""
+    frappe.only_for("System Manager")
+    return frappe.cache().get_value(REPORT_CACHE_PREFIX + job_id)
@@ -0,0 +1,174 @@
+import hashlib
+
+import frappe
+from frappe.utils import flt, getdate
+from safarwaala.api.permission import get_linked_principal
+
+ROLLUP_DIMENSIONS = ["vendor", "driver", "car", "car_modal", "booking_type"]
+ROLLUP_METRICS = ["trips", "total_km", "grand_total", "night_charges", "expenses"]
+
+# Bucket start for each chart granularity, from the daily `date` column
+GRANULARITY_SQL = {
+    "day": "`date`",
+    "week": "DATE_SUB(`date`, INTERVAL WEEKDAY(`date`) DAY)",
+    "month": "DATE_FORMAT(`date`, '%%Y-%%m-01')",
+}
+
+# Shared by the incremental upsert and the backfill so both produce the same row names
+ROLLUP_NAME_SQL = "MD5(CONCAT_WS('|', {date}, IFNULL({vendor}, ''), IFNULL({driver}, ''), IFNULL({car}, ''), IFNULL({car_modal}, ''), IFNULL({booking_type}, '')))"
+
+
+def get_rollup_name(key):
+    raw = "|".join([str(key["date"])] + [key.get(d) or "" for d in ROLLUP_DIMENSIONS])
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def get_booking_date(booking):
+    return getdate(booking.pickup_datetime or booking.creation)
+
+
+def update_booking_rollup(booking, sign=1):
+    """Add (sign=1, submit) or remove (sign=-1, cancel) a booking from its daily rollup row."""
+    add_to_booking_rollup(booking, {
+        "trips": sign,
+        "total_km": sign * flt(booking.total_km),
+        "grand_total": sign * flt(booking.grand_total),
+        "night_charges": sign * flt(booking.night_charges),
+        "expenses": sign * flt(booking.expense_total),
+    })
+
+
+def add_to_booking_rollup(booking, metrics):
+    """
+    Add metric deltas to the booking's daily rollup row; metrics left out add nothing.
+    Also used for expense changes made to a booking after it was submitted.
+    """
+    key = {"date": get_booking_date(booking)}
+    for dimension, field in zip(ROLLUP_DIMENSIONS, ["assigned_to", "driver", "car", "car_modal", "booking_type"]):
+        key[dimension] = booking.get(field)
+
+    values = dict(key)
+    values.update({metric: flt(metrics.get(metric)) for metric in ROLLUP_METRICS})
+    values.update({
+        "name": get_rollup_name(key),
+        "now": frappe.utils.now(),
+        "user": frappe.session.user,
+    })
+
+    frappe.db.sql("""
+        INSERT INTO `tabBooking Daily Rollup`
+            (name, `date`, vendor, driver, car, car_modal, booking_type,
+            trips, total_km, grand_total, night_charges, expenses,
+            creation, modified, owner, modified_by, docstatus)
+        VALUES
+            (%(name)s, %(date)s, %(vendor)s, %(driver)s, %(car)s, %(car_modal)s, %(booking_type)s,
+            %(trips)s, %(total_km)s, %(grand_total)s, %(night_charges)s, %(expenses)s,
+            %(now)s, %(now)s, %(user)s, %(user)s, 0)
+        ON DUPLICATE KEY UPDATE
+            trips = trips + VALUES(trips),
+            total_km = total_km + VALUES(total_km),
+            grand_total = grand_total + VALUES(grand_total),
+            night_charges = night_charges + VALUES(night_charges),
+            expenses = expenses + VALUES(expenses),
+            modified = VALUES(modified)
+    """, values)
+
+
+def rebuild_booking_rollups(from_date=None, to_date=None):
+    """
+    Backfill rollups from submitted bookings, optionally for a date range only.
+    bench --site <site> execute safarwaala.api.rollup.rebuild_booking_rollups --kwargs "{'from_date': '2026-01-01'}"
+    """
+    booking_date = "DATE(IFNULL(bm.pickup_datetime, bm.creation))"
+    conditions, values = [], {}
+    if from_date:
+        conditions.append(f"{booking_date} >= %(from_date)s")
+        values["from_date"] = getdate(from_date)
+    if to_date:
+        conditions.append(f"{booking_date} <= %(to_date)s")
+        values["to_date"] = getdate(to_date)
+
+    rollup_conditions = " AND ".join(c.replace(booking_date, "`date`") for c in conditions) or "1=1"
+    booking_conditions = "".join(f" AND {c}" for c in conditions)
+
+    frappe.db.sql(f"DELETE FROM `tabBooking Daily Rollup` WHERE {rollup_conditions}", values)
+
+    name_sql = ROLLUP_NAME_SQL.format(
+        date=booking_date, vendor="bm.assigned_to", driver="bm.driver", car="bm.car",
+        car_modal="bm.car_modal", booking_type="bm.booking_type",
+    )
+    frappe.db.sql(f"""
+        INSERT INTO `tabBooking Daily Rollup`
+            (name, `date`, vendor, driver, car, car_modal, booking_type,
+            trips, total_km, grand_total, night_charges, expenses,
+            creation, modified, owner, modified_by, docstatus)
+        SELECT
+            {name_sql}, {booking_date}, bm.assigned_to, bm.driver, bm.car, bm.car_modal, bm.booking_type,
+            COUNT(*), SUM(IFNULL(bm.total_km, 0)), SUM(IFNULL(bm.grand_total, 0)),
+            SUM(IFNULL(bm.night_charges, 0)), SUM(IFNULL(bm.expense_total, 0)),
+            NOW(6), NOW(6), 'Administrator', 'Administrator', 0
+        FROM `tabBookings Master` bm
+        WHERE bm.docstatus = 1{booking_conditions}
+        GROUP BY {booking_date}, bm.assigned_to, bm.driver, bm.car, bm.car_modal, bm.booking_type
+    """, values)
+    frappe.db.commit()
+
+
+@frappe.whitelist()
+def get_rollup(metric="trips", group_by=None, from_date=None, to_date=None, granularity="month"):
+    """
+    Chart data from the daily booking rollups.
+    metric: trips | total_km | grand_total | night_charges | expenses
+    group_by: optional vendor | driver | car | car_modal | booking_type (one dataset per value)
+    granularity: day | week | month
+    Vendors and drivers only see their own rows.
+    """
+    if metric not in ROLLUP_METRICS:
+        frappe.throw(f"Invalid metric: {metric}", frappe.ValidationError)
+    if group_by and group_by not in ROLLUP_DIMENSIONS:
+        frappe.throw(f"Invalid group_by: {group_by}", frappe.ValidationError)
+    if granularity not in GRANULARITY_SQL:
+        frappe.throw(f"Invalid granularity: {granularity}", frappe.ValidationError)
+
+    conditions, values = [], {}
+    principal = get_linked_principal()
+    if not principal.is_admin:
+        scopes = []
+        if "Vendor" in principal.roles and principal.vendor:
+            scopes.append("vendor = %(vendor)s")
+            values["vendor"] = principal.vendor
+        if "Driver" in principal.roles and principal.driver:
+            scopes.append("driver = %(driver)s")
+            values["driver"] = principal.driver
+        if not scopes:
+            return {"labels": [], "datasets": []}
+        conditions.append("(" + " OR ".join(scopes) + ")")
+
+    if from_date:
+        conditions.append("`date` >= %(from_date)s")
+        values["from_date"] = getdate(from_date)
+    if to_date:
+        conditions.append("`date` <= %(to_date)s")
+        values["to_date"] = getdate(to_date)
+
+    bucket = GRANULARITY_SQL[granularity]
+    series = f"IFNULL(`{group_by}`, '')" if group_by else "''"
+    rows = frappe.db.sql(f"""
+        SELECT {bucket} AS period, {series} AS series, SUM(`{metric}`) AS value
+        FROM `tabBooking Daily Rollup`
+        WHERE {" AND ".join(conditions) or "1=1"}
+        GROUP BY period, series
+        ORDER BY period
+    """, values, as_dict=True)
+
+    labels = sorted({str(row.period) for row in rows})
+    index = {label: i for i, label in enumerate(labels)}
+    datasets = {}
+    for row in rows:
+        values_for_series = datasets.setdefault(row.series, [0] * len(labels))
+        values_for_series[index[str(row.period)]] = flt(row.value)
+
+    return {
+        "labels": labels,
+        "datasets": [{"name": name or metric, "values": vals} for name, vals in datasets.items()],
+    }
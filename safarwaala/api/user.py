@@ -1,5 +1,6 @@
 import frappe
 from frappe.auth import LoginManager
+from safarwaala.api.permission import get_linked_principal
 
 @frappe.whitelist(allow_guest=True)
 def get_user_profile():
@@ -10,8 +11,10 @@ def get_user_profile():
     user_doc = frappe.get_doc("User", user)
     
     # Fetch linked documents
-    vendor = frappe.db.get_value("Vendors", {"linked_user": user}, "name")
-    driver = frappe.db.get_value("Drivers", {"linked_user": user}, "name")
+    principal = get_linked_principal(user)
+    customer_details = None
+    if principal.customer:
+        customer_details = frappe.db.get_value("Customer", principal.customer, ["name", "name1", "mobile", "email", "type"], as_dict=True)
 
     return {
         "is_logged_in": True,
@@ -25,9 +28,9 @@ def get_user_profile():
         "birth_date": user_doc.birth_date,
         "user_image": user_doc.user_image,
         "role": user_doc.role_profile_name,
-        "vendor_id": vendor,
-        "driver_id": driver,
-        "customer_details": frappe.db.get_value("Customer", {"linked_user": user}, ["name", "name1", "mobile", "email", "type"], as_dict=True)
+        "vendor_id": principal.vendor,
+        "driver_id": principal.driver,
+        "customer_details": customer_details
     }
 
 @frappe.whitelist(allow_guest=True)
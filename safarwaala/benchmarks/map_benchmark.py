@@ -0,0 +1,142 @@
+"""
+Load benchmark for the map endpoints of a running site.
+
+Drives safarwaala.api.map.autocomplete / directions / distance_matrix concurrently over HTTP
+and reports throughput, p50/p95/p99 latency per endpoint and, when the site points at the
+local stand-in (see ola_standin.py), how many upstream calls the run caused.
+
+    python -m safarwaala.benchmarks.ola_standin --latency-ms 150 &
+    python -m safarwaala.benchmarks.map_benchmark --site-url http://127.0.0.1:8000 \\
+        --standin-url http://127.0.0.1:8765 --requests 2000 --concurrency 32
+
+Run it twice to compare a cold cache with a warm one.
+"""
+
+import argparse
+import random
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from safarwaala.benchmarks.ola_standin import PLACES
+
+METHOD_PREFIX = "/api/method/safarwaala.api.map."
+
+
+def typed_prefixes(name):
+    """What the autocomplete box sends while someone types `name`."""
+    return [name[:i] for i in range(3, len(name) + 1)]
+
+
+def build_workload(count, mix, seed=7):
+    rng = random.Random(seed)
+    points = [f"{lat},{lng}" for _name, lat, lng in PLACES]
+    # A few popular places dominate, as in production
+    weights = [1 / (rank + 1) for rank in range(len(PLACES))]
+
+    calls = []
+    while len(calls) < count:
+        kind = rng.choices(list(mix), weights=list(mix.values()))[0]
+        if kind == "autocomplete":
+            name = rng.choices(PLACES, weights=weights)[0][0]
+            calls.extend(("autocomplete", "GET", {"input": text, "location": points[0]}) for text in typed_prefixes(name))
+        elif kind == "landmarks":
+            calls.append(("autocomplete", "GET", {"input": ""}))
+        elif kind == "directions":
+            origin, destination = rng.sample(points, 2)
+            calls.append(("directions", "POST", {"origin": origin, "destination": destination}))
+        elif kind == "distance_matrix":
+            calls.append(("distance_matrix", "POST", {
+                "origins": rng.sample(points, 2),
+                "destinations": rng.sample(points, 3),
+            }))
+    return calls[:count]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, max(0, int(round(p * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def run(site_url, calls, concurrency, timeout):
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_maxsize=concurrency))
+    session.mount("https://", HTTPAdapter(pool_maxsize=concurrency))
+
+    def call(item):
+        endpoint, method, params = item
+        url = site_url.rstrip("/") + METHOD_PREFIX + endpoint
+        start = time.perf_counter()
+        try:
+            if method == "GET":
+                response = session.get(url, params=params, timeout=timeout)
+            else:
+                response = session.post(url, json=params, timeout=timeout)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return endpoint, (time.perf_counter() - start) * 1000, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(call, calls))
+    return results, time.perf_counter() - started
+
+
+def standin_stats(standin_url, reset=False):
+    if not standin_url:
+        return None
+    path = "/__reset" if reset else "/__stats"
+    try:
+        return requests.get(standin_url.rstrip("/") + path, timeout=5).json()
+    except requests.RequestException:
+        return None
+
+
+def report(results, elapsed, upstream):
+    latencies, errors = defaultdict(list), defaultdict(int)
+    for endpoint, ms, ok in results:
+        latencies[endpoint].append(ms)
+        if not ok:
+            errors[endpoint] += 1
+
+    print(f"\n{len(results)} requests in {elapsed:.1f}s ({len(results) / elapsed:.0f} req/s)\n")
+    print(f"{'endpoint':<18}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint in sorted(latencies):
+        values = sorted(latencies[endpoint])
+        print(f"{endpoint:<18}{len(values):>8}{errors[endpoint]:>8}"
+              f"{percentile(values, 0.50):>10.1f}{percentile(values, 0.95):>10.1f}{percentile(values, 0.99):>10.1f}")
+
+    if upstream is not None:
+        print("\nupstream calls (stand-in):")
+        for path, count in sorted(upstream.items()):
+            print(f"  {path:<32}{count:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--site-url", required=True, help="e.g. http://127.0.0.1:8000")
+    parser.add_argument("--standin-url", help="stand-in URL, to count upstream calls")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--mix", default="autocomplete=6,landmarks=1,directions=2,distance_matrix=1",
+                        help="relative weights per workload kind")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    mix = {kind: float(weight) for kind, weight in (part.split("=") for part in args.mix.split(","))}
+    calls = build_workload(args.requests, mix, args.seed)
+
+    standin_stats(args.standin_url, reset=True)
+    results, elapsed = run(args.site_url, calls, args.concurrency, args.timeout)
+    report(results, elapsed, standin_stats(args.standin_url))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Local stand-in for the OLA Maps endpoints used by safarwaala.api.map.
+
+Serves /places/v1/autocomplete, /places/v1/nearbysearch and /routing/v1/directions/basic
+with deterministic fake data, configurable latency and error rate, and counts every call.
+
+    python -m safarwaala.benchmarks.ola_standin --port 8765 --latency-ms 150 --jitter-ms 50 --error-rate 0.02
+
+Point a site at it with `"ola_maps_base_url": "http://127.0.0.1:8765"` in site_config.json
+(any non-empty `ola_maps_api_key` works). GET /__stats returns call counts, POST /__reset clears them.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PLACES = [
+    ("Jaipur", 26.9124, 75.7873), ("Jaipur International Airport", 26.8242, 75.8122),
+    ("Jaisalmer", 26.9157, 70.9083), ("Jodhpur", 26.2389, 73.0243), ("Ajmer", 26.4499, 74.6399),
+    ("Pushkar", 26.4897, 74.5511), ("Udaipur", 24.5854, 73.7125), ("Mount Abu", 24.5926, 72.7156),
+    ("Bikaner", 28.0229, 73.3119), ("Kota", 25.2138, 75.8648), ("Ranthambore", 26.0173, 76.5026),
+    ("Chittorgarh", 24.8887, 74.6269), ("Amer Fort", 26.9855, 75.8513), ("Hawa Mahal", 26.9239, 75.8267),
+    ("City Palace Jaipur", 26.9258, 75.8237), ("Delhi", 28.6139, 77.2090), ("Agra", 27.1767, 78.0081),
+]
+PAGE_SIZE = 5
+
+calls = Counter()
+calls_lock = threading.Lock()
+
+
+def prediction(name, lat, lng):
+    place_id = hashlib.md5(name.encode()).hexdigest()[:16]
+    return {
+        "place_id": place_id,
+        "reference": place_id,
+        "description": f"{name}, Rajasthan, India",
+        "structured_formatting": {"main_text": name, "secondary_text": "Rajasthan, India"},
+        "types": ["locality"],
+        "layer": ["locality"],
+        "geometry": {"location": {"lat": lat, "lng": lng}},
+    }
+
+
+def autocomplete(params):
+    text = (params.get("input") or [""])[0].lower().strip()
+    matches = [p for p in PLACES if any(word.startswith(text) for word in p[0].lower().split()) or p[0].lower().startswith(text)]
+    return {"status": "ok", "predictions": [prediction(*p) for p in matches[:PAGE_SIZE]]}
+
+
+def nearbysearch(params):
+    return {"status": "ok", "predictions": [prediction(*p) for p in PLACES[:10]]}
+
+
+def haversine_km(a, b):
+    lat1, lng1 = (math.radians(float(x)) for x in a.split(","))
+    lat2, lng2 = (math.radians(float(x)) for x in b.split(","))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+
+def directions(params):
+    try:
+        # Road distance is roughly 1.3x the great-circle distance
+        meters = int(haversine_km(params["origin"][0], params["destination"][0]) * 1300)
+    except (KeyError, ValueError):
+        return {"status": "INVALID_REQUEST", "error_message": "origin and destination must be lat,lng"}
+    seconds = int(meters / 1000 / 50 * 3600)
+    return {
+        "status": "SUCCESS",
+        "routes": [{"legs": [{
+            "distance": meters,
+            "duration": seconds,
+            "readable_distance": f"{round(meters / 1000, 1)} km",
+            "readable_duration": f"{seconds // 3600} hr {seconds % 3600 // 60} min",
+        }]}],
+    }
+
+
+ROUTES = {
+    ("GET", "/places/v1/autocomplete"): autocomplete,
+    ("GET", "/places/v1/nearbysearch"): nearbysearch,
+    ("POST", "/routing/v1/directions/basic"): directions,
+}
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency_ms = 0
+    jitter_ms = 0
+    error_rate = 0.0
+
+    def do_GET(self):
+        self.handle_call("GET")
+
+    def do_POST(self):
+        self.handle_call("POST")
+
+    def handle_call(self, method):
+        url = urlparse(self.path)
+        if url.path == "/__stats":
+            with calls_lock:
+                return self.send_json(200, dict(calls))
+        if url.path == "/__reset":
+            with calls_lock:
+                calls.clear()
+            return self.send_json(200, {})
+
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+
+        handler = ROUTES.get((method, url.path))
+        if not handler:
+            return self.send_json(404, {"status": "NOT_FOUND"})
+
+        with calls_lock:
+            calls[url.path] += 1
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        time.sleep(max(delay, 0) / 1000)
+
+        if random.random() < self.error_rate:
+            with calls_lock:
+                calls["errors"] += 1
+            return self.send_json(503, {"status": "UNAVAILABLE", "error_message": "stand-in injected error"})
+        self.send_json(200, handler(parse_qs(url.query)))
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(host="127.0.0.1", port=8765, latency_ms=0, jitter_ms=0, error_rate=0.0):
+    StandinHandler.latency_ms = latency_ms
+    StandinHandler.jitter_ms = jitter_ms
+    StandinHandler.error_rate = error_rate
+    server = ThreadingHTTPServer((host, port), StandinHandler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=150, help="mean added latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="uniform +/- jitter on the latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with HTTP 503")
+    args = parser.parse_args()
+
+    server = serve(args.host, args.port, args.latency_ms, args.jitter_ms, args.error_rate)
+    print(f"OLA stand-in on http://{args.host}:{args.port} "
+          f"(latency {args.latency_ms}±{args.jitter_ms} ms, error rate {args.error_rate})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -165,9 +165,67 @@ has_permission = {
 # 	}
 # }
 
+doc_events = {
+	"Drivers": {
+		"on_update": [
+			"safarwaala.api.permission.invalidate_linked_principal",
+			"safarwaala.api.dashboard_stats.on_stats_source_change",
+		],
+		"on_trash": [
+			"safarwaala.api.permission.invalidate_linked_principal",
+			"safarwaala.api.dashboard_stats.on_stats_source_change",
+		],
+	},
+	"Cars": {
+		"on_update": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_trash": "safarwaala.api.dashboard_stats.on_stats_source_change",
+	},
+	"Payouts": {
+		"on_update": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_submit": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_update_after_submit": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_cancel": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_trash": "safarwaala.api.dashboard_stats.on_stats_source_change",
+	},
+	"Customer Invoice": {
+		"on_update": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_submit": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_update_after_submit": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_cancel": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_trash": "safarwaala.api.dashboard_stats.on_stats_source_change",
+	},
+	"Bookings Master": {
+		"on_change": "safarwaala.api.dashboard_stats.on_stats_source_change",
+		"on_update": "safarwaala.api.booking.record_removed_booking",
+		"on_trash": [
+			"safarwaala.api.dashboard_stats.on_stats_source_change",
+			"safarwaala.api.booking.record_removed_booking",
+		],
+	},
+	"Vendors": {
+		"on_update": "safarwaala.api.permission.invalidate_linked_principal",
+		"on_trash": "safarwaala.api.permission.invalidate_linked_principal",
+	},
+	"Customer": {
+		"on_update": "safarwaala.api.permission.invalidate_linked_principal",
+		"on_trash": "safarwaala.api.permission.invalidate_linked_principal",
+	},
+	"User": {
+		"on_update": "safarwaala.api.permission.invalidate_linked_principal",
+		"on_trash": "safarwaala.api.permission.invalidate_linked_principal",
+	},
+}
+
 # Scheduled Tasks
 # ---------------
 
+scheduler_events = {
+	"daily": [
+		"safarwaala.safarwaala.doctype.gl_entry.gl_entry.verify_bank_balances",
+		"safarwaala.api.map.purge_expired_routes",
+	],
+}
+
 # scheduler_events = {
 # 	"all": [
 # 		"safarwaala.tasks.all"
@@ -0,0 +1,40 @@
+import frappe
+
+# (doctype, columns) for every filter that runs on the request path.
+# Composite indexes lead with the equality column and end with the sort/range
+# column so list queries can filter and order from the index alone.
+HOT_INDEXES = [
+    ("Bookings Master", ["assigned_to", "creation"]),
+    ("Bookings Master", ["driver", "creation"]),
+    ("Bookings Master", ["customer", "creation"]),
+    ("Bookings Master", ["driver", "booking_status"]),
+    ("Bookings Master", ["booking_status", "pickup_datetime"]),
+    ("Vehicle Expense Log", ["booking_ref", "docstatus"]),
+    ("Payouts", ["booking_id"]),
+    ("Payouts", ["payout_to", "status"]),
+    ("Payouts", ["status"]),
+    ("GL Entry", ["account", "docstatus"]),
+    ("Category Item", ["category"]),
+    ("Duty Slips", ["booking_id"]),
+    ("Duty Slips", ["driver", "docstatus"]),
+    ("Driver Payment", ["driver", "docstatus"]),
+    ("Driver Payment", ["vendor"]),
+    ("Drivers", ["linked_user"]),
+    ("Drivers", ["owner_vendor"]),
+    ("Vendors", ["linked_user"]),
+    ("Customer", ["linked_user"]),
+    ("Cars", ["belongs_to_vendor"]),
+    ("Customer Invoice", ["vendor", "status"]),
+]
+
+
+def get_index_name(columns):
+    return "_".join(columns) + "_index"
+
+
+def execute():
+    for doctype, columns in HOT_INDEXES:
+        if not frappe.db.table_exists(doctype):
+            continue
+        # add_index is a no-op when an index with the same name already exists
+        frappe.db.add_index(doctype, columns, index_name=get_index_name(columns))
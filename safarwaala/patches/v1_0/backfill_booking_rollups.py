@@ -0,0 +1,5 @@
+from safarwaala.api.rollup import rebuild_booking_rollups
+
+
+def execute():
+    rebuild_booking_rollups()
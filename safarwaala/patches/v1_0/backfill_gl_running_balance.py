@@ -0,0 +1,8 @@
+from safarwaala.safarwaala.doctype.gl_entry.gl_entry import rebuild_running_balances, verify_bank_balances
+
+
+def execute():
+    # Running balance per account in posting order, for entries made before GL Entry.balance existed
+    rebuild_running_balances()
+
+    verify_bank_balances(fix=True)
@@ -0,0 +1,5 @@
+from safarwaala.safarwaala.doctype.driver_balance.driver_balance import rebuild_driver_balances
+
+
+def execute():
+    rebuild_driver_balances()
@@ -0,0 +1,50 @@
+# Copyright (c) 2026, rahul and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from safarwaala.api.rollup import get_rollup, update_booking_rollup
+
+VENDOR = "_Test Rollup Vendor"
+VENDOR_USER = "rollup-vendor@example.com"
+
+
+class TestBookingDailyRollup(FrappeTestCase):
+	def setUp(self):
+		frappe.db.delete("Booking Daily Rollup", {"vendor": VENDOR})
+		frappe.local.safarwaala_principals = {
+			VENDOR_USER: frappe._dict(
+				user=VENDOR_USER, roles=["Vendor"], is_admin=False, vendor=VENDOR, driver=None, customer=None
+			),
+		}
+
+	def tearDown(self):
+		frappe.set_user("Administrator")
+		frappe.local.safarwaala_principals = {}
+
+	def test_submit_adds_and_cancel_removes(self):
+		booking = frappe._dict(
+			assigned_to=VENDOR, driver=None, car=None, car_modal=None, booking_type="Local",
+			pickup_datetime="2026-03-02 09:00:00", total_km=80, grand_total=2500, night_charges=0, expense_total=300,
+		)
+		april = frappe._dict(booking, pickup_datetime="2026-04-10 09:00:00")
+		update_booking_rollup(booking)
+		update_booking_rollup(booking)
+		update_booking_rollup(april)
+		update_booking_rollup(april, sign=-1)
+
+		row = frappe.db.get_value(
+			"Booking Daily Rollup", {"vendor": VENDOR, "date": "2026-03-02"},
+			["trips", "total_km", "grand_total", "expenses"], as_dict=True,
+		)
+		self.assertEqual((row.trips, row.total_km, row.grand_total, row.expenses), (2, 160, 5000, 600))
+
+		frappe.set_user(VENDOR_USER)
+		chart = get_rollup("grand_total", from_date="2026-03-01", to_date="2026-04-30")
+		self.assertEqual(chart["labels"], ["2026-03-01", "2026-04-01"])
+		self.assertEqual(chart["datasets"][0]["values"], [5000, 0])
+		self.assertEqual(
+			get_rollup("trips", from_date="2026-03-01", to_date="2026-04-30", granularity="day")["datasets"][0]["values"],
+			[2, 0],
+		)
@@ -1,10 +1,18 @@
 # Copyright (c) 2025, rahul and contributors
 # For license information, please see license.txt
 
+from contextlib import contextmanager
+
 import frappe
 from frappe import _
 from frappe.model.document import Document
-from frappe.utils import flt, get_datetime, time_diff_in_hours, ceil, nowdate
+from frappe.utils import flt, nowdate
+from safarwaala.api.permission import get_linked_principal
+from safarwaala.api.pricing import price_booking
+from safarwaala.api.rate_card import get_car_modal
+from safarwaala.api.rollup import add_to_booking_rollup, update_booking_rollup
+
+EXPENSE_FIELDS = ["expense_total", "billable_expense_total", "driver_expense_total"]
 
 class BookingsMaster(Document):
     def validate(self):
@@ -19,15 +27,16 @@ class BookingsMaster(Document):
     def before_insert(self):
         if not self.assigned_to:
             # If user is a Vendor, auto-assign
-            if "Vendor" in frappe.get_roles(frappe.session.user):
-                 vendor = frappe.db.get_value("Vendors", {"linked_user": frappe.session.user}, "name")
-                 if vendor:
-                     self.assigned_to = vendor
+            principal = get_linked_principal(frappe.session.user)
+            if "Vendor" in principal.roles and principal.vendor:
+                 self.assigned_to = principal.vendor
 
     def calculate_charges(self):
         # Fetch rates from Car Modal if missing
         if self.car_modal and self.booking_type != "Fixed":
-            car = frappe.get_doc("Car Modals", self.car_modal)
+            car = get_car_modal(self.car_modal)
+            if not car:
+                frappe.throw(_("Car Modals {0} not found").format(self.car_modal), frappe.DoesNotExistError)
             if self.booking_type == "Local":
                 if not self.min_hours: self.min_hours = car.min_local_hour
                 if not self.min_km: self.min_km = car.min_local_km
@@ -39,136 +48,21 @@ class BookingsMaster(Document):
                 if not self.night_rate: self.night_rate = car.night_rate
                 self._min_km_day = car.min_km_day
 
-        if self.booking_type == "Local":
-            self.calculate_local_charges()
-        elif self.booking_type == "Outstation":
-            self.calculate_outstation_charges()
-        elif self.booking_type == "Fixed":
-            self.calculate_fixed_charges()
-        
-    def calculate_local_charges(self):
-        # Base Charges
-        base_h = flt(self.min_hours)
-        rate_h = flt(self.per_hour_rate)
-        self.base_amount = base_h * rate_h
-
-        # Running Details
-        if self.start_km is not None and self.end_km is not None:
-            self.total_km = flt(self.end_km) - flt(self.start_km)
-            if self.total_km < 0: self.total_km = 0
-        else:
-            self.total_km = 0
-
-        if self.pickup_datetime and self.return_datetime:
-            pickup = get_datetime(self.pickup_datetime)
-            drop = get_datetime(self.return_datetime)
-            # Calculate hours diff
-            diff_hours = time_diff_in_hours(drop, pickup)
-            if diff_hours < 0: diff_hours = 0
-        else:
-            diff_hours = 0
-
-        # Extra Charges
-        # Extra Hours
-        extra_h = flt(diff_hours) - base_h
-        if extra_h < 0: extra_h = 0
-        self.extra_hour_charges = extra_h * rate_h
-
-        # Extra Km
-        base_km = flt(self.min_km)
-        extra_k = flt(self.total_km) - base_km
-        if extra_k < 0: extra_k = 0
-        rate_k = flt(self.per_km_rate)
-        self.extra_km_charges = extra_k * rate_k
-
-        # Night Charges: Handled via manual input or auto-calc if needed
-        # Assuming manual input 'nights' isn't on master yet, relying on 'night_charges' field directly
-        # If 'nights' field existed we would do: self.night_charges = self.nights * self.night_rate
-        # For now, let's trust formatting/client script to set night_charges or calc if mapped
-        pass
-
-    def calculate_outstation_charges(self):
-        if not self.pickup_datetime or not self.return_datetime:
-            return
-
-        start = get_datetime(self.pickup_datetime)
-        end = get_datetime(self.return_datetime)
-        
-        # Calculate Days & Nights
-        duration_in_seconds = (end - start).total_seconds()
-        days = ceil(duration_in_seconds / (24 * 3600))
-        if days < 1: days = 1
-        
-        # Min KM Calculation
-        # Use existing min_km if set (assumed Total), else calc from rate
-        if not self.min_km:
-             min_km_day = getattr(self, '_min_km_day', 0)
-             if not min_km_day and self.car_modal:
-                 min_km_day = frappe.db.get_value("Car Modals", self.car_modal, "min_km_day")
-             self.min_km = flt(min_km_day) * days
-
-        # Running Details
-        start_km = flt(self.start_km)
-        end_km = flt(self.end_km)
-        diff_km = end_km - start_km
-        if diff_km < 0: diff_km = 0
-        self.total_km = diff_km
-
-        # Chargeable KM
-        chargeable_km = max(diff_km, flt(self.min_km))
-        
-        # Amounts
-        per_km_rate = flt(self.per_km_rate)
-        self.base_amount = chargeable_km * per_km_rate # Using base_amount for the main KM charge
-        
-        # Night Charges
-        nights = days - 1
-        if nights < 0: nights = 0
-        self.night_charges = nights * flt(self.night_rate)
-
-        # Clear Local fields
-        self.extra_km_charges = 0
-        self.extra_hour_charges = 0
-
-    def calculate_fixed_charges(self):
-        """Fixed bookings: grand_total is vendor-entered all-inclusive price.
-        We only compute total_km and night_charges as informational."""
-        # KM (informational)
-        if self.start_km is not None and self.end_km is not None:
-            self.total_km = max(flt(self.end_km) - flt(self.start_km), 0)
-        else:
-            self.total_km = 0
-
-        # Night charges (informational)
-        if self.pickup_datetime and self.return_datetime:
-            start = get_datetime(self.pickup_datetime)
-            end = get_datetime(self.return_datetime)
-            duration_secs = (end - start).total_seconds()
-            days = ceil(duration_secs / (24 * 3600))
-            if days < 1: days = 1
-            nights = max(days - 1, 0)
-            self.night_charges = nights * flt(self.night_rate)
-
-        # Clear rate-based fields — they don't apply to Fixed
-        self.min_hours = 0
-        self.min_km = 0
-        self.per_hour_rate = 0
-        self.per_km_rate = 0
-        self.base_amount = 0
-        self.extra_km_charges = 0
-        self.extra_hour_charges = 0
+        # Shared with get_quotes so a booking and its quote always agree
+        self.update(price_booking(self))
 
     def calculate_expenses(self):
-        # Fetch linked Vehicle Expense Logs
-        expenses = frappe.db.get_list('Vehicle Expense Log', 
-                                      filters={
-                                          'booking_ref': self.name
-                                      }, 
-                                      fields=['amount', 'is_billable', 'paid_by'])
-        
-        self.expense_total = sum([flt(d.amount) for d in expenses])
-        self.billable_expense_total = sum([flt(d.amount) for d in expenses if d.is_billable])
-        self.driver_expense_total = sum([flt(d.amount) for d in expenses if d.paid_by == 'Driver'])
+        # Expense aggregates are maintained incrementally by Vehicle Expense Log
+        # (see apply_expense_delta), so read the stored row instead of re-scanning.
+        if self.is_new():
+            self.expense_total = 0
+            self.billable_expense_total = 0
+            self.driver_expense_total = 0
+            return
+
+        totals = frappe.db.get_value("Bookings Master", self.name, EXPENSE_FIELDS, as_dict=True)
+        if totals:
+            self.update(totals)
 
     def calculate_taxes(self):
         self.tax_total = 0
@@ -190,10 +84,25 @@ class BookingsMaster(Document):
         self.grand_total = term_total + flt(self.billable_expense_total) + flt(self.tax_total)
 
     def on_submit(self):
-        self.submit_expenses()
+        # Counted before the expense flush: the booking is already submitted in the db,
+        # so any delta the flush applies is added to the rollup row as well
+        update_booking_rollup(self)
+        with coalesce_booking_recompute():
+            self.submit_expenses()
+        # Pick up any expense changes applied when the block flushed
+        self.calculate_expenses()
+        self.calculate_totals()
+
+        # finalize_bookings builds invoices and payouts itself and bulk inserts them per chunk
+        if self.flags.defer_financials:
+            return
+
         self.create_customer_invoice()
         self.create_driver_payment()
 
+    def on_cancel(self):
+        update_booking_rollup(self, sign=-1)
+
     def submit_expenses(self):
         # Navigate to linked expenses and submit them
         expenses = frappe.db.get_list('Vehicle Expense Log', 
@@ -208,9 +117,24 @@ class BookingsMaster(Document):
                 pass # Continue if one fails? Or raise? Use existing logic which was loose.
 
     def create_customer_invoice(self):
-        if frappe.db.exists("Customer Invoice", {"booking_id": self.name}):
+        invoice = self.get_customer_invoice()
+        if not invoice:
             return
 
+        invoice.insert(ignore_permissions=True)
+        
+        # Update Booking with Invoice details
+        self.db_set("booking_status", "Invoiced")
+        # Store as string for link field
+        self.db_set("linked_invoice", invoice.name)
+        
+        frappe.msgprint(_("Customer Invoice {0} created").format(invoice.name))
+
+    def get_customer_invoice(self):
+        """Unsaved Customer Invoice for this booking, or None if one already exists."""
+        if frappe.db.exists("Customer Invoice", {"booking_id": self.name}):
+            return None
+
         # Calculate what customer has already paid via expenses (if any)
         # e.g. Customer paid for fuel directly
         customer_paid_expenses = frappe.db.sql("""
@@ -238,19 +162,21 @@ class BookingsMaster(Document):
              # If we want to verify user/vendor, we might add 'vendor': self.assigned_to here if the schema expects it
              "vendor": self.assigned_to 
         })
-        invoice.insert(ignore_permissions=True)
-        
-        # Update Booking with Invoice details
-        self.db_set("booking_status", "Invoiced")
-        # Store as string for link field
-        self.db_set("linked_invoice", invoice.name)
-        
-        frappe.msgprint(_("Customer Invoice {0} created").format(invoice.name))
+        return invoice
 
     def create_driver_payment(self):
-        if frappe.db.exists("Payouts", {"booking_id": self.name, "payout_to_type": "Drivers"}):
+        payout = self.get_driver_payout()
+        if not payout:
             return
 
+        payout.insert(ignore_permissions=True)
+        frappe.msgprint(_("Driver Payout {0} created").format(payout.name))
+
+    def get_driver_payout(self):
+        """Unsaved driver Payouts entry for this booking, or None if nothing is due."""
+        if frappe.db.exists("Payouts", {"booking_id": self.name, "payout_to_type": "Drivers"}):
+            return None
+
         # Driver Payment = Night Charges (Allowance) + Driver Paid Expenses
         # (Assuming Base/Extra charges belong to the vendor/company)
         
@@ -262,9 +188,9 @@ class BookingsMaster(Document):
         
         total_pay = allowance + reimbursement
         
-        if total_pay <= 0: return
+        if total_pay <= 0: return None
 
-        if not self.driver: return 
+        if not self.driver: return None
         
         # Payouts DocType Creation
         payout = frappe.get_doc({
@@ -277,5 +203,140 @@ class BookingsMaster(Document):
             "details": f"Allowance: {allowance}, Reimbursement: {reimbursement}",
             "booking_id": self.name
         })
-        payout.insert(ignore_permissions=True)
-        frappe.msgprint(_("Driver Payout {0} created").format(payout.name))
+        return payout
+
+
+# SQL mirror of BookingsMaster.calculate_totals, evaluated after the expense columns are updated
+GRAND_TOTAL_SQL = """
+    CASE
+        WHEN booking_type = 'Fixed' THEN grand_total
+        ELSE IFNULL(base_amount, 0) + IFNULL(night_charges, 0)
+            + CASE WHEN booking_type = 'Local'
+                THEN IFNULL(extra_hour_charges, 0) + IFNULL(extra_km_charges, 0) ELSE 0 END
+            + IFNULL(billable_expense_total, 0) + IFNULL(tax_total, 0)
+    END
+"""
+
+@contextmanager
+def coalesce_booking_recompute():
+    """
+    Defer expense-triggered booking recomputes while the block runs (bulk submits,
+    finalize, expense batches) and apply exactly one UPDATE per booking on exit.
+    Nested blocks are folded into the outermost one.
+    """
+    if getattr(frappe.local, "safarwaala_pending_expense_deltas", None) is not None:
+        yield
+        return
+
+    pending = frappe.local.safarwaala_pending_expense_deltas = {}
+    try:
+        yield
+    finally:
+        frappe.local.safarwaala_pending_expense_deltas = None
+
+    for booking, delta in pending.items():
+        _update_expense_aggregates(booking, delta)
+
+def apply_expense_delta(booking, delta):
+    """
+    Add (expense, billable, driver) deltas to a booking and recompute grand_total
+    in a single atomic UPDATE. No document load, no Version row.
+    Inside `coalesce_booking_recompute` the delta is accumulated instead.
+    """
+    if not booking or not any(flt(d) for d in delta):
+        return
+
+    pending = getattr(frappe.local, "safarwaala_pending_expense_deltas", None)
+    if pending is not None:
+        current = pending.get(booking, (0.0, 0.0, 0.0))
+        pending[booking] = tuple(flt(c) + flt(d) for c, d in zip(current, delta))
+        return
+
+    _update_expense_aggregates(booking, delta)
+
+def _update_expense_aggregates(booking, delta):
+    if not any(flt(d) for d in delta):
+        return
+
+    expense, billable, driver = (flt(d) for d in delta)
+    before = frappe.db.get_value(
+        "Bookings Master", booking,
+        ["docstatus", "grand_total", "pickup_datetime", "creation", "assigned_to", "driver", "car", "car_modal", "booking_type"],
+        as_dict=True, for_update=True,
+    )
+    if not before:
+        return
+
+    # MariaDB applies SET assignments left to right, so grand_total sees the new billable total
+    frappe.db.sql(f"""
+        UPDATE `tabBookings Master`
+        SET expense_total = IFNULL(expense_total, 0) + %(expense)s,
+            billable_expense_total = IFNULL(billable_expense_total, 0) + %(billable)s,
+            driver_expense_total = IFNULL(driver_expense_total, 0) + %(driver)s,
+            grand_total = {GRAND_TOTAL_SQL},
+            modified = %(modified)s
+        WHERE name = %(booking)s AND docstatus < 2
+    """, {
+        "expense": expense,
+        "billable": billable,
+        "driver": driver,
+        "modified": frappe.utils.now(),
+        "booking": booking,
+    })
+
+    # A submitted booking is counted in its daily rollup; cancel subtracts the current
+    # totals, so the rollup has to follow every change made after submit
+    if before.docstatus == 1:
+        grand_total = frappe.db.get_value("Bookings Master", booking, "grand_total")
+        add_to_booking_rollup(before, {
+            "grand_total": flt(grand_total) - flt(before.grand_total),
+            "expenses": expense,
+        })
+
+def reconcile_expense_aggregates(booking=None, fix=False):
+    """
+    Rebuild expense aggregates from Vehicle Expense Log and return the drifted rows
+    (stored vs recomputed totals); bench execute prints them.
+    bench --site <site> execute safarwaala.safarwaala.doctype.bookings_master.bookings_master.reconcile_expense_aggregates --kwargs "{'fix': 1}"
+    """
+    condition = "AND bm.name = %(booking)s" if booking else ""
+    drift = frappe.db.sql(f"""
+        SELECT bm.name,
+            IFNULL(bm.expense_total, 0) AS stored_expense,
+            IFNULL(bm.billable_expense_total, 0) AS stored_billable,
+            IFNULL(bm.driver_expense_total, 0) AS stored_driver,
+            IFNULL(e.expense, 0) AS expense,
+            IFNULL(e.billable, 0) AS billable,
+            IFNULL(e.driver, 0) AS driver
+        FROM `tabBookings Master` bm
+        LEFT JOIN (
+            SELECT booking_ref,
+                SUM(amount) AS expense,
+                SUM(CASE WHEN is_billable = 1 THEN amount ELSE 0 END) AS billable,
+                SUM(CASE WHEN paid_by = 'Driver' THEN amount ELSE 0 END) AS driver
+            FROM `tabVehicle Expense Log`
+            GROUP BY booking_ref
+        ) e ON e.booking_ref = bm.name
+        WHERE bm.docstatus < 2 {condition}
+        HAVING ABS(stored_expense - expense) > 0.005
+            OR ABS(stored_billable - billable) > 0.005
+            OR ABS(stored_driver - driver) > 0.005
+    """, {"booking": booking}, as_dict=True)
+
+    logger = frappe.logger("safarwaala.expense_aggregates")
+    for row in drift:
+        logger.warning(f"{row.name}: expense {row.stored_expense} -> {row.expense}, "
+                       f"billable {row.stored_billable} -> {row.billable}, driver {row.stored_driver} -> {row.driver}")
+        if fix:
+            # Applied as a delta so a submitted booking's daily rollup moves with it
+            _update_expense_aggregates(row.name, (
+                row.expense - row.stored_expense,
+                row.billable - row.stored_billable,
+                row.driver - row.stored_driver,
+            ))
+
+    if fix and drift:
+        frappe.db.commit()
+
+    logger.info(f"{len(drift)} booking(s) with drifted expense aggregates{' fixed' if fix else ''}.")
+    return drift
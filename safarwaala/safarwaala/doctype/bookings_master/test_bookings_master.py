@@ -1,9 +1,282 @@
 # Copyright (c) 2025, rahul and Contributors
 # See license.txt
 
-# import frappe
+from unittest.mock import patch
+
+import frappe
 from frappe.tests.utils import FrappeTestCase
 
+from safarwaala.api import dashboard_stats
+from safarwaala.api.booking import finalize_bookings_job, get_my_bookings_page, log_expenses
+from safarwaala.api.pricing import get_quotes
+from safarwaala.api.repricing import reprice_bookings_job
+from safarwaala.api.rollup import get_rollup_name
+from safarwaala.safarwaala.doctype.bookings_master import bookings_master
+from safarwaala.safarwaala.doctype.bookings_master.bookings_master import BookingsMaster
+
 
 class TestBookingsMaster(FrappeTestCase):
-	pass
+	def setUp(self):
+		if not frappe.db.exists("Car Modals", "_Test Sedan-(Petrol)"):
+			frappe.get_doc({
+				"doctype": "Car Modals",
+				"modal_name": "_Test Sedan",
+				"fuel_type": "Petrol",
+				"category": "Sedan",
+				"seating_capacity": 4,
+				"per_km_rate": 12,
+				"min_km_day": 250,
+				"night_rate": 300,
+			}).insert(ignore_permissions=True)
+		if not frappe.db.exists("Cars", "_TEST-CAR-01"):
+			frappe.get_doc({"doctype": "Cars", "license_plate": "_TEST-CAR-01", "modal": "_Test Sedan-(Petrol)"}).insert(
+				ignore_permissions=True
+			)
+
+		self.booking = frappe.get_doc({
+			"doctype": "Bookings Master",
+			"booking_type": "Outstation",
+			"car_modal": "_Test Sedan-(Petrol)",
+			"car": "_TEST-CAR-01",
+			"pickup_datetime": "2026-01-01 10:00:00",
+			"return_datetime": "2026-01-03 22:00:00",
+		}).insert(ignore_permissions=True)
+
+	def count_recomputes(self):
+		saves = patch.object(BookingsMaster, "save", autospec=True, side_effect=BookingsMaster.save)
+		updates = patch.object(
+			bookings_master, "_update_expense_aggregates", wraps=bookings_master._update_expense_aggregates
+		)
+		return saves, updates
+
+	def test_expense_batch_recomputes_booking_once(self):
+		expenses = [{"expense_type": "Toll", "amount": 100} for _ in range(15)]
+		saves, updates = self.count_recomputes()
+		with saves as save_mock, updates as update_mock:
+			result = log_expenses(expenses, booking_ref=self.booking.name)
+
+		self.assertTrue(result["success"])
+		self.assertEqual(save_mock.call_count, 0)
+		self.assertEqual(update_mock.call_count, 1)
+
+		totals = frappe.db.get_value(
+			"Bookings Master", self.booking.name, ["expense_total", "billable_expense_total", "grand_total"], as_dict=True
+		)
+		self.assertEqual(totals.expense_total, 1500)
+		self.assertEqual(totals.billable_expense_total, 1500)
+		# 3 days x 250 km x 12 + 2 nights x 300 + 1500 tolls
+		self.assertEqual(totals.grand_total, 9000 + 600 + 1500)
+
+	def test_expense_inserted_as_submitted_counts_once(self):
+		frappe.get_doc({
+			"doctype": "Vehicle Expense Log",
+			"docstatus": 1,
+			"expense_date": "2026-01-02",
+			"expense_type": "Toll",
+			"amount": 250,
+			"is_billable": 1,
+			"car": "_TEST-CAR-01",
+			"booking_ref": self.booking.name,
+			"paid_by": "Driver",
+		}).insert(ignore_permissions=True)
+
+		totals = frappe.db.get_value(
+			"Bookings Master",
+			self.booking.name,
+			["expense_total", "billable_expense_total", "driver_expense_total", "grand_total"],
+			as_dict=True,
+		)
+		self.assertEqual(totals.expense_total, 250)
+		self.assertEqual(totals.billable_expense_total, 250)
+		self.assertEqual(totals.driver_expense_total, 250)
+		self.assertEqual(totals.grand_total, 9000 + 600 + 250)
+
+	def test_submit_with_expenses_saves_booking_once(self):
+		log_expenses([{"expense_type": "Toll", "amount": 100} for _ in range(15)], booking_ref=self.booking.name)
+		booking = frappe.get_doc("Bookings Master", self.booking.name)
+
+		saves, updates = self.count_recomputes()
+		with saves as save_mock, updates as update_mock:
+			booking.submit()
+
+		# Only the submit itself saves the booking; the 15 expense submits never do
+		self.assertEqual(save_mock.call_count, 1)
+		self.assertLessEqual(update_mock.call_count, 1)
+		self.assertFalse(
+			frappe.db.exists("Vehicle Expense Log", {"booking_ref": booking.name, "docstatus": 0})
+		)
+		self.assertEqual(frappe.db.get_value("Bookings Master", booking.name, "expense_total"), 1500)
+
+	def test_quote_matches_booking(self):
+		self.booking.start_km, self.booking.end_km = 1000, 1900
+		self.booking.save(ignore_permissions=True)
+
+		quotes = get_quotes(
+			"Outstation", self.booking.pickup_datetime, self.booking.return_datetime,
+			start_km=1000, end_km=1900,
+		)["quotes"]
+		quote = next(q for q in quotes if q["car_modal"] == self.booking.car_modal)
+
+		for field in ("min_km", "total_km", "base_amount", "night_charges"):
+			self.assertEqual(quote[field], self.booking.get(field), field)
+		self.assertEqual(quote["fare"], self.booking.grand_total)
+		self.assertEqual([q["fare"] for q in quotes], sorted(q["fare"] for q in quotes))
+
+	def test_reprice_drafts(self):
+		modal = frappe.get_doc("Car Modals", self.booking.car_modal)
+		modal.per_km_rate = 15
+		modal.save(ignore_permissions=True)
+		try:
+			report = reprice_bookings_job(car_modals=[modal.name], dry_run=1)
+			entry = next(b for b in report["bookings"] if b["booking"] == self.booking.name)
+			self.assertEqual(entry["changes"]["per_km_rate"], [12, 15])
+			self.assertEqual(frappe.db.get_value("Bookings Master", self.booking.name, "per_km_rate"), 12)
+
+			with patch.object(frappe.db, "commit"):
+				reprice_bookings_job(car_modals=[modal.name], dry_run=0)
+
+			repriced = frappe.get_doc("Bookings Master", self.booking.name)
+			self.assertEqual(repriced.per_km_rate, 15)
+			stored_total = repriced.grand_total
+			repriced.validate()
+			self.assertEqual(repriced.grand_total, stored_total)
+			self.assertEqual(stored_total - self.booking.grand_total, entry["grand_total_delta"])
+		finally:
+			modal.reload()
+			modal.per_km_rate = 12
+			modal.save(ignore_permissions=True)
+
+	def test_reprice_keeps_hand_set_rates(self):
+		frappe.db.set_value("Bookings Master", self.booking.name, {"per_km_rate": 11, "min_km": 500})
+		modal = frappe.get_doc("Car Modals", self.booking.car_modal)
+		modal.per_km_rate = 15
+		modal.min_km_day = 300
+		modal.save(ignore_permissions=True)
+		try:
+			with patch.object(frappe.db, "commit"):
+				report = reprice_bookings_job(car_modals=[modal.name], dry_run=0)
+
+			entry = next(b for b in report["bookings"] if b["booking"] == self.booking.name)
+			self.assertEqual(entry["kept_manual"], {"per_km_rate": 11, "min_km": 500})
+			self.assertEqual(
+				tuple(frappe.db.get_value("Bookings Master", self.booking.name, ["per_km_rate", "min_km"])), (11, 500)
+			)
+		finally:
+			modal.reload()
+			modal.per_km_rate = 12
+			modal.min_km_day = 250
+			modal.save(ignore_permissions=True)
+
+	def test_finalize_bookings_job_invoices_each_chunk(self):
+		other = frappe.copy_doc(self.booking).insert(ignore_permissions=True)
+		submitted = frappe.copy_doc(self.booking).insert(ignore_permissions=True)
+		submitted.submit()
+
+		with patch.object(frappe.db, "commit"):
+			results = finalize_bookings_job([self.booking.name, submitted.name, other.name], chunk_size=2)
+
+		self.assertEqual([r["success"] for r in results], [True, False, True])
+		for name in (self.booking.name, other.name):
+			booking = frappe.db.get_value("Bookings Master", name, ["docstatus", "booking_status", "linked_invoice"], as_dict=True)
+			self.assertEqual(booking.docstatus, 1)
+			self.assertEqual(booking.booking_status, "Invoiced")
+			self.assertEqual(frappe.db.get_value("Customer Invoice", {"booking_id": name}), booking.linked_invoice)
+
+	def test_finalize_bookings_job_rolls_back_only_the_failing_booking(self):
+		other = frappe.copy_doc(self.booking).insert(ignore_permissions=True)
+		submit = BookingsMaster.submit
+
+		def fail_for_first(doc):
+			if doc.name == self.booking.name:
+				frappe.throw("Missing odometer reading")
+			return submit(doc)
+
+		with patch.object(BookingsMaster, "submit", autospec=True, side_effect=fail_for_first), \
+			patch.object(frappe.db, "commit"):
+			results = finalize_bookings_job([self.booking.name, other.name])
+
+		self.assertFalse(results[0]["success"])
+		self.assertTrue(results[1]["success"])
+		self.assertEqual(frappe.db.get_value("Bookings Master", self.booking.name, "docstatus"), 0)
+		self.assertFalse(frappe.db.exists("Customer Invoice", {"booking_id": self.booking.name}))
+		self.assertTrue(frappe.db.exists("Customer Invoice", {"booking_id": other.name}))
+
+	def test_finalize_marks_dashboard_stats_stale(self):
+		if not frappe.db.exists("Vendors", "_Test Vendor"):
+			frappe.get_doc({"doctype": "Vendors", "company_name": "_Test Vendor"}).insert(ignore_permissions=True)
+		driver = frappe.get_doc({"doctype": "Drivers", "name1": "_Test Driver", "owner_vendor": "_Test Vendor"}).insert(
+			ignore_permissions=True
+		)
+		self.booking.assigned_to = "_Test Vendor"
+		self.booking.driver = driver.name
+		self.booking.save(ignore_permissions=True)
+
+		with patch.object(dashboard_stats, "mark_stats_stale") as mark_stats_stale, patch.object(frappe.db, "commit"):
+			results = finalize_bookings_job([self.booking.name])
+
+		self.assertTrue(results[0]["success"], results)
+		self.assertTrue(frappe.db.exists("Customer Invoice", {"vendor": "_Test Vendor"}))
+		# The bulk-inserted invoice and payout skip doc_events; the job marks their scopes itself
+		marked = {call.args for call in mark_stats_stale.call_args_list}
+		self.assertIn(("vendor", "_Test Vendor"), marked)
+		self.assertIn(("vendor", dashboard_stats.ALL_VENDORS), marked)
+		self.assertIn(("driver", driver.name), marked)
+
+	def test_expense_after_submit_keeps_rollup_in_step(self):
+		key = {
+			"date": "2026-01-01", "vendor": None, "driver": None, "car": self.booking.car,
+			"car_modal": self.booking.car_modal, "booking_type": self.booking.booking_type,
+		}
+		fields = ["trips", "grand_total", "expenses"]
+
+		def rollup():
+			row = frappe.db.get_value("Booking Daily Rollup", get_rollup_name(key), fields, as_dict=True)
+			return [row.get(f) if row else 0 for f in fields]
+
+		start = rollup()
+		self.booking.submit()
+		submitted = rollup()
+		self.assertEqual(submitted, [start[0] + 1, start[1] + self.booking.grand_total, start[2]])
+
+		log_expenses([{"expense_type": "Toll", "amount": 250}], booking_ref=self.booking.name)
+		self.assertEqual(rollup(), [submitted[0], submitted[1] + 250, submitted[2] + 250])
+
+		booking = frappe.get_doc("Bookings Master", self.booking.name)
+		self.assertEqual(booking.grand_total, self.booking.grand_total + 250)
+		booking.cancel()
+		self.assertEqual(rollup(), start)
+
+	def test_incremental_sync_reports_reassigned_and_deleted_bookings(self):
+		first, second = (
+			frappe.get_doc({"doctype": "Drivers", "name1": name}).insert(ignore_permissions=True)
+			for name in ("_Test Sync Driver", "_Test Other Driver")
+		)
+		user = "sync-driver@example.com"
+		frappe.local.safarwaala_principals = {
+			user: frappe._dict(user=user, roles=["Driver"], is_admin=False, vendor=None, driver=first.name, customer=None),
+		}
+		self.addCleanup(frappe.set_user, "Administrator")
+		self.addCleanup(setattr, frappe.local, "safarwaala_principals", {})
+
+		self.booking.driver = first.name
+		self.booking.save(ignore_permissions=True)
+		doomed = frappe.copy_doc(self.booking).insert(ignore_permissions=True)
+		kept = frappe.copy_doc(self.booking).insert(ignore_permissions=True)
+		frappe.db.after_commit.run()
+
+		frappe.set_user(user)
+		token = get_my_bookings_page()["sync_token"]
+		frappe.set_user("Administrator")
+
+		self.booking.driver = second.name
+		self.booking.save(ignore_permissions=True)
+		frappe.delete_doc("Bookings Master", doomed.name, ignore_permissions=True)
+		kept.save(ignore_permissions=True)
+		frappe.db.after_commit.run()
+
+		frappe.set_user(user)
+		page = get_my_bookings_page(since=token)
+		self.assertEqual([row.name for row in page["data"]], [kept.name])
+		self.assertEqual(page["removed"], sorted([self.booking.name, doomed.name]))
+		self.assertFalse(page["resync"])
+		self.assertTrue(get_my_bookings_page(since="2020-01-01 00:00:00")["resync"])
@@ -3,7 +3,17 @@
 
 # import frappe
 from frappe.model.document import Document
+from safarwaala.api.rate_card import bump_rate_card_version_after_commit
+from safarwaala.api.repricing import remember_previous_rates
 
 
 class CarModals(Document):
-	pass
+	def on_update(self):
+		remember_previous_rates(self)
+		bump_rate_card_version_after_commit()
+
+	def on_trash(self):
+		bump_rate_card_version_after_commit()
+
+	def after_rename(self, old, new, merge=False):
+		bump_rate_card_version_after_commit()
@@ -0,0 +1,83 @@
+# Copyright (c) 2026, rahul and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import flt
+
+
+class DriverBalance(Document):
+	pass
+
+
+def apply_driver_balance_delta(driver, earned=0, paid=0):
+	"""Atomically add to a driver's running totals, creating the row on first use."""
+	earned, paid = flt(earned), flt(paid)
+	if not driver or not (earned or paid):
+		return
+
+	now = frappe.utils.now()
+	frappe.db.sql("""
+		INSERT INTO `tabDriver Balance`
+			(name, driver, total_earned, total_paid, balance, creation, modified, owner, modified_by, docstatus)
+		VALUES (%(driver)s, %(driver)s, %(earned)s, %(paid)s, %(earned)s - %(paid)s, %(now)s, %(now)s, %(user)s, %(user)s, 0)
+		ON DUPLICATE KEY UPDATE
+			total_earned = total_earned + VALUES(total_earned),
+			total_paid = total_paid + VALUES(total_paid),
+			balance = balance + VALUES(balance),
+			modified = VALUES(modified)
+	""", {"driver": driver, "earned": earned, "paid": paid, "now": now, "user": frappe.session.user})
+
+
+def get_duty_slip_earnings(duty_slip):
+	"""Amount a submitted Duty Slip adds to the driver ledger (see report/driver_ledger)."""
+	earned = sum(flt(row.amount) for row in duty_slip.get("expenses") or [])
+	return earned if earned > 0 else 0
+
+
+def get_driver_balances(vendor=None, drivers=None):
+	"""{driver: balance} for a vendor's drivers (or the given drivers) in one query."""
+	conditions, values = [], {}
+	if vendor:
+		conditions.append("d.owner_vendor = %(vendor)s")
+		values["vendor"] = vendor
+	if drivers:
+		conditions.append("d.name IN %(drivers)s")
+		values["drivers"] = tuple(drivers)
+	if not conditions:
+		return {}
+
+	rows = frappe.db.sql(f"""
+		SELECT d.name, IFNULL(b.balance, 0)
+		FROM `tabDrivers` d
+		LEFT JOIN `tabDriver Balance` b ON b.name = d.name
+		WHERE {" AND ".join(conditions)}
+	""", values)
+	return {driver: flt(balance) for driver, balance in rows}
+
+
+def rebuild_driver_balances():
+	"""Recompute every driver's totals from submitted Duty Slips and Driver Payments."""
+	frappe.db.sql("DELETE FROM `tabDriver Balance`")
+	frappe.db.sql("""
+		INSERT INTO `tabDriver Balance`
+			(name, driver, total_earned, total_paid, balance, creation, modified, owner, modified_by, docstatus)
+		SELECT t.driver, t.driver, SUM(t.earned), SUM(t.paid), SUM(t.earned) - SUM(t.paid),
+			NOW(6), NOW(6), 'Administrator', 'Administrator', 0
+		FROM (
+			SELECT ds.driver, SUM(te.amount) AS earned, 0 AS paid
+			FROM `tabDuty Slips` ds
+			JOIN `tabTrip Expenses Item` te ON te.parent = ds.name AND te.parenttype = 'Duty Slips'
+			WHERE ds.docstatus = 1 AND ds.driver IS NOT NULL
+			GROUP BY ds.name, ds.driver
+			HAVING earned > 0
+
+			UNION ALL
+
+			SELECT p.driver, 0 AS earned, SUM(p.amount) AS paid
+			FROM `tabDriver Payment` p
+			WHERE p.docstatus = 1 AND p.driver IS NOT NULL
+			GROUP BY p.driver
+		) t
+		GROUP BY t.driver
+	""")
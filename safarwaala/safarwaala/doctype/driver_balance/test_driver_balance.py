@@ -0,0 +1,63 @@
+# Copyright (c) 2026, rahul and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from safarwaala.safarwaala.doctype.driver_balance.driver_balance import get_driver_balances, rebuild_driver_balances
+
+BALANCE_FIELDS = ["total_earned", "total_paid", "balance"]
+
+
+class TestDriverBalance(FrappeTestCase):
+	def setUp(self):
+		if not frappe.db.exists("Vendors", "_Test Balance Vendor"):
+			frappe.get_doc({"doctype": "Vendors", "company_name": "_Test Balance Vendor"}).insert(ignore_permissions=True)
+		self.driver = frappe.get_doc({
+			"doctype": "Drivers", "name1": "_Test Balance Driver", "owner_vendor": "_Test Balance Vendor",
+		}).insert(ignore_permissions=True)
+		self.booking = frappe.get_doc({
+			"doctype": "Bookings Master", "booking_type": "Fixed", "grand_total": 5000,
+		}).insert(ignore_permissions=True)
+
+	def duty_slip(self, *amounts):
+		slip = frappe.get_doc({
+			"doctype": "Duty Slips",
+			"driver": self.driver.name,
+			"expenses": [{"label": "Trip", "amount": amount} for amount in amounts],
+		}).insert(ignore_permissions=True)
+		slip.submit()
+		return slip
+
+	def payment(self, amount):
+		payment = frappe.get_doc({
+			"doctype": "Driver Payment",
+			"booking_type": "Bookings Master",
+			"booking_id": self.booking.name,
+			"driver": self.driver.name,
+			"amount": amount,
+			"payment_date": "2026-01-15",
+		}).insert(ignore_permissions=True)
+		payment.submit()
+		return payment
+
+	def stored(self):
+		row = frappe.db.get_value("Driver Balance", self.driver.name, BALANCE_FIELDS, as_dict=True)
+		return [row.get(f) for f in BALANCE_FIELDS] if row else [0, 0, 0]
+
+	def test_submit_and_cancel_match_rebuild(self):
+		self.duty_slip(1200, 300)
+		cancelled_slip = self.duty_slip(800)
+		self.payment(500)
+		cancelled_payment = self.payment(250)
+		self.assertEqual(self.stored(), [2300, 750, 1550])
+
+		cancelled_slip.cancel()
+		cancelled_payment.cancel()
+		self.assertEqual(self.stored(), [1500, 500, 1000])
+		self.assertEqual(get_driver_balances(vendor="_Test Balance Vendor")[self.driver.name], 1000)
+
+		incremental = self.stored()
+		rebuild_driver_balances()
+		self.assertEqual(self.stored(), incremental)
+		self.assertEqual(get_driver_balances(drivers=[self.driver.name]), {self.driver.name: 1000})
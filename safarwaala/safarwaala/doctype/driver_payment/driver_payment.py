@@ -3,6 +3,11 @@
 
 import frappe
 from frappe.model.document import Document
+from safarwaala.safarwaala.doctype.driver_balance.driver_balance import apply_driver_balance_delta
 
 class DriverPayment(Document):
-	pass
+	def on_submit(self):
+		apply_driver_balance_delta(self.driver, paid=self.amount)
+
+	def on_cancel(self):
+		apply_driver_balance_delta(self.driver, paid=-self.amount)
@@ -3,6 +3,7 @@
 
 import frappe
 from frappe.model.document import Document
+from safarwaala.api.permission import clear_linked_principal_cache
 
 class Drivers(Document):
 	def validate(self):
@@ -61,6 +62,7 @@ class Drivers(Document):
 			
 			# Update self with new link
 			frappe.db.set_value(self.doctype, self.name, "linked_user", new_user.name)
+			clear_linked_principal_cache(new_user.name)
 		
 		# If user existed but we needed to ensure role
 		if self.create_user == 1 and self.email:
@@ -76,6 +78,7 @@ class Drivers(Document):
 				# Ensure link is set if it wasn't
 				if self.linked_user != target_user:
 					frappe.db.set_value(self.doctype, self.name, "linked_user", target_user)
+					clear_linked_principal_cache(target_user)
 		
 
 
@@ -3,7 +3,15 @@
 
 # import frappe
 from frappe.model.document import Document
+from safarwaala.safarwaala.doctype.driver_balance.driver_balance import (
+	apply_driver_balance_delta,
+	get_duty_slip_earnings,
+)
 
 
 class DutySlips(Document):
-	pass
+	def on_submit(self):
+		apply_driver_balance_delta(self.driver, earned=get_duty_slip_earnings(self))
+
+	def on_cancel(self):
+		apply_driver_balance_delta(self.driver, earned=-get_duty_slip_earnings(self))
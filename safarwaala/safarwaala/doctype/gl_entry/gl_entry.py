@@ -3,31 +3,134 @@
 
 import frappe
 from frappe.model.document import Document
+from frappe.utils import flt
+
+# Running balance per account in posting order (creation, name) over submitted entries
+RUNNING_BALANCE_SQL = """
+	SUM(IFNULL(debit, 0) - IFNULL(credit, 0)) OVER (PARTITION BY account ORDER BY creation, name)
+"""
 
 class GLEntry(Document):
 	def on_submit(self):
-		self.update_bank_balance()
+		self.update_bank_balance(flt(self.debit) - flt(self.credit))
 
 	def on_cancel(self):
-		self.update_bank_balance()
+		self.update_bank_balance(flt(self.credit) - flt(self.debit))
 
 	def on_trash(self):
-		self.update_bank_balance()
+		# Cancelled and draft entries no longer count towards the balance
+		if self.docstatus == 1:
+			self.update_bank_balance(flt(self.credit) - flt(self.debit), removed=True)
 
-	def update_bank_balance(self):
+	def update_bank_balance(self, delta, removed=False):
 		if not self.account:
 			return
-            
-		bank = frappe.get_doc("Bank Account", self.account)
-		
-		# Let's aggregate from GL Entry (only submitted or active?)
-		# Standard: Only Docstatus 1 (Submitted). 
-		result = frappe.db.sql("""
-			SELECT SUM(debit) - SUM(credit)
+
+		# The UPDATE takes the row lock on the bank account, so concurrent postings
+		# serialize here, including the running balance update below.
+		if delta:
+			frappe.db.sql("""
+				UPDATE `tabBank Account`
+				SET balance = IFNULL(balance, 0) + %s, modified = %s
+				WHERE name = %s
+			""", (delta, frappe.utils.now(), self.account))
+
+		self.update_running_balances(exclude=self.name if removed else None)
+
+	def update_running_balances(self, exclude=None):
+		"""
+		Recompute GL Entry.balance from this entry onwards in the account's posting order,
+		starting from the stored balance of the entry before it. A new entry is usually the
+		last one, so only its own row is written; cancelling an earlier entry also moves
+		every later one.
+		"""
+		opening = frappe.db.sql("""
+			SELECT balance FROM `tabGL Entry`
+			WHERE account = %(account)s AND docstatus = 1 AND name != %(exclude)s
+				AND (creation < %(creation)s OR (creation = %(creation)s AND name < %(name)s))
+			ORDER BY creation DESC, name DESC
+			LIMIT 1
+		""", {"account": self.account, "creation": self.creation, "name": self.name, "exclude": exclude or ""})
+
+		frappe.db.sql(f"""
+			UPDATE `tabGL Entry` gl
+			JOIN (
+				SELECT name, %(opening)s + {RUNNING_BALANCE_SQL} AS running_balance
+				FROM `tabGL Entry`
+				WHERE account = %(account)s AND docstatus = 1 AND name != %(exclude)s
+					AND (creation > %(creation)s OR (creation = %(creation)s AND name >= %(name)s))
+			) r ON r.name = gl.name
+			SET gl.balance = r.running_balance
+		""", {
+			"opening": flt(opening[0][0]) if opening else 0,
+			"account": self.account,
+			"creation": self.creation,
+			"name": self.name,
+			"exclude": exclude or "",
+		})
+
+
+def rebuild_running_balances():
+	"""Recompute GL Entry.balance for every submitted entry with one window-function UPDATE."""
+	frappe.db.sql(f"""
+		UPDATE `tabGL Entry` gl
+		JOIN (
+			SELECT name, {RUNNING_BALANCE_SQL} AS running_balance
+			FROM `tabGL Entry`
+			WHERE docstatus = 1
+		) r ON r.name = gl.name
+		SET gl.balance = r.running_balance
+	""")
+
+
+def verify_bank_balances(fix=False):
+	"""
+	Compare each Bank Account's incrementally maintained balance, and each submitted
+	GL Entry's running balance, with a full recomputation over submitted GL Entries.
+	Runs daily from the scheduler.
+	"""
+	drift = frappe.db.sql("""
+		SELECT ba.name, IFNULL(ba.balance, 0) AS balance, IFNULL(gl.balance, 0) AS expected
+		FROM `tabBank Account` ba
+		LEFT JOIN (
+			SELECT account, SUM(debit) - SUM(credit) AS balance
+			FROM `tabGL Entry`
+			WHERE docstatus = 1
+			GROUP BY account
+		) gl ON gl.account = ba.name
+		HAVING ABS(balance - expected) > 0.005
+	""", as_dict=True)
+
+	entry_drift = frappe.db.sql(f"""
+		SELECT name, account, balance, expected
+		FROM (
+			SELECT name, account, IFNULL(balance, 0) AS balance, {RUNNING_BALANCE_SQL} AS expected
 			FROM `tabGL Entry`
-			WHERE account = %s AND docstatus = 1
-		""", (self.account))
-		
-		balance = result[0][0] if result and result[0][0] else 0
-		bank.balance = balance
-		bank.save(ignore_permissions=True)
+			WHERE docstatus = 1
+		) r
+		WHERE ABS(balance - expected) > 0.005
+	""", as_dict=True)
+
+	for row in drift:
+		frappe.log_error(
+			f"Bank Account {row.name}: stored balance {row.balance}, GL Entries sum to {row.expected}",
+			"Bank Balance Drift",
+		)
+		if fix:
+			frappe.db.set_value("Bank Account", row.name, "balance", row.expected)
+
+	if entry_drift:
+		frappe.log_error(
+			"\n".join(
+				f"GL Entry {row.name} ({row.account}): running balance {row.balance}, expected {row.expected}"
+				for row in entry_drift
+			),
+			"GL Running Balance Drift",
+		)
+		if fix:
+			rebuild_running_balances()
+
+	if fix and (drift or entry_drift):
+		frappe.db.commit()
+
+	return {"accounts": drift, "entries": entry_drift}
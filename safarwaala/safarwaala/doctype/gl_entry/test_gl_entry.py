@@ -0,0 +1,56 @@
+# Copyright (c) 2026, Safarwaala and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from safarwaala.safarwaala.doctype.gl_entry.gl_entry import verify_bank_balances
+
+ACCOUNT = "_Test GL Account"
+
+
+class TestGLEntry(FrappeTestCase):
+	def setUp(self):
+		if not frappe.db.exists("Bank Account", ACCOUNT):
+			frappe.get_doc({"doctype": "Bank Account", "account_name": ACCOUNT}).insert(ignore_permissions=True)
+		frappe.db.delete("GL Entry", {"account": ACCOUNT})
+		frappe.db.set_value("Bank Account", ACCOUNT, "balance", 0)
+
+	def post(self, debit=0, credit=0):
+		entry = frappe.get_doc({
+			"doctype": "GL Entry", "posting_date": "2026-01-01", "account": ACCOUNT, "debit": debit, "credit": credit,
+		}).insert(ignore_permissions=True)
+		entry.submit()
+		return entry
+
+	def running_balances(self, entries):
+		return [frappe.db.get_value("GL Entry", entry.name, "balance") for entry in entries]
+
+	def test_sequential_submits_keep_a_running_balance(self):
+		entries = [self.post(debit, credit) for debit, credit in [(1000, 0), (0, 300), (500, 0), (0, 200)]]
+
+		self.assertEqual(self.running_balances(entries), [1000, 700, 1200, 1000])
+		self.assertEqual(frappe.db.get_value("Bank Account", ACCOUNT, "balance"), 1000)
+		self.assertFalse([row for row in verify_bank_balances()["entries"] if row.account == ACCOUNT])
+
+	def test_cancelling_an_earlier_entry_moves_later_running_balances(self):
+		entries = [self.post(debit, credit) for debit, credit in [(1000, 0), (0, 300), (500, 0)]]
+
+		entries[1].cancel()
+
+		self.assertEqual(self.running_balances([entries[0], entries[2]]), [1000, 1500])
+		self.assertEqual(frappe.db.get_value("Bank Account", ACCOUNT, "balance"), 1500)
+		result = verify_bank_balances()
+		self.assertFalse([row for row in result["accounts"] if row.name == ACCOUNT])
+		self.assertFalse([row for row in result["entries"] if row.account == ACCOUNT])
+
+	def test_verify_finds_and_fixes_running_balance_drift(self):
+		entry = self.post(debit=400)
+		frappe.db.set_value("GL Entry", entry.name, "balance", 99, update_modified=False)
+
+		self.assertIn(entry.name, [row.name for row in verify_bank_balances()["entries"]])
+		with patch.object(frappe.db, "commit"):
+			verify_bank_balances(fix=True)
+		self.assertEqual(frappe.db.get_value("GL Entry", entry.name, "balance"), 400)
@@ -1,23 +1,51 @@
 # Copyright (c) 2025, Safarwaala and contributors
 # For license information, please see license.txt
 
-import frappe
 from frappe.model.document import Document
+from frappe.utils import flt
+from safarwaala.safarwaala.doctype.bookings_master.bookings_master import apply_expense_delta
 
 class VehicleExpenseLog(Document):
     def on_submit(self):
-        self.update_booking_total()
-        
+        # on_update runs first in the same save (including a direct insert with docstatus=1)
+        # and has already applied this change; applying it again would count it twice
+        if not self.flags.pop("expense_delta_applied", False):
+            self.update_booking_total()
+
     def on_update(self):
         # Also trigger on update (for non-submittable docs or updates)
         self.update_booking_total()
-        
+        self.flags.expense_delta_applied = True
+
     def on_trash(self):
-        self.update_booking_total()
+        self.update_booking_total(removed=True)
+
+    def get_expense_contribution(self):
+        """(expense_total, billable_expense_total, driver_expense_total) this log adds to its booking."""
+        amount = flt(self.amount)
+        return (
+            amount,
+            amount if self.is_billable else 0.0,
+            amount if self.paid_by == "Driver" else 0.0,
+        )
+
+    def update_booking_total(self, removed=False):
+        # Apply only the difference this change makes to the booking aggregates
+        # instead of re-saving the whole booking.
+        before = None if removed else self.get_doc_before_save()
+
+        if removed:
+            apply_expense_delta(self.booking_ref, [-v for v in self.get_expense_contribution()])
+            return
+
+        current = self.get_expense_contribution()
+        if not before:
+            apply_expense_delta(self.booking_ref, current)
+            return
 
-    def update_booking_total(self):
-        # We rely on booking_ref being the name of the Bookings Master
-        if self.booking_ref and frappe.db.exists("Bookings Master", self.booking_ref):
-            booking = frappe.get_doc("Bookings Master", self.booking_ref)
-            # Saving triggers validate() -> calculate_expenses() -> calculate_totals()
-            booking.save(ignore_permissions=True)
+        previous = before.get_expense_contribution()
+        if before.booking_ref != self.booking_ref:
+            apply_expense_delta(before.booking_ref, [-v for v in previous])
+            apply_expense_delta(self.booking_ref, current)
+        else:
+            apply_expense_delta(self.booking_ref, [c - p for c, p in zip(current, previous)])
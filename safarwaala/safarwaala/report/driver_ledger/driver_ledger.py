@@ -3,6 +3,7 @@
 
 import frappe
 from frappe import _
+from frappe.utils import add_days, flt, getdate
 
 def execute(filters=None):
 	columns, data = get_columns(), get_data(filters)
@@ -55,55 +56,108 @@ def get_columns():
 		}
 	]
 
+def get_conditions(filters):
+    """Date-range conditions for duty slips and payments, plus the query values."""
+    values = {"driver": filters.get("driver")}
+    ds_conditions, payment_conditions = [], []
+
+    if filters.get("from_date"):
+        values["from_date"] = getdate(filters.get("from_date"))
+        ds_conditions.append("ds.return_datetime >= %(from_date)s")
+        payment_conditions.append("p.payment_date >= %(from_date)s")
+
+    if filters.get("to_date"):
+        # return_datetime is a Datetime; include the whole of to_date
+        values["to_date_end"] = add_days(getdate(filters.get("to_date")), 1)
+        ds_conditions.append("ds.return_datetime < %(to_date_end)s")
+        payment_conditions.append("p.payment_date < %(to_date_end)s")
+
+    ds_where = "".join(f" AND {c}" for c in ds_conditions)
+    payment_where = "".join(f" AND {c}" for c in payment_conditions)
+    return ds_where, payment_where, values
+
+def get_opening_balance(values):
+    """Balance carried into from_date: one aggregate over everything posted before it."""
+    if not values.get("from_date"):
+        return 0
+
+    result = frappe.db.sql("""
+        SELECT
+            IFNULL((
+                SELECT SUM(slip.earned) FROM (
+                    SELECT SUM(te.amount) AS earned
+                    FROM `tabDuty Slips` ds
+                    JOIN `tabTrip Expenses Item` te ON te.parent = ds.name AND te.parenttype = 'Duty Slips'
+                    WHERE ds.driver = %(driver)s AND ds.docstatus = 1
+                        AND (ds.return_datetime < %(from_date)s OR ds.return_datetime IS NULL)
+                    GROUP BY ds.name
+                    HAVING earned > 0
+                ) slip
+            ), 0)
+            - IFNULL((
+                SELECT SUM(p.amount)
+                FROM `tabDriver Payment` p
+                WHERE p.driver = %(driver)s AND p.docstatus = 1
+                    AND (p.payment_date < %(from_date)s OR p.payment_date IS NULL)
+            ), 0)
+    """, values)
+
+    return flt(result[0][0]) if result else 0
+
 def get_data(filters):
-    if not filters.get("driver"):
+    if not filters or not filters.get("driver"):
         return []
 
-    data = []
-    
-    # 1. Get Earnings from Duty Slips (Sum of Expenses)
-    ds_filters = {"driver": filters.get("driver"), "docstatus": 1}
-    duty_slips = frappe.get_all("Duty Slips", filters=ds_filters, fields=["name", "return_datetime"])
-    
-    for ds in duty_slips:
-        # Sum expenses
-        expense_amount = frappe.db.sql("""
-            SELECT SUM(amount) FROM `tabTrip Expenses Item`
-            WHERE parent = %s
-        """, (ds.name,))
-        
-        amt = expense_amount[0][0] or 0
-        if amt > 0:
-            data.append({
-                "date": ds.return_datetime,
-                "voucher_type": "Duty Slips",
-                "voucher_no": ds.name,
-                "description": "Duty Slip Expenses",
-                "earned": amt,
-                "paid": 0,
-                "timestamp": ds.return_datetime 
-            })
-
-    # 2. Get Payments from Driver Payment
-    pymt_filters = {"driver": filters.get("driver"), "docstatus": 1}
-    payments = frappe.get_all("Driver Payment", filters=pymt_filters, fields=["name", "payment_date", "amount", "details"])
-    
-    for p in payments:
-        data.append({
-            "date": p.payment_date,
-            "voucher_type": "Driver Payment",
-            "voucher_no": p.name,
-            "description": p.details or "Payment",
+    ds_where, payment_where, values = get_conditions(filters)
+    opening = get_opening_balance(values)
+    values["opening"] = opening
+
+    # Earnings (sum of expenses per submitted Duty Slip) and payments in one pass,
+    # with the running balance computed by the database.
+    data = frappe.db.sql(f"""
+        SELECT
+            entries.date, entries.voucher_type, entries.voucher_no, entries.description,
+            entries.earned, entries.paid,
+            %(opening)s + SUM(entries.earned - entries.paid) OVER (
+                ORDER BY entries.date, entries.voucher_no
+                ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW
+            ) AS balance
+        FROM (
+            SELECT
+                ds.return_datetime AS date,
+                'Duty Slips' AS voucher_type,
+                ds.name AS voucher_no,
+                'Duty Slip Expenses' AS description,
+                SUM(te.amount) AS earned,
+                0 AS paid
+            FROM `tabDuty Slips` ds
+            JOIN `tabTrip Expenses Item` te ON te.parent = ds.name AND te.parenttype = 'Duty Slips'
+            WHERE ds.driver = %(driver)s AND ds.docstatus = 1{ds_where}
+            GROUP BY ds.name, ds.return_datetime
+            HAVING earned > 0
+
+            UNION ALL
+
+            SELECT
+                p.payment_date AS date,
+                'Driver Payment' AS voucher_type,
+                p.name AS voucher_no,
+                IFNULL(NULLIF(p.details, ''), 'Payment') AS description,
+                0 AS earned,
+                p.amount AS paid
+            FROM `tabDriver Payment` p
+            WHERE p.driver = %(driver)s AND p.docstatus = 1{payment_where}
+        ) entries
+        ORDER BY entries.date, entries.voucher_no
+    """, values, as_dict=True)
+
+    if values.get("from_date"):
+        data.insert(0, {
+            "date": values["from_date"],
+            "description": _("Opening Balance"),
             "earned": 0,
-            "paid": p.amount,
-            "timestamp": p.payment_date 
+            "paid": 0,
+            "balance": opening
         })
-        
-    data.sort(key=lambda x: str(x.get("timestamp") or ""))
-    
-    balance = 0
-    for row in data:
-        balance += (row.get("earned") or 0) - (row.get("paid") or 0)
-        row["balance"] = balance
-        
+
     return data
@@ -0,0 +1,225 @@
+# Copyright (c) 2026, rahul and Contributors
+# See license.txt
+
+import json
+import threading
+from types import SimpleNamespace as NS
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from safarwaala.api import ai_agent, conversation
+from safarwaala.api.intent import detect_intent
+from safarwaala.api.rate_card import CarIndex, bump_rate_card_version
+
+
+def _chunk(content=None, tool_calls=None):
+	return NS(choices=[NS(delta=NS(content=content, tool_calls=tool_calls))])
+
+
+def _tool_part(index, id=None, name=None, arguments=None):
+	return NS(index=index, id=id, function=NS(name=name, arguments=arguments))
+
+
+def _client(*streams):
+	client = MagicMock()
+	client.chat.completions.create.side_effect = [iter(stream) for stream in streams]
+	return client
+
+
+class TestAIAgent(FrappeTestCase):
+	def setUp(self):
+		frappe.cache().delete_keys(ai_agent.RESPONSE_CACHE_PREFIX)
+
+	def test_client_is_reused(self):
+		ai_agent._clients.clear()
+		self.assertIs(ai_agent.get_openai_client(), ai_agent.get_openai_client())
+
+	def test_streamed_tool_calls_are_assembled(self):
+		first = [
+			_chunk(tool_calls=[_tool_part(0, id="call_1", name="get_available_cars", arguments='{"passen')]),
+			_chunk(tool_calls=[_tool_part(0, arguments='gers": 4}')]),
+		]
+		second = [_chunk("Here are "), _chunk("your cars.")]
+		client = _client(first, second)
+
+		with patch.object(ai_agent, "get_openai_client", return_value=client), \
+			patch.object(ai_agent, "run_tool", return_value='{"success": true, "cars": [{"name": "Dzire"}]}') as run_tool, \
+			patch.object(frappe, "publish_realtime") as publish:
+			response = ai_agent.chat_agent("we are 4, what would you suggest?", stream=1, stream_id="s1")
+
+		run_tool.assert_called_once_with("get_available_cars", {"passengers": 4}, None)
+		self.assertEqual(response["content"], "Here are your cars.")
+		self.assertEqual(response["carOptions"], [{"name": "Dzire"}])
+		self.assertIsNotNone(response["metrics"]["ttft_ms"])
+
+		messages = [call.args[1] for call in publish.call_args_list]
+		self.assertEqual("".join(m.get("delta", "") for m in messages), "Here are your cars.")
+		self.assertTrue(messages[-1]["done"])
+		self.assertTrue(all(call.kwargs["task_id"] == "s1" for call in publish.call_args_list))
+
+	def test_without_stream_nothing_is_published(self):
+		message = NS(content="Namaste!", tool_calls=None)
+		client = MagicMock()
+		client.chat.completions.create.return_value = NS(choices=[NS(message=message)])
+
+		with patch.object(ai_agent, "get_openai_client", return_value=client), \
+			patch.object(frappe, "publish_realtime") as publish:
+			response = ai_agent.chat_agent("hi")
+
+		self.assertEqual(response["content"], "Namaste!")
+		publish.assert_not_called()
+
+	def test_read_tools_run_concurrently_in_order(self):
+		barrier = threading.Barrier(2, timeout=5)
+		order = []
+
+		def fake_tool(fn_name, fn_args, customer_id=None):
+			if fn_name in ai_agent.READ_ONLY_TOOLS:
+				# Both read tools must be in flight at once to get past the barrier
+				barrier.wait()
+			order.append(fn_name)
+			return json.dumps({"tool": fn_name})
+
+		tool_calls = [
+			{"id": str(i), "type": "function", "function": {"name": name, "arguments": "{}"}}
+			for i, name in enumerate(["create_lead", "get_available_cars", "estimate_trip_cost", "create_booking"])
+		]
+		with patch.object(ai_agent, "run_tool", side_effect=fake_tool):
+			results = ai_agent.run_tools(tool_calls)
+
+		self.assertEqual([name for name, _res, _ms in results], [t["function"]["name"] for t in tool_calls])
+		self.assertEqual([json.loads(res)["tool"] for _name, res, _ms in results], [name for name, _res, _ms in results])
+		# Write tools keep their relative order
+		writes = [name for name in order if name not in ai_agent.READ_ONLY_TOOLS]
+		self.assertEqual(writes, ["create_lead", "create_booking"])
+
+	def test_history_is_kept_server_side_within_budget(self):
+		session_id = conversation.new_session_id()
+		convo = conversation.get_conversation(session_id)
+		long_turn = "x" * 400  # ~100 tokens each
+		conversation.append_messages(convo, [
+			{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i} {long_turn}"} for i in range(40)
+		])
+		convo["summary"] = "Rahul wants a Sedan from Jaipur to Agra."
+		conversation.save_conversation(session_id, convo)
+
+		seen = []
+
+		def create(**kwargs):
+			seen.append(kwargs["messages"])
+			return NS(choices=[NS(message=NS(content="Done", tool_calls=None))])
+
+		client = MagicMock()
+		client.chat.completions.create.side_effect = create
+		with patch.object(ai_agent, "get_openai_client", return_value=client), \
+			patch.object(frappe, "enqueue") as enqueue:
+			response = ai_agent.chat_agent("and the price?", session_id=session_id)
+
+		prompt = seen[0]
+		self.assertEqual(response["session_id"], session_id)
+		self.assertIn("Rahul wants a Sedan", prompt[1]["content"])
+		self.assertLessEqual(
+			sum(conversation.estimate_tokens(m["content"]) for m in prompt[1:-1]), conversation.HISTORY_TOKEN_BUDGET
+		)
+		self.assertTrue(prompt[-2]["content"].startswith("39 "))
+		self.assertEqual(len(conversation.get_conversation(session_id)["messages"]), 42)
+		enqueue.assert_called_once()
+
+	def test_fast_path_skips_the_model(self):
+		estimate = json.dumps({"success": True, "message": "Sedan: ~2,400"})
+		client = MagicMock()
+		with patch.object(ai_agent, "get_openai_client", return_value=client), \
+			patch.object(ai_agent, "estimate_trip_cost", return_value=estimate) as estimate_trip_cost:
+			response = ai_agent.chat_agent("Price for 3 days from Delhi to Agra?")
+
+		estimate_trip_cost.assert_called_once_with(days=3, from_city="Delhi", to_city="Agra")
+		client.chat.completions.create.assert_not_called()
+		self.assertEqual(response["content"], "Sedan: ~2,400")
+		self.assertTrue(response["metrics"]["fast_path"])
+
+	def test_intents(self):
+		self.assertEqual(detect_intent("What cars do you have?"), ("get_available_cars", {}))
+		self.assertEqual(detect_intent("show me suv options for 7 pax"), ("get_available_cars", {"passengers": 7, "category": "SUV"}))
+		self.assertEqual(detect_intent("sedan rate for 2 nights"), ("estimate_trip_cost", {"days": 3}))
+		for message in ("book a sedan for 3 days", "plan a 3 day trip to jaipur", "cost?", "I am Rahul 9876543210 price 3 days"):
+			self.assertIsNone(detect_intent(message), message)
+
+	def test_opening_answers_are_cached_until_rate_card_changes(self):
+		message = NS(content="We serve all of Rajasthan.", tool_calls=None)
+		client = MagicMock()
+		client.chat.completions.create.return_value = NS(choices=[NS(message=message)])
+
+		with patch.object(ai_agent, "get_openai_client", return_value=client):
+			first = ai_agent.chat_agent("Which cities do you serve?")
+			again = ai_agent.chat_agent("which cities do you serve")
+			self.assertEqual(client.chat.completions.create.call_count, 1)
+			self.assertTrue(again["metrics"]["cached"])
+			self.assertEqual(first["content"], again["content"])
+
+			# Follow-up turns are not cached
+			ai_agent.chat_agent("which cities do you serve", session_id=first["session_id"])
+			self.assertEqual(client.chat.completions.create.call_count, 2)
+
+			bump_rate_card_version()
+			ai_agent.chat_agent("Which cities do you serve?")
+			self.assertEqual(client.chat.completions.create.call_count, 3)
+
+	def test_write_tool_turns_are_not_cached(self):
+		first = [_chunk(tool_calls=[_tool_part(0, id="call_1", name="create_lead", arguments="{}")])]
+		client = _client(first, [_chunk("Lead created.")], first, [_chunk("Lead created.")])
+		with patch.object(ai_agent, "get_openai_client", return_value=client), \
+			patch.object(ai_agent, "run_tool", return_value='{"success": true}') as run_tool:
+			ai_agent.chat_agent("Rahul here, please contact me", stream=1, stream_id="s2")
+			ai_agent.chat_agent("Rahul here, please contact me", stream=1, stream_id="s3")
+
+		self.assertEqual(run_tool.call_count, 2)
+
+	def test_car_index_matches_typos_and_categories(self):
+		card = frappe._dict
+		index = CarIndex([
+			card(name="Dzire-(Petrol)", modal_name="Swift Dzire", category="Sedan", seating_capacity=4),
+			card(name="Ertiga-(CNG)", modal_name="Ertiga", category="SUV", seating_capacity=6),
+			card(name="Innova Crysta-(Deisel)", modal_name="Innova Crysta", category="SUV", seating_capacity=7, aliases="Crysta, Toyota"),
+		])
+
+		def names(query, min_seats=None):
+			return [c.name for c, _score in index.search(query, min_seats=min_seats)]
+
+		self.assertEqual(names("inova")[0], "Innova Crysta-(Deisel)")
+		self.assertEqual(names("desire"), ["Dzire-(Petrol)"])
+		self.assertEqual(names("toyota"), ["Innova Crysta-(Deisel)"])
+		self.assertEqual(names("big car"), ["Ertiga-(CNG)", "Innova Crysta-(Deisel)"])
+		self.assertEqual(names("suv", min_seats=7), ["Innova Crysta-(Deisel)"])
+		self.assertEqual(names("sedan", min_seats=5), [])
+		self.assertEqual(names("bicycle"), [])
+
+	def test_fast_path_only_answers_opening_questions(self):
+		estimate = json.dumps({"success": True, "message": "Sedan: ~2,400"})
+		message = NS(content="For 7 passengers Jaipur to Jodhpur, an Innova is ~9,800.", tool_calls=None)
+		client = MagicMock()
+		client.chat.completions.create.return_value = NS(choices=[NS(message=message)])
+
+		with patch.object(ai_agent, "get_openai_client", return_value=client), \
+			patch.object(ai_agent, "estimate_trip_cost", return_value=estimate) as estimate_trip_cost:
+			first = ai_agent.chat_agent("price for 3 days")
+			follow_up = ai_agent.chat_agent("what's the price for 3 days?", session_id=first["session_id"])
+
+		estimate_trip_cost.assert_called_once()
+		client.chat.completions.create.assert_called_once()
+		self.assertFalse(follow_up["metrics"]["fast_path"])
+		self.assertEqual(follow_up["content"], message.content)
+
+	def test_metrics_errors_do_not_lose_the_answer(self):
+		message = NS(content="Namaste!", tool_calls=None)
+		client = MagicMock()
+		client.chat.completions.create.return_value = NS(choices=[NS(message=message)])
+
+		with patch.object(ai_agent, "get_openai_client", return_value=client), \
+			patch.object(ai_agent, "record_latency", side_effect=ConnectionError("redis down")), \
+			patch.object(ai_agent, "incr_stat", side_effect=ConnectionError("redis down")):
+			response = ai_agent.chat_agent("hi")
+
+		self.assertEqual(response["content"], "Namaste!")
+		self.assertEqual(len(conversation.get_conversation(response["session_id"])["messages"]), 2)
@@ -0,0 +1,200 @@
+# Copyright (c) 2026, rahul and Contributors
+# See license.txt
+
+import threading
+import time
+from unittest.mock import MagicMock, patch
+
+import frappe
+import requests
+from frappe.tests.utils import FrappeTestCase
+
+from safarwaala.api import map as ola_map
+from safarwaala.api import ola_client
+from safarwaala.api.map_cache import LOCK_KEY_PREFIX, geohash, single_flight
+from safarwaala.benchmarks import ola_standin
+
+
+def _prediction(text):
+	return {
+		"place_id": text,
+		"description": f"{text}, Rajasthan, India",
+		"structured_formatting": {"main_text": text, "secondary_text": "Rajasthan"},
+		"geometry": {"location": {"lat": 26.9, "lng": 75.8}},
+	}
+
+
+def _session(payload, status_code=200):
+	response = MagicMock(status_code=status_code)
+	response.json.return_value = payload
+	session = MagicMock()
+	session.request.return_value = response
+	return session
+
+
+class TestMapCache(FrappeTestCase):
+	def setUp(self):
+		# Patched on the module rather than set in frappe.conf: distance_matrix fetches on worker
+		# threads that load their own frappe.conf from site_config.json
+		api_key = patch.object(ola_map, "_get_ola_api_key", return_value="test-key")
+		api_key.start()
+		self.addCleanup(api_key.stop)
+		ola_map._autocomplete_lru.clear()
+		ola_client._breakers.clear()
+		frappe.cache().delete_keys(ola_map.AUTOCOMPLETE_CACHE_PREFIX)
+		frappe.cache().delete_keys(ola_map.DIRECTIONS_CACHE_PREFIX)
+		frappe.db.delete("Route Cache")
+
+	def test_geohash(self):
+		self.assertEqual(geohash(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+	def test_autocomplete_prefix_reuse(self):
+		payload = {"status": "ok", "predictions": [_prediction("Jaipur"), _prediction("Jaipur Airport")]}
+		with patch.object(ola_client, "get_session", return_value=_session(payload)) as get_session:
+			first = ola_map.autocomplete("Jaip", location="26.91,75.78")
+			again = ola_map.autocomplete(" jaip ", location="26.9124,75.7873")
+			narrowed = ola_map.autocomplete("jaipur air", location="26.91,75.78")
+
+		self.assertEqual(get_session().request.call_count, 1)
+		self.assertEqual(first["data"], again["data"])
+		self.assertEqual([p["main_text"] for p in narrowed["data"]], ["Jaipur Airport"])
+
+	def test_full_page_is_not_reused_for_prefixes(self):
+		payload = {"status": "ok", "predictions": [_prediction(f"Jai {i}") for i in range(ola_map.AUTOCOMPLETE_PAGE_SIZE)]}
+		with patch.object(ola_client, "get_session", return_value=_session(payload)) as get_session:
+			ola_map.autocomplete("jai")
+			ola_map.autocomplete("jai 1")
+
+		self.assertEqual(get_session().request.call_count, 2)
+
+	def test_single_flight_waits_for_leader(self):
+		cache = frappe.cache()
+		lock_key = cache.make_key(LOCK_KEY_PREFIX + "test-key")
+		cache.set(lock_key, "other-worker", ex=5)
+		results = iter([None, None, "leader-result"])
+
+		def fetch():
+			raise AssertionError("waiter must not call upstream")
+
+		try:
+			self.assertEqual(single_flight("test-key", fetch, lambda: next(results)), "leader-result")
+			# Background refreshes skip keys another worker is already fetching
+			self.assertIsNone(single_flight("test-key", fetch))
+		finally:
+			cache.delete(lock_key)
+
+		self.assertEqual(single_flight("test-key", lambda: "fetched"), "fetched")
+		self.assertIsNone(cache.get(lock_key))
+
+	def test_circuit_opens_and_serves_stale(self):
+		payload = {"status": "ok", "predictions": [_prediction("Jodhpur")]}
+		with patch.object(ola_client, "get_session", return_value=_session(payload)):
+			ola_map.autocomplete("jodhpur")
+
+		# Expire the entry, then take OLA down
+		ola_map._autocomplete_lru.clear()
+		cache_key = ola_map._autocomplete_cache_key("jodhpur")
+		entry = frappe.cache().get_value(cache_key)
+		entry["fetched_at"] = 0
+		frappe.cache().set_value(cache_key, entry)
+
+		with patch.object(ola_client, "get_session", return_value=_session({}, status_code=503)) as get_session, \
+			patch.object(ola_client, "RETRY_BACKOFF_SEC", 0):
+			for _ in range(ola_client.FAILURE_THRESHOLD):
+				result = ola_map.autocomplete("jodhpur")
+				self.assertEqual(result["data"][0]["main_text"], "Jodhpur")
+				ola_map._autocomplete_lru.clear()
+
+			calls = get_session().request.call_count
+			self.assertEqual(calls, ola_client.FAILURE_THRESHOLD * (ola_client.MAX_RETRIES + 1))
+			self.assertEqual(ola_client.get_breaker("autocomplete").state, "open")
+
+			# Open circuit: no upstream call at all
+			ola_map.autocomplete("jodhpur")
+			self.assertEqual(get_session().request.call_count, calls)
+
+	def test_half_open_trial_always_settles_the_breaker(self):
+		breaker = ola_client.get_breaker("directions")
+
+		def trip():
+			breaker.state, breaker.opened_at = "open", time.monotonic() - ola_client.RESET_TIMEOUT_SEC - 1
+
+		# A metrics (Redis) error does not fail a successful trial call
+		trip()
+		with patch.object(ola_client, "get_session", return_value=_session({"status": "SUCCESS"})), \
+			patch.object(ola_client, "record_latency", side_effect=ConnectionError("redis down")):
+			self.assertEqual(ola_client.ola_request("directions", "POST", "/routing/v1/directions/basic"), {"status": "SUCCESS"})
+		self.assertEqual(breaker.state, "closed")
+
+		# An unexpected error during the trial reopens the circuit instead of leaving it half-open
+		trip()
+		session = MagicMock()
+		session.request.side_effect = RuntimeError("boom")
+		with patch.object(ola_client, "get_session", return_value=session), self.assertRaises(RuntimeError):
+			ola_client.ola_request("directions", "POST", "/routing/v1/directions/basic")
+		self.assertEqual(breaker.state, "open")
+
+	def test_retries_stay_within_the_call_timeout(self):
+		# A read timeout is not retried
+		session = MagicMock()
+		session.request.side_effect = requests.ReadTimeout()
+		with patch.object(ola_client, "get_session", return_value=session), \
+			self.assertRaises(ola_client.OlaMapsUnavailable):
+			ola_client.ola_request("directions", "POST", "/routing/v1/directions/basic", timeout=10)
+		self.assertEqual(session.request.call_count, 1)
+
+		# Connection errors are retried, each attempt getting only what is left of the timeout
+		session = MagicMock()
+		session.request.side_effect = requests.ConnectionError()
+		with patch.object(ola_client, "get_session", return_value=session), \
+			patch.object(ola_client, "RETRY_BACKOFF_SEC", 0), \
+			self.assertRaises(ola_client.OlaMapsUnavailable):
+			ola_client.ola_request("directions", "POST", "/routing/v1/directions/basic", timeout=10)
+		timeouts = [call.kwargs["timeout"] for call in session.request.call_args_list]
+		self.assertEqual(len(timeouts), ola_client.MAX_RETRIES + 1)
+		self.assertLessEqual(timeouts[0], 10)
+		self.assertEqual(timeouts, sorted(timeouts, reverse=True))
+
+	def test_distance_matrix_fetches_only_missing_pairs(self):
+		payload = {"status": "SUCCESS", "routes": [{"legs": [{"distance": 12000, "duration": 1500}]}]}
+		origins = ["26.9124,75.7873", "26.8240,75.8122"]
+		with patch.object(ola_client, "get_session", return_value=_session(payload)) as get_session:
+			ola_map.directions(origins[0], "26.2389,73.0243")
+			# A pickup a few metres away shares the cached route
+			self.assertEqual(ola_map.directions("26.9125,75.7874", "26.2389,73.0243")["data"]["distance_km"], 12.0)
+			self.assertEqual(get_session().request.call_count, 1)
+
+			matrix = ola_map.distance_matrix(origins, ["26.2389,73.0243", "27.0238,74.2179"])
+			self.assertEqual(get_session().request.call_count, 4)
+			self.assertEqual([[cell["status"] for cell in row] for row in matrix["rows"]], [["ok", "ok"], ["ok", "ok"]])
+
+			ola_map.distance_matrix(origins, ["26.2389,73.0243", "27.0238,74.2179"])
+			self.assertEqual(get_session().request.call_count, 4)
+
+	def test_against_local_standin(self):
+		server = ola_standin.serve(port=0)
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+		base_url = patch.object(ola_client, "get_base_url", return_value=f"http://127.0.0.1:{server.server_address[1]}")
+		base_url.start()
+		try:
+			ola_standin.calls.clear()
+			self.assertEqual(ola_map.autocomplete("jodh")["data"][0]["main_text"], "Jodhpur")
+			ola_map.autocomplete("jodhpu")
+			self.assertGreater(ola_map.directions("26.9124,75.7873", "26.2389,73.0243")["data"]["distance_km"], 0)
+			self.assertEqual(ola_standin.calls["/places/v1/autocomplete"], 1)
+			self.assertEqual(ola_standin.calls["/routing/v1/directions/basic"], 1)
+		finally:
+			base_url.stop()
+			server.shutdown()
+
+	def test_routes_without_coordinates_are_never_cached(self):
+		payload = {"status": "SUCCESS", "routes": [{"legs": [{"distance": 12000, "duration": 1500}]}]}
+		with patch.object(ola_client, "get_session", return_value=_session(payload)) as get_session:
+			ola_map.directions("Jaipur", "Jodhpur")
+			ola_map.directions("Ajmer", "Udaipur")
+			matrix = ola_map.distance_matrix(["Jaipur", "26.9124,75.7873"], ["Jodhpur", "95.0,75.0"])
+
+		# Every pair is fetched; none of them share the "-:-" key
+		self.assertEqual(get_session().request.call_count, 6)
+		self.assertEqual([[cell["status"] for cell in row] for row in matrix["rows"]], [["ok", "ok"], ["ok", "ok"]])
+		self.assertFalse(frappe.cache().get_keys(ola_map.DIRECTIONS_CACHE_PREFIX))
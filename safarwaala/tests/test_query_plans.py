@@ -0,0 +1,160 @@
+# Copyright (c) 2026, rahul and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from safarwaala.api import permission
+from safarwaala.api.booking import get_my_bookings, get_my_bookings_page
+from safarwaala.api.dashboard_stats import compute_driver_stats, compute_vendor_stats
+from safarwaala.api.rollup import get_rollup
+from safarwaala.patches.v1_0.add_hot_filter_indexes import execute as add_hot_filter_indexes
+from safarwaala.safarwaala.report.driver_ledger.driver_ledger import get_data as get_driver_ledger
+
+WATCHED_TABLES = (
+	"tabBookings Master",
+	"tabVehicle Expense Log",
+	"tabPayouts",
+	"tabGL Entry",
+	"tabDuty Slips",
+	"tabDriver Payment",
+	"tabTrip Expenses Item",
+	"tabDrivers",
+	"tabVendors",
+	"tabCustomer",
+	"tabCars",
+	"tabBooking Daily Rollup",
+)
+
+VENDOR_USER = "qp-vendor@example.com"
+DRIVER_USER = "qp-driver@example.com"
+CUSTOMER_USER = "qp-customer@example.com"
+
+
+def _seed(doctype, rows, fields):
+	now = frappe.utils.now()
+	base = ["name", "creation", "modified", "owner", "modified_by", "docstatus"]
+	values = [[row[0], now, now, "Administrator", "Administrator", row[1]] + list(row[2:]) for row in rows]
+	frappe.db.bulk_insert(doctype, base + fields, values)
+
+
+class TestQueryPlans(FrappeTestCase):
+	"""EXPLAIN the role-scoped list queries and fail on any full table scan."""
+
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		add_hot_filter_indexes()
+
+		vendors = [f"QP-VEN-{i}" for i in range(50)]
+		drivers = [f"QP-DRI-{i}" for i in range(300)]
+		customers = [f"QP-CUST-{i}" for i in range(300)]
+
+		_seed("Vendors", [(v, 0, v, f"{v.lower()}@example.com") for v in vendors], ["company_name", "linked_user"])
+		_seed("Drivers", [(d, 0, d, vendors[i % 50], f"{d.lower()}@example.com") for i, d in enumerate(drivers)],
+			["name1", "owner_vendor", "linked_user"])
+		_seed("Customer", [(c, 0, c, f"{c.lower()}@example.com") for c in customers], ["name1", "linked_user"])
+		_seed("Cars", [(f"QP-CAR-{i}", 0, vendors[i % 50]) for i in range(300)], ["belongs_to_vendor"])
+		_seed("Bookings Master",
+			[(f"QP-BK-{i}", 0, vendors[i % 50], drivers[i % 300], customers[i % 300], "Confirmed") for i in range(3000)],
+			["assigned_to", "driver", "customer", "booking_status"])
+		_seed("Payouts",
+			[(f"QP-PAY-{i}", 1, "Drivers", drivers[i % 300], f"QP-BK-{i}", "Pending", 100) for i in range(3000)],
+			["payout_to_type", "payout_to", "booking_id", "status", "amount"])
+		_seed("Duty Slips", [(f"QP-DS-{i}", 1, drivers[i % 300], f"QP-BK-{i}") for i in range(3000)], ["driver", "booking_id"])
+		_seed("Driver Payment", [(f"QP-DP-{i}", 1, drivers[i % 300], vendors[i % 50], 50) for i in range(3000)],
+			["driver", "vendor", "amount"])
+
+		cls.vendor, cls.driver, cls.customer = vendors[0], drivers[0], customers[0]
+
+	def setUp(self):
+		frappe.local.safarwaala_principals = {
+			VENDOR_USER: self._principal(VENDOR_USER, ["Vendor"], vendor=self.vendor),
+			DRIVER_USER: self._principal(DRIVER_USER, ["Driver"], driver=self.driver),
+			CUSTOMER_USER: self._principal(CUSTOMER_USER, ["Customer"], customer=self.customer),
+		}
+
+	def tearDown(self):
+		frappe.set_user("Administrator")
+		frappe.local.safarwaala_principals = {}
+
+	def _principal(self, user, roles, vendor=None, driver=None, customer=None):
+		return frappe._dict(user=user, roles=roles, is_admin=False, vendor=vendor, driver=driver, customer=customer)
+
+	def assertNoFullScan(self, query, values=None):
+		for row in frappe.db.sql(f"EXPLAIN {query}", values, as_dict=True):
+			table = row.get("table") or ""
+			if table.startswith("<"):
+				# derived / union result sets
+				continue
+			self.assertNotEqual(row.get("type"), "ALL", f"Full scan on {table}:\n{query}")
+
+	def assertNoFullScanDuring(self, fn, *args, **kwargs):
+		"""Run fn while recording SELECTs on the watched tables, then EXPLAIN each one."""
+		recorded = []
+		sql = frappe.db.sql
+
+		def recording_sql(query, values=(), *a, **kw):
+			result = sql(query, values, *a, **kw)
+			text = str(query)
+			if text.lstrip().lower().startswith("select") and any(t in text for t in WATCHED_TABLES):
+				recorded.append((text, values))
+			return result
+
+		frappe.db.sql = recording_sql
+		try:
+			fn(*args, **kwargs)
+		finally:
+			frappe.db.sql = sql
+
+		self.assertTrue(recorded, f"{fn.__name__} issued no watched queries")
+		for query, values in recorded:
+			self.assertNoFullScan(query, values or None)
+
+	def test_permission_conditions(self):
+		checks = [
+			("Bookings Master", permission.get_bookings_master_condition),
+			("Duty Slips", permission.get_duty_slip_condition),
+			("Drivers", permission.get_driver_condition),
+			("Driver Payment", permission.get_driver_payment_condition),
+			("Customer", permission.get_linked_user_condition),
+		]
+		for user in (VENDOR_USER, DRIVER_USER, CUSTOMER_USER):
+			for doctype, get_condition in checks:
+				condition = get_condition(user)
+				if not condition or condition == "1=0":
+					continue
+				self.assertNoFullScan(f"SELECT `name` FROM `tab{doctype}` WHERE {condition}")
+
+	def test_get_my_bookings(self):
+		for user in (VENDOR_USER, DRIVER_USER, CUSTOMER_USER):
+			frappe.set_user(user)
+			self.assertNoFullScanDuring(get_my_bookings)
+
+	def test_get_my_bookings_page(self):
+		frappe.set_user(VENDOR_USER)
+		first = get_my_bookings_page(page_length=10)
+		self.assertNoFullScanDuring(get_my_bookings_page, page_length=10, cursor=first["next_cursor"])
+
+		# Walking every page returns each booking exactly once
+		seen, cursor = [], None
+		while True:
+			page = get_my_bookings_page(page_length=25, cursor=cursor, fields=["booking_status"])
+			seen.extend(row.name for row in page["data"])
+			cursor = page["next_cursor"]
+			if not cursor:
+				break
+		self.assertEqual(len(seen), len(set(seen)))
+		self.assertEqual(len(seen), frappe.db.count("Bookings Master", {"assigned_to": self.vendor}))
+
+	def test_dashboard_stats(self):
+		# get_dashboard_stats serves cached snapshots; these are the queries that build them
+		self.assertNoFullScanDuring(compute_vendor_stats, self.vendor)
+		self.assertNoFullScanDuring(compute_driver_stats, self.driver)
+
+	def test_driver_ledger(self):
+		self.assertNoFullScanDuring(get_driver_ledger, frappe._dict({"driver": self.driver}))
+
+	def test_booking_rollup(self):
+		frappe.set_user(VENDOR_USER)
+		self.assertNoFullScanDuring(get_rollup, "trips", group_by="driver", granularity="week")
@@ -5,3 +5,46 @@ def check_gl_entries():
     print(f"Total GL Entries: {len(entries)}")
     for entry in entries:
         print(entry)
+
+def bulk_insert_docs(docs):
+    """
+    Insert unsaved documents (and their child rows) with one multi-row INSERT per doctype.
+    Names, defaults and standard fields are set here; controller insert hooks do not run,
+    so only use this for doctypes without before/after insert or validate logic.
+    """
+    if not docs:
+        return docs
+
+    now = frappe.utils.now()
+    user = frappe.session.user
+    rows_by_doctype = {}
+
+    for doc in docs:
+        doc._set_defaults()
+        doc.set_new_name()
+        doc.set_parent_in_children()
+
+        for d in [doc] + doc.get_all_children():
+            d.creation = d.modified = now
+            d.owner = d.modified_by = user
+            d.docstatus = 0
+            rows_by_doctype.setdefault(d.doctype, []).append(d.get_valid_dict(convert_dates_to_str=True, ignore_nulls=False))
+
+    for doctype, rows in rows_by_doctype.items():
+        fields = list(rows[0].keys())
+        frappe.db.bulk_insert(doctype, fields, [[row.get(f) for f in fields] for row in rows])
+
+    return docs
+
+def run_in_site_context(site, sites_path, fn, *args, connect=False, **kwargs):
+    """
+    Run fn in a worker thread with its own frappe.local for `site`.
+    frappe.local is thread-local, so threads start without a site, conf or DB connection.
+    """
+    frappe.init(site=site, sites_path=sites_path)
+    try:
+        if connect:
+            frappe.connect()
+        return fn(*args, **kwargs)
+    finally:
+        frappe.destroy()